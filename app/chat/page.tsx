@@ -30,6 +30,42 @@ interface Message {
   tokens_used?: number;
 }
 
+// Read the Server-Sent Events sent by /chat/stream. Calls onToken for each
+// generated piece and resolves with the final "done" payload (same shape as
+// the /chat response), or { error } if generation failed mid-stream.
+async function readChatStream(res: Response, onToken: (token: string) => void): Promise<any> {
+  const reader = res.body!.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let result: any = null;
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      let data = "";
+      for (const line of rawEvent.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      if (!data) continue;
+
+      const payload = JSON.parse(data);
+      if (event === "token") onToken(payload.content);
+      else if (event === "done") result = payload;
+      else if (event === "error") return { error: payload };
+    }
+  }
+  return result;
+}
+
 export default function ChatPage() {
   const [messages, setMessages] = useState<Message[]>([
     { role: "assistant", content: "Hi there! 😊 I'm Mentor, your friendly AI teacher here to help with anything you need. Whether it's studies, coding, or just a chat - I'm here for you! How can I support you today?" },
@@ -41,6 +77,8 @@ export default function ChatPage() {
   const [authMode, setAuthMode] = useState<"login" | "register">("login");
   const [taskType, setTaskType] = useState("general");
   const [conversations, setConversations] = useState<any[]>([]);
+  const [conversationsCursor, setConversationsCursor] = useState<string | null>(null);
+  const [olderMessagesCursor, setOlderMessagesCursor] = useState<string | null>(null);
   const [currentConversationId, setCurrentConversationId] = useState<number | null>(null);
   const [showFileUpload, setShowFileUpload] = useState(false);
   const [isListening, setIsListening] = useState(false);
@@ -110,22 +148,24 @@ export default function ChatPage() {
     }
   };
 
-  // Load conversations for authenticated user
-  const loadConversations = async (token: string) => {
+  // Load conversations for authenticated user (first page, or the next one after cursor)
+  const loadConversations = async (token: string, cursor: string | null = null) => {
     try {
-      const response = await fetch(`${BACKEND_URL}/conversations`, {
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+      const response = await fetch(`${BACKEND_URL}/conversations${query}`, {
         headers: { "Authorization": `Bearer ${token}` }
       });
       if (response.ok) {
         const data = await response.json();
-        setConversations(data.conversations);
+        setConversations((convs) => cursor ? [...convs, ...data.conversations] : data.conversations);
+        setConversationsCursor(data.next_cursor);
       }
     } catch (error) {
       console.error("Failed to load conversations:", error);
     }
   };
 
-  // Load messages from a conversation
+  // Load the latest messages of a conversation
   const loadConversation = async (conversationId: number) => {
     const token = localStorage.getItem("token");
     if (!token) return;
@@ -137,6 +177,7 @@ export default function ChatPage() {
       if (response.ok) {
         const data = await response.json();
         setMessages(data.messages);
+        setOlderMessagesCursor(data.older_cursor);
         setCurrentConversationId(conversationId);
       }
     } catch (error) {
@@ -144,12 +185,33 @@ export default function ChatPage() {
     }
   };
 
+  // Prepend the page of messages before the oldest one shown
+  const loadOlderMessages = async () => {
+    const token = localStorage.getItem("token");
+    if (!token || !currentConversationId || !olderMessagesCursor) return;
+
+    try {
+      const response = await fetch(
+        `${BACKEND_URL}/conversations/${currentConversationId}/messages?before=${encodeURIComponent(olderMessagesCursor)}`,
+        { headers: { "Authorization": `Bearer ${token}` } }
+      );
+      if (response.ok) {
+        const data = await response.json();
+        setMessages((msgs) => [...data.messages, ...msgs]);
+        setOlderMessagesCursor(data.older_cursor);
+      }
+    } catch (error) {
+      console.error("Failed to load older messages:", error);
+    }
+  };
+
   // Start new conversation
   const startNewConversation = () => {
     setMessages([
       { role: "assistant", content: "Hi there! 😊 I'm Mentor, your friendly AI teacher here to help with anything you need. Whether it's studies, coding, or just a chat - I'm here for you! How can I support you today?" }
     ]);
     setCurrentConversationId(null);
+    setOlderMessagesCursor(null);
   };
 
   // Handle file analysis results
@@ -259,6 +321,7 @@ export default function ChatPage() {
     localStorage.removeItem("token");
     setUser(null);
     setMessages([{ role: "assistant", content: "Hey! 👋 How can I help you today?" }]);
+    setOlderMessagesCursor(null);
     showInfo("Logged out successfully. See you soon! 👋");
   };
 
@@ -281,7 +344,7 @@ export default function ChatPage() {
       const headers: any = { "Content-Type": "application/json" };
       if (token) headers.Authorization = `Bearer ${token}`;
 
-      const res = await fetch(`${BACKEND_URL}/chat`, {
+      const res = await fetch(`${BACKEND_URL}/chat/stream`, {
         method: "POST",
         headers,
         body: JSON.stringify({
@@ -320,7 +383,29 @@ export default function ChatPage() {
         return;
       }
 
-      const data = await res.json();
+      // Show tokens as they arrive instead of waiting for the whole answer
+      let streamed = "";
+      let started = false;
+      const data = await readChatStream(res, (token) => {
+        streamed += token;
+        const content = streamed;
+        if (!started) {
+          started = true;
+          setLoading(false);
+          setMessages((msgs) => [...msgs, { role: "assistant", content }]);
+        } else {
+          setMessages((msgs) => [...msgs.slice(0, -1), { role: "assistant", content }]);
+        }
+      });
+
+      if (!data || data.error) {
+        const errorMessage = data?.error?.detail || "AI service temporarily unavailable.";
+        setMessages((msgs) => started
+          ? [...msgs.slice(0, -1), { role: "assistant", content: `${streamed}\n\n${errorMessage}` }]
+          : [...msgs, { role: "assistant", content: errorMessage }]);
+        return;
+      }
+
       const botReply = data.answer || "Sorry, I couldn't get a response.";
 
       const assistantMessage: Message = {
@@ -328,7 +413,7 @@ export default function ChatPage() {
         content: botReply
       };
 
-      setMessages((msgs) => [...msgs, assistantMessage]);
+      setMessages((msgs) => started ? [...msgs.slice(0, -1), assistantMessage] : [...msgs, assistantMessage]);
 
       // Auto-speak AI response if speech is enabled
       setTimeout(() => {
@@ -404,7 +489,19 @@ export default function ChatPage() {
                   <MessageSquare size={16} />
                   <span className="chat-title">{conv.title}</span>
                 </div>
-              ))
+              )).concat(conversationsCursor ? [
+                <div
+                  key="load-more"
+                  className="chat-item"
+                  onClick={() => {
+                    const token = localStorage.getItem("token");
+                    if (token) loadConversations(token, conversationsCursor);
+                  }}
+                >
+                  <MessageSquare size={16} />
+                  <span className="chat-title">Load more…</span>
+                </div>
+              ] : [])
             ) : (
               <div className="chat-item">
                 <MessageSquare size={16} />
@@ -493,6 +590,11 @@ export default function ChatPage() {
 
         {/* Messages */}
         <div className="messages-container">
+          {olderMessagesCursor && (
+            <button type="button" className="load-older-btn" onClick={loadOlderMessages}>
+              Load earlier messages
+            </button>
+          )}
           {messages.map((msg, i) => (
             <div key={i} className={`message ${msg.role}`}>
               <div className="message-avatar">
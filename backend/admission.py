@@ -0,0 +1,203 @@
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+# Priorities (lower is served first)
+PRIORITY_USER_CHAT = 0
+PRIORITY_GUEST_CHAT = 1
+PRIORITY_USER_FILE = 2
+PRIORITY_GUEST_FILE = 3
+PRIORITY_BACKGROUND = 4  # housekeeping such as history summaries
+
+DEFAULT_SERVICE_TIME = 20.0  # seconds per generation until we have measurements
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    """The request was turned away instead of queued; retry_after is in seconds"""
+
+    def __init__(self, reason: str, retry_after: int, status_code: int = 503):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class Ticket:
+    """A granted generation slot; hand it back with AdmissionController.release"""
+
+    def __init__(self, model: str, owner: Optional[str]):
+        self.model = model
+        self.owner = owner
+        self.granted_at = time.perf_counter()
+        self.released = False
+
+
+class _ModelGate:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self.service_time = DEFAULT_SERVICE_TIME
+        self.admitted = 0
+        self.rejected = 0
+
+    def expected_wait(self, priority: int) -> float:
+        if self.active < self.limit and not self.waiting:
+            return 0.0
+        ahead = sum(1 for p, _, fut in self.waiting if p <= priority and not fut.done())
+        return (ahead + 1) * self.service_time / self.limit
+
+
+class AdmissionController:
+    """Per-model concurrency limit with a bounded priority wait queue.
+
+    Requests beyond a model's concurrency wait in priority order. When the
+    queue is full, or the estimated wait is longer than max_wait, they are
+    rejected immediately so the caller can answer 503 + Retry-After instead
+    of timing out. Each authenticated user gets one generation at a time.
+    """
+
+    def __init__(self, limits: Dict[str, int], default_limit: int = 1,
+                 queue_size: int = 16, max_wait: float = 45):
+        self.limits = limits
+        self.default_limit = default_limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.gates: Dict[str, _ModelGate] = {}
+        self.owners = set()
+        self._seq = itertools.count()
+
+    def _gate(self, model: str) -> _ModelGate:
+        gate = self.gates.get(model)
+        if gate is None:
+            gate = self.gates[model] = _ModelGate(self.limits.get(model, self.default_limit))
+        return gate
+
+    def limit_for(self, model: str) -> int:
+        return self._gate(model).limit
+
+    def resize(self, limits: Dict[str, int], default_limit: int):
+        """Change the concurrency limits while running.
+
+        A larger limit admits waiting requests at once; with a smaller one,
+        generations already running finish and their slots are not handed on
+        until the model is back under its limit.
+        """
+        self.limits = limits
+        self.default_limit = default_limit
+        for model, gate in self.gates.items():
+            gate.limit = limits.get(model, default_limit)
+            while gate.active < gate.limit and gate.waiting:
+                _, _, future = heapq.heappop(gate.waiting)
+                if not future.done():
+                    gate.active += 1
+                    future.set_result(True)
+
+    def check(self, model: str, priority: int, owner: Optional[str] = None):
+        """Raise AdmissionRejected if acquire() would be refused right now"""
+        gate = self._gate(model)
+        if owner is not None and owner in self.owners:
+            raise self._busy_owner(gate)
+        if gate.active < gate.limit and not gate.waiting:
+            return
+        expected = gate.expected_wait(priority)
+        if len(gate.waiting) >= self.queue_size or expected > self.max_wait:
+            gate.rejected += 1
+            raise AdmissionRejected(
+                "AI service is busy. Please try again shortly.",
+                retry_after=max(1, math.ceil(min(expected, self.max_wait)))
+            )
+
+    @staticmethod
+    def _busy_owner(gate: _ModelGate) -> AdmissionRejected:
+        return AdmissionRejected(
+            "You already have a response in progress. Please wait for it to finish.",
+            retry_after=max(1, math.ceil(gate.service_time)), status_code=429
+        )
+
+    def hold_owner(self, model: str, owner: str):
+        """Claim owner's one-at-a-time slot for work spanning several generations.
+
+        Raises AdmissionRejected (429) if owner already has something running.
+        The generations themselves are then acquired without an owner; hand
+        the slot back with release_owner().
+        """
+        if owner in self.owners:
+            raise self._busy_owner(self._gate(model))
+        self.owners.add(owner)
+
+    def release_owner(self, owner: str):
+        self.owners.discard(owner)
+
+    async def acquire(self, model: str, priority: int, owner: Optional[str] = None) -> Ticket:
+        self.check(model, priority, owner)
+        gate = self._gate(model)
+        if owner is not None:
+            self.owners.add(owner)
+
+        if gate.active < gate.limit and not gate.waiting:
+            gate.active += 1
+        else:
+            future = asyncio.get_event_loop().create_future()
+            entry = (priority, next(self._seq), future)
+            heapq.heappush(gate.waiting, entry)
+            try:
+                # release() hands the slot over (active already counted) on wake-up
+                await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if future.done() and not future.cancelled():
+                    # Granted at the last moment: give the slot straight back.
+                    self._release_slot(gate, model)
+                else:
+                    future.cancel()
+                    gate.waiting.remove(entry)
+                    heapq.heapify(gate.waiting)
+                if owner is not None:
+                    self.owners.discard(owner)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                gate.rejected += 1
+                raise AdmissionRejected("AI service is busy. Please try again shortly.",
+                                        retry_after=max(1, math.ceil(gate.service_time)))
+
+        gate.admitted += 1
+        return Ticket(model, owner)
+
+    def release(self, ticket: Ticket):
+        if ticket.released:
+            return
+        ticket.released = True
+        gate = self._gate(ticket.model)
+        held = time.perf_counter() - ticket.granted_at
+        gate.service_time += SERVICE_TIME_SMOOTHING * (held - gate.service_time)
+        if ticket.owner is not None:
+            self.owners.discard(ticket.owner)
+        self._release_slot(gate, ticket.model)
+
+    def _release_slot(self, gate: _ModelGate, model: str):
+        if gate.active > gate.limit:
+            gate.active -= 1  # the limit was lowered: retire the slot
+            return
+        while gate.waiting:
+            _, _, future = heapq.heappop(gate.waiting)
+            if not future.done():
+                future.set_result(True)  # slot passes to the waiter
+                return
+        gate.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            model: {
+                "limit": gate.limit,
+                "active": gate.active,
+                "waiting": len(gate.waiting),
+                "avg_service_seconds": round(gate.service_time, 2),
+                "admitted": gate.admitted,
+                "rejected": gate.rejected,
+            }
+            for model, gate in self.gates.items()
+        }
@@ -0,0 +1,182 @@
+"""Before/after benchmark for the SQLite connection layer (db.py).
+
+Runs the database side of concurrent /chat and /conversations requests
+through main.py's own helpers, twice on a freshly seeded database:
+
+- legacy: a new connection for every helper call, rollback journal,
+  synchronous=FULL (what plain sqlite3.connect gave us)
+- pooled: reused connections and compiled statements, WAL, synchronous=NORMAL
+
+    python bench_db.py --stub-encoder --threads 16 --duration 10
+
+A /chat does: the quota check (a read only the first time a user is seen),
+a new conversation one time in five, the queued user and assistant
+messages, then the in-memory charge; charges are flushed to the users
+table every few hundred requests. A /conversations reads
+the first page of the conversation list and one conversation's latest
+messages (both first wait for that user's or conversation's queued writes,
+as the endpoints do).
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+USERS = 50
+SEED_CONVERSATIONS = 20   # per user
+SEED_MESSAGES = 10        # per conversation
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def seed(main, users: int):
+    conn = main.db_pool.connect()
+    cursor = conn.cursor()
+    user_ids = []
+    for u in range(users):
+        cursor.execute('INSERT INTO users (email, username, password_hash) VALUES (?, ?, ?)',
+                       (f"bench{u}@srmap.edu.in", f"bench{u}", "x"))
+        user_ids.append(cursor.lastrowid)
+    for user_id in user_ids:
+        for c in range(SEED_CONVERSATIONS):
+            cursor.execute('INSERT INTO conversations (user_id, title) VALUES (?, ?)', (user_id, f"Chat {c}"))
+            conversation_id = cursor.lastrowid
+            cursor.executemany(main.MESSAGE_INSERT_SQL, [
+                main.message_params(conversation_id, "user" if m % 2 == 0 else "assistant",
+                                    "seeded message " * 20, 30, None)
+                for m in range(SEED_MESSAGES)
+            ])
+    conn.commit()
+    conn.close()
+    return user_ids
+
+
+def chat_request(main, user_id: int, conversations: Dict[int, List[int]], rng: random.Random):
+    if not main.quota.is_loaded(user_id):
+        main.quota.load(user_id, *main.read_user_quota(user_id))
+    reservation = main.quota.reserve(user_id, 60, main.TOKEN_LIMITS["user"])
+    if not conversations[user_id] or rng.random() < 0.2:
+        conversations[user_id].append(main.create_conversation(user_id, "Bench chat"))
+    conversation_id = rng.choice(conversations[user_id])
+    main.queue_message(conversation_id, "user", "How do I register for next semester's courses?", 0,
+                       user_id=user_id)
+    main.queue_message(conversation_id, "assistant", "Registration opens on the student portal. " * 10, 60,
+                       {"model": "gemma2:2b", "prompt_tokens": 400, "completion_tokens": 60}, user_id=user_id)
+    main.quota.settle(reservation, 60)
+    if rng.random() < 0.005:
+        main.quota.flush()
+
+
+def conversations_request(main, user_id: int, conversations: Dict[int, List[int]], rng: random.Random):
+    listed, _ = main.get_user_conversations(user_id)
+    if listed:
+        main.get_conversation_messages(rng.choice(listed)["id"], user_id)
+
+
+def run_mode(main, mode: str, threads: int, duration: float, read_ratio: float) -> dict:
+    from db import ConnectionPool, LEGACY_PRAGMAS
+    from write_behind import WriteBehindQueue
+    from quota import QuotaAccountant
+
+    path = os.path.join(tempfile.mkdtemp(prefix=f"bench-db-{mode}-"), "chatbot.db")
+    if mode == "legacy":
+        pool = ConnectionPool(path, pool_size=0, pragmas=LEGACY_PRAGMAS)
+    else:
+        pool = ConnectionPool(path)
+    main.db_pool = pool
+    main.persistence = WriteBehindQueue(pool.open, touch_sql=main.CONVERSATION_TOUCH_SQL)
+    main.quota = QuotaAccountant(main.write_token_usage)
+    main.init_database()
+    user_ids = seed(main, USERS)
+
+    conversations: Dict[int, List[int]] = defaultdict(list)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(number: int):
+        rng = random.Random(number)
+        while time.perf_counter() < deadline:
+            user_id = rng.choice(user_ids)
+            if rng.random() < read_ratio:
+                name, request = "/conversations", conversations_request
+            else:
+                name, request = "/chat", chat_request
+            start = time.perf_counter()
+            try:
+                request(main, user_id, conversations, rng)
+            except sqlite3.Error as e:
+                with lock:
+                    errors[f"{name}: {e}"] += 1
+                continue
+            with lock:
+                latencies[name].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    main.quota.flush()
+    main.persistence.close()
+    wall = time.perf_counter() - start
+    pool.close()
+
+    results = {}
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        results[name] = {
+            "ops_per_sec": round(len(values) / wall, 1),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+        }
+    return {"endpoints": results, "errors": dict(errors)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Legacy vs pooled SQLite connections under concurrent load")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per mode")
+    parser.add_argument("--read-ratio", type=float, default=0.5, help="share of /conversations requests")
+    parser.add_argument("--stub-encoder", action="store_true", help="don't load the real embedding model")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    if args.stub_encoder:
+        from microbench import install_stub_encoder
+        install_stub_encoder()
+    os.chdir(tempfile.mkdtemp(prefix="bench-db-"))  # main.py creates chatbot.db in the cwd on import
+    import main as app
+
+    report = {mode: run_mode(app, mode, args.threads, args.duration, args.read_ratio)
+              for mode in ("legacy", "pooled")}
+
+    print(f"\n{'mode':<8}{'endpoint':<16}{'ops/sec':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for mode, result in report.items():
+        for endpoint, r in result["endpoints"].items():
+            print(f"{mode:<8}{endpoint:<16}{r['ops_per_sec']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+        for error, count in result["errors"].items():
+            print(f"{mode:<8}[ERROR] {count} x {error}")
+    for endpoint, after in report["pooled"]["endpoints"].items():
+        before = report["legacy"]["endpoints"].get(endpoint)
+        if before and before["ops_per_sec"]:
+            print(f"[INFO] {endpoint}: {after['ops_per_sec'] / before['ops_per_sec']:.2f}x throughput, "
+                  f"p95 {before['p95_ms']} -> {after['p95_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
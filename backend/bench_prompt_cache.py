@@ -0,0 +1,113 @@
+"""Prompt-cache benchmark: context-in-system-prompt vs. context-last.
+
+Plays the same multi-turn conversation against a live Ollama twice, once with
+the old layout (retrieval context appended to the system prompt) and once with
+the prefix-stable layout from prompts.py, and prints Ollama's own
+prompt_eval_count / prompt_eval_duration for every turn.
+
+    python bench_prompt_cache.py                      # gemma2:2b, 6 turns
+    python bench_prompt_cache.py --model phi3.5:3.8b --turns 8
+"""
+import time
+import asyncio
+import argparse
+from typing import List
+from ollama_client import OllamaClient
+from prompts import MENTOR_SYSTEM_PROMPT, build_chat_messages
+
+OLLAMA_BASE_URL = "http://localhost:11434"
+ANSWER_TOKENS = 64  # short answers keep the run quick; only prompt eval is measured
+
+QUESTIONS = [
+    "What B.Tech programs does SRM University AP offer?",
+    "How do I apply for admission there?",
+    "What are the hostel facilities like?",
+    "Are there scholarships for merit students?",
+    "Tell me about the research centres on campus.",
+    "What clubs can I join in my first year?",
+    "How are placements for computer science?",
+    "What is the fee structure for engineering?",
+]
+
+CONTEXTS = [
+    "SRM University AP offers B.Tech in CSE, ECE, EEE, Mechanical and Civil Engineering, "
+    "with specialisations in AI/ML, data science and cybersecurity.",
+    "Admissions are through SRMJEEE, JEE Main or SAT scores. Applications open in November "
+    "and close in April; counselling follows the entrance results.",
+    "The residential campus has separate hostels for men and women with AC and non-AC rooms, "
+    "a central dining hall, Wi-Fi and 24x7 security.",
+    "Merit scholarships cover up to 100% of tuition for top SRMJEEE rankers and board toppers, "
+    "renewed yearly on academic performance.",
+    "Research centres include the Centre for Advanced Materials, the Neuroscience lab and the "
+    "Centre for Generative AI, open to undergraduates through UROP.",
+    "Student clubs span coding, robotics, music, dance, debate, entrepreneurship and sports, "
+    "with a clubs fair in the first month of term.",
+    "Placement drives see product companies, consultancies and core engineering firms; the "
+    "career centre runs mock interviews from the third year.",
+    "Engineering tuition is charged per year with separate hostel and mess fees; the fee "
+    "schedule is published on the admissions portal each year.",
+]
+
+
+def legacy_messages(history: List[dict], context: str) -> List[dict]:
+    """The layout chat used before: context appended to the system prompt"""
+    system_prompt = MENTOR_SYSTEM_PROMPT
+    if context:
+        system_prompt += f"\n\nContext:\n{context}"
+    return [{"role": "system", "content": system_prompt}, *history]
+
+
+async def run_layout(client: OllamaClient, model: str, layout: str, turns: int) -> List[dict]:
+    build = legacy_messages if layout == "legacy" else build_chat_messages
+    options = {"num_ctx": 4096, "num_predict": ANSWER_TOKENS, "temperature": 0, "seed": 1}
+
+    # Evict whatever prefix is cached from a previous run.
+    await client.chat(model, [{"role": "user", "content": f"Say OK. ({time.time()})"}],
+                      options={"num_predict": 1})
+
+    history = []
+    results = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": QUESTIONS[turn % len(QUESTIONS)]})
+        data = await client.chat(model, build(history, CONTEXTS[turn % len(CONTEXTS)]), options=options)
+        history.append({"role": "assistant", "content": data["message"]["content"]})
+        results.append({
+            "turn": turn + 1,
+            "prompt_eval_count": data.get("prompt_eval_count", 0),
+            "prompt_eval_ms": data.get("prompt_eval_duration", 0) / 1e6,
+        })
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Measure prompt-eval time per turn for both prompt layouts")
+    parser.add_argument("--model", default="gemma2:2b")
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--url", default=OLLAMA_BASE_URL)
+    args = parser.parse_args()
+
+    client = OllamaClient(args.url)
+    try:
+        print(f"[INFO] Warming {args.model}...")
+        await client.chat(args.model, [], total_timeout=300, first_byte_timeout=300)
+        legacy = await run_layout(client, args.model, "legacy", args.turns)
+        stable = await run_layout(client, args.model, "prefix", args.turns)
+    finally:
+        await client.close()
+
+    print(f"\n{'turn':>4}  {'legacy tokens':>13} {'legacy ms':>10}  {'prefix tokens':>13} {'prefix ms':>10}  {'saved ms':>9}")
+    for old, new in zip(legacy, stable):
+        print(f"{old['turn']:>4}  {old['prompt_eval_count']:>13} {old['prompt_eval_ms']:>10.1f}  "
+              f"{new['prompt_eval_count']:>13} {new['prompt_eval_ms']:>10.1f}  "
+              f"{old['prompt_eval_ms'] - new['prompt_eval_ms']:>9.1f}")
+
+    # Turn 1 has nothing cached under either layout; compare the follow-ups.
+    followups = list(zip(legacy, stable))[1:]
+    if followups:
+        saved = sum(o["prompt_eval_ms"] - n["prompt_eval_ms"] for o, n in followups) / len(followups)
+        tokens = sum(o["prompt_eval_count"] - n["prompt_eval_count"] for o, n in followups) / len(followups)
+        print(f"\nAverage per follow-up turn: {saved:.1f} ms and {tokens:.0f} prompt tokens not re-evaluated")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+import time
+from collections import deque
+from typing import Dict, Optional
+
+# Defaults (seconds unless noted)
+WINDOW = 120               # outcomes older than this are forgotten
+MIN_REQUESTS = 5           # don't judge a model on fewer outcomes than this
+MAX_ERROR_RATE = 0.5
+DEFAULT_P95_LIMIT = 30.0   # first-token latency
+OPEN_SECONDS = 30          # how long an open circuit waits before probing
+PROBE_TIMEOUT = 120        # a probe that never reported back is abandoned
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Trips when a model's error rate or p95 first-token latency gets too high.
+
+    Open: requests should go elsewhere. After open_seconds one probe request
+    is let through (half-open); its outcome closes or re-opens the circuit.
+    A probe that ends without an outcome must hand the probe back with
+    release_probe(), or the next one waits PROBE_TIMEOUT.
+    """
+
+    def __init__(self, p95_limit: float = DEFAULT_P95_LIMIT, window: float = WINDOW,
+                 min_requests: int = MIN_REQUESTS, max_error_rate: float = MAX_ERROR_RATE,
+                 open_seconds: float = OPEN_SECONDS):
+        self.p95_limit = p95_limit
+        self.window = window
+        self.min_requests = min_requests
+        self.max_error_rate = max_error_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.outcomes = deque()  # (timestamp, ok, first-token latency)
+        self.opened_at: Optional[float] = None
+        self.probe_started: Optional[float] = None
+        self.reason: Optional[str] = None
+        self.trips = 0
+
+    def _prune(self, now: float):
+        while self.outcomes and now - self.outcomes[0][0] > self.window:
+            self.outcomes.popleft()
+
+    def _advance(self, now: float):
+        """Open circuits become half-open (ready for a probe) after open_seconds"""
+        if self.state == OPEN and now - self.opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self.probe_started = None
+
+    def allow(self) -> bool:
+        """May a request use this model now? In half-open state this claims the probe."""
+        now = time.time()
+        self._advance(now)
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return False
+        if self.probe_started is not None and now - self.probe_started < PROBE_TIMEOUT:
+            return False  # a probe is already out
+        self.probe_started = now
+        return True
+
+    def release_probe(self):
+        """The probe ended without a verdict (refused, cancelled): let another request probe"""
+        if self.state == HALF_OPEN:
+            self.probe_started = None
+
+    def record(self, ok: bool, latency: Optional[float] = None):
+        now = time.time()
+        if self.state == HALF_OPEN:
+            if ok and (latency is None or latency <= self.p95_limit):
+                self.state = CLOSED
+                self.outcomes.clear()
+                self.reason = None
+            else:
+                self._trip(now, "probe failed" if not ok else f"probe took {latency:.1f}s")
+            self.probe_started = None
+            return
+
+        self.outcomes.append((now, ok, latency))
+        self._prune(now)
+        if self.state != CLOSED or len(self.outcomes) < self.min_requests:
+            return
+        error_rate = self.error_rate()
+        p95 = self.p95()
+        if error_rate > self.max_error_rate:
+            self._trip(now, f"error rate {error_rate:.0%}")
+        elif p95 is not None and p95 > self.p95_limit:
+            self._trip(now, f"p95 first token {p95:.1f}s")
+
+    def _trip(self, now: float, reason: str):
+        self.state = OPEN
+        self.opened_at = now
+        self.reason = reason
+        self.trips += 1
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for _, ok, _ in self.outcomes if not ok) / len(self.outcomes)
+
+    def p95(self) -> Optional[float]:
+        latencies = sorted(lat for _, ok, lat in self.outcomes if ok and lat is not None)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        self._advance(now)
+        self._prune(now)
+        p95 = self.p95()
+        return {
+            "state": self.state,
+            "reason": self.reason,
+            "requests_in_window": len(self.outcomes),
+            "error_rate": round(self.error_rate(), 3),
+            "p95_first_token": round(p95, 2) if p95 is not None else None,
+            "p95_limit": self.p95_limit,
+            "trips": self.trips,
+        }
+
+
+class CircuitBreakers:
+    """One breaker per Ollama model"""
+
+    def __init__(self, p95_limits: Dict[str, float], default_p95_limit: float = DEFAULT_P95_LIMIT):
+        self.p95_limits = p95_limits
+        self.default_p95_limit = default_p95_limit
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, model: str) -> CircuitBreaker:
+        breaker = self.breakers.get(model)
+        if breaker is None:
+            breaker = self.breakers[model] = CircuitBreaker(self.p95_limits.get(model, self.default_p95_limit))
+        return breaker
+
+    def allow(self, model: str) -> bool:
+        return self.get(model).allow()
+
+    def probing(self, model: str) -> bool:
+        """After allow() returned True: is this request the half-open probe?"""
+        return self.get(model).state == HALF_OPEN
+
+    def release_probe(self, model: str):
+        self.get(model).release_probe()
+
+    def record(self, model: str, ok: bool, latency: Optional[float] = None):
+        breaker = self.get(model)
+        was = breaker.state
+        breaker.record(ok, latency)
+        if breaker.state == OPEN and was != OPEN:
+            print(f"[WARNING] Circuit opened for {model}: {breaker.reason}")
+        elif breaker.state == CLOSED and was != CLOSED:
+            print(f"[INFO] Circuit closed for {model} after a successful probe")
+
+    def stats(self) -> dict:
+        return {model: breaker.snapshot() for model, breaker in self.breakers.items()}
@@ -0,0 +1,189 @@
+import asyncio
+import sqlite3
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence
+from write_behind import WriteBehindQueue
+
+POOL_SIZE = 16                  # idle connections kept open for reuse
+BUSY_TIMEOUT = 5.0              # seconds a connection waits on a locked database
+CACHE_SIZE_KB = 16 * 1024       # page cache per connection
+MMAP_SIZE = 128 * 1024 * 1024   # bytes of the database file mapped into memory
+CACHED_STATEMENTS = 256         # compiled statements kept per connection
+READ_THREADS = 8                # concurrent read queries at most
+
+# WAL lets readers run alongside the writer; with synchronous=NORMAL a commit
+# appends to the WAL without an fsync (the WAL is synced at checkpoints).
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA cache_size=-{CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size={MMAP_SIZE}",
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}",
+)
+# What a bare sqlite3.connect() gives you; used for before/after comparisons.
+LEGACY_PRAGMAS = ("PRAGMA journal_mode=DELETE", "PRAGMA synchronous=FULL")
+
+
+class PooledConnection:
+    """A pooled sqlite3 connection; close() hands it back to the pool instead of closing it"""
+
+    def __init__(self, pool: "ConnectionPool", conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    def __del__(self):
+        # A helper that raised before close() still returns its connection.
+        if getattr(self, "_conn", None) is not None:
+            self.close()
+
+
+class ConnectionPool:
+    """Reuses SQLite connections opened with the tuned pragmas.
+
+    connect() returns an idle connection (or opens one); close() on it
+    rolls back anything left uncommitted and returns it. Connections are
+    shared between threads, but only one thread holds a connection at a
+    time. The pool never blocks: nested helpers each get their own
+    connection, and at most pool_size idle ones are kept.
+    """
+
+    def __init__(self, path: str, pool_size: int = POOL_SIZE, pragmas: Sequence[str] = PRAGMAS):
+        self.path = path
+        self.pool_size = pool_size
+        self.pragmas = tuple(pragmas)
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.RLock()
+        self.opened = 0
+        self.reused = 0
+        self.in_use = 0
+
+    def open(self) -> sqlite3.Connection:
+        """A new, unpooled connection with the pool's pragmas (for long-lived owners like writer threads)"""
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                               cached_statements=CACHED_STATEMENTS)
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def connect(self) -> PooledConnection:
+        conn: Optional[sqlite3.Connection] = None
+        with self._lock:
+            if self._idle:
+                conn = self._idle.pop()
+                self.reused += 1
+            self.in_use += 1
+        if conn is None:
+            try:
+                conn = self.open()
+            except Exception:
+                with self._lock:
+                    self.in_use -= 1
+                raise
+            with self._lock:
+                self.opened += 1
+        return PooledConnection(self, conn)
+
+    def release(self, conn: sqlite3.Connection):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+        except sqlite3.Error:
+            conn.close()
+            conn = None
+        with self._lock:
+            self.in_use -= 1
+            if conn is not None and len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "idle": len(self._idle),
+                "in_use": self.in_use,
+                "opened": self.opened,
+                "reused": self.reused,
+            }
+
+
+class DatabaseExecutor:
+    """Runs the blocking database helpers off the event loop.
+
+    read() runs a helper on a bounded pool of reader threads. write() hands
+    it to the write-behind queue's thread, which also commits the batched
+    message inserts, so there is exactly one writer. Both return awaitables;
+    write_nowait() is for writes nobody waits on.
+    """
+
+    def __init__(self, writer: WriteBehindQueue, read_threads: int = READ_THREADS):
+        self.writer = writer
+        self.read_threads = read_threads
+        self._readers = ThreadPoolExecutor(max_workers=read_threads, thread_name_prefix="sqlite-read")
+        self.reads = 0
+        self.writes = 0
+        self.reads_in_flight = 0
+        self.writes_in_flight = 0
+        self.errors = 0
+
+    async def read(self, fn: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        self.reads += 1
+        self.reads_in_flight += 1
+        try:
+            return await loop.run_in_executor(self._readers, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.reads_in_flight -= 1
+
+    async def write(self, fn: Callable, *args, **kwargs):
+        self.writes += 1
+        self.writes_in_flight += 1
+        try:
+            return await asyncio.wrap_future(self.writer.submit(functools.partial(fn, *args, **kwargs)))
+        finally:
+            self.writes_in_flight -= 1
+
+    def write_nowait(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queue a write without waiting for it; failures are logged"""
+        self.writes += 1
+        future = self.writer.submit(functools.partial(fn, *args, **kwargs))
+        future.add_done_callback(self._log_failure)
+        return future
+
+    def _log_failure(self, future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            self.errors += 1
+            print(f"[ERROR] Background database write failed: {future.exception()}")
+
+    def close(self):
+        self._readers.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "read_threads": self.read_threads,
+            "reads": self.reads,
+            "writes": self.writes,
+            "reads_in_flight": self.reads_in_flight,
+            "writes_in_flight": self.writes_in_flight,
+            "writes_queued": self.writer.pending(),
+            "background_write_errors": self.errors,
+        }
@@ -0,0 +1,164 @@
+import re
+import asyncio
+from typing import Awaitable, Callable, List, Optional
+from history import estimate_tokens
+
+MAX_MAP_CHUNKS = 24       # caps the work (and time) one upload can cause
+MAP_ANSWER_TOKENS = 300   # notes per chunk
+REDUCE_ANSWER_TOKENS = 800
+
+# Structure boundaries the splitter prefers, per file_type
+PAGE_BREAK = re.compile(r"(?=\n--- Page \d+ ---\n)")
+SHEET_BREAK = re.compile(r"(?=^=== Sheet: .+ ===$)", re.MULTILINE)
+MARKDOWN_HEADING = re.compile(r"(?=^#{1,3}\s)", re.MULTILINE)
+CODE_BLOCK = re.compile(
+    r"(?=^(?:def |class |async def |function |export |public |private |protected |static |func |fn |impl |struct |interface |#include|@))",
+    re.MULTILINE
+)
+PARAGRAPH = re.compile(r"\n\s*\n")
+
+MAP_INSTRUCTIONS = (
+    "This is part {part} of {parts} of a larger file. Note only what this part contributes to "
+    "answering the question: key facts, issues, figures and where they appear. Be concise."
+)
+REDUCE_INSTRUCTIONS = (
+    "Below are notes on consecutive parts of one file, written by analysts who each saw only "
+    "their part. Combine them into a single complete answer to the question. Remove repetition; "
+    "do not mention the parts or the analysts."
+)
+
+
+def _units(text: str, file_type: str) -> List[str]:
+    """Split text at the boundaries that matter for its kind of file"""
+    if "\n--- Page " in text:
+        units = PAGE_BREAK.split(text)
+    elif file_type == "spreadsheet" and "=== Sheet: " in text:
+        units = SHEET_BREAK.split(text)
+    elif file_type == "code":
+        units = CODE_BLOCK.split(text)
+    elif file_type == "data":
+        units = text.splitlines(keepends=True)
+    elif MARKDOWN_HEADING.search(text):
+        units = MARKDOWN_HEADING.split(text)
+    else:
+        units = PARAGRAPH.split(text)
+    return [u for u in units if u.strip()]
+
+
+def _split_oversized(unit: str, max_tokens: int) -> List[str]:
+    """Break a unit that is too big on its own by lines, then by characters"""
+    max_chars = max_tokens * 4
+    pieces, current = [], ""
+    for line in unit.splitlines(keepends=True):
+        while len(line) > max_chars:
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if len(current) + len(line) > max_chars and current:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_content(text: str, file_type: str, max_tokens: int) -> List[str]:
+    """Pack structural units (pages, sheets, definitions, sections) into chunks of at most max_tokens"""
+    header = ""
+    if file_type == "data" and text.count("\n") > 1:
+        # CSV-like data: every chunk gets the header row for context
+        header = text.split("\n", 1)[0] + "\n"
+        text = text.split("\n", 1)[1]
+    budget = max_tokens - estimate_tokens(header)
+
+    chunks, current = [], ""
+    for unit in _units(text, file_type):
+        pieces = _split_oversized(unit, budget) if estimate_tokens(unit) > budget else [unit]
+        for piece in pieces:
+            if current and estimate_tokens(current + piece) > budget:
+                chunks.append(header + current)
+                current = ""
+            current += piece
+    if current.strip():
+        chunks.append(header + current)
+    return chunks
+
+
+def _pack(notes: List[str], max_tokens: int) -> List[List[str]]:
+    groups, current, used = [], [], 0
+    for note in notes:
+        cost = estimate_tokens(note)
+        if current and used + cost > max_tokens:
+            groups.append(current)
+            current, used = [], 0
+        current.append(note)
+        used += cost
+    if current:
+        groups.append(current)
+    return groups
+
+
+class MapReduceAnalysis:
+    """Analyzes content too big for one prompt: each chunk is analyzed on its
+    own (concurrently, at most `concurrency` at a time), then the notes are
+    merged, in several rounds if they do not fit one prompt either.
+
+    complete(messages, options) runs one generation and returns its text.
+    """
+
+    def __init__(self, complete: Callable[[List[dict], dict], Awaitable[str]], system_prompt: str,
+                 chunk_tokens: int, concurrency: int):
+        self.complete = complete
+        self.system_prompt = system_prompt
+        self.chunk_tokens = chunk_tokens
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.chunks_total = 0
+        self.chunks_analyzed = 0
+        self.chunks_failed = 0
+
+    async def _generate(self, user_content: str, system_prompt: str, num_predict: int) -> str:
+        async with self.semaphore:
+            return await self.complete(
+                [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_content}],
+                {"num_predict": num_predict}
+            )
+
+    async def _map(self, chunk: str, part: int, parts: int, question: str) -> Optional[str]:
+        instructions = MAP_INSTRUCTIONS.format(part=part, parts=parts)
+        try:
+            notes = await self._generate(
+                f"{instructions}\n\nFile content (part {part}/{parts}):\n{chunk}\n\nQuestion: {question}",
+                self.system_prompt, MAP_ANSWER_TOKENS
+            )
+        except Exception as e:
+            print(f"[WARNING] Analysis of part {part}/{parts} failed: {e}")
+            self.chunks_failed += 1
+            return None
+        self.chunks_analyzed += 1
+        return f"Part {part}/{parts}:\n{notes.strip()}"
+
+    async def _reduce(self, notes: List[str], question: str) -> str:
+        return await self._generate(
+            f"{REDUCE_INSTRUCTIONS}\n\nNotes:\n\n" + "\n\n".join(notes) + f"\n\nQuestion: {question}",
+            self.system_prompt, REDUCE_ANSWER_TOKENS
+        )
+
+    async def run(self, content: str, file_type: str, question: str) -> str:
+        chunks = split_content(content, file_type, self.chunk_tokens)
+        self.chunks_total = len(chunks)
+        chunks = chunks[:MAX_MAP_CHUNKS]
+
+        results = await asyncio.gather(*(
+            self._map(chunk, i + 1, len(chunks), question) for i, chunk in enumerate(chunks)
+        ))
+        notes = [n for n in results if n]
+        if not notes:
+            raise RuntimeError("every part of the file failed to analyze")
+
+        # Merge in rounds until the notes fit a single prompt.
+        while len(notes) > 1 and estimate_tokens("\n\n".join(notes)) > self.chunk_tokens:
+            groups = _pack(notes, self.chunk_tokens)
+            if len(groups) == len(notes):
+                break  # each note alone fills a prompt; merging cannot shrink further
+            notes = list(await asyncio.gather(*(self._reduce(group, question) for group in groups)))
+        return (await self._reduce(notes, question)).strip()
@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+CHARS_PER_TOKEN = 4          # rough, but close enough for budgeting English chat
+MESSAGE_OVERHEAD_TOKENS = 4  # role markers / template tokens per message
+MIN_RECENT_MESSAGES = 4      # always keep at least the last two exchanges verbatim
+SUMMARY_RESERVE_TOKENS = 200
+MAX_CACHED_SUMMARIES = 2000
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a student and Mentor, "
+    "an AI teacher. Merge the new messages into the current summary. Keep names, facts, "
+    "questions the student asked, and anything the assistant promised or explained that "
+    "later turns may refer to. Write at most 120 words of plain prose."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def fingerprint(messages: List[dict]) -> str:
+    digest = hashlib.sha1()
+    for m in messages:
+        digest.update(m.get("role", "").encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(m.get("content", "").encode("utf-8"))
+        digest.update(b"\x01")
+    return digest.hexdigest()
+
+
+class HistoryManager:
+    """Fits chat history into a token budget.
+
+    The newest turns are kept verbatim; anything older is replaced by a
+    rolling summary. Summaries are produced in the background and cached per
+    conversation, so a request never waits on one: until it is ready the
+    oldest turns are simply left out.
+    """
+
+    def __init__(self, summarize: Callable[[List[dict]], Awaitable[str]]):
+        self.summarize = summarize
+        self.summaries: "OrderedDict[str, dict]" = OrderedDict()
+        self.pending: Dict[str, asyncio.Task] = {}
+        self.trimmed_requests = 0
+        self.summaries_built = 0
+
+    def fit(self, key: str, history: List[dict], budget: int) -> List[dict]:
+        """Return history (plus a summary message if needed) within budget tokens"""
+        if sum(message_tokens(m) for m in history) <= budget:
+            return history
+
+        # Walk back from the newest message while the turns still fit.
+        recent_budget = budget - SUMMARY_RESERVE_TOKENS
+        used = 0
+        split = len(history)
+        while split > 0:
+            cost = message_tokens(history[split - 1])
+            kept = len(history) - split
+            if kept >= MIN_RECENT_MESSAGES and used + cost > recent_budget:
+                break
+            if kept >= 1 and used + cost > budget:
+                break
+            used += cost
+            split -= 1
+        older, recent = history[:split], history[split:]
+        if not older:
+            return recent
+        self.trimmed_requests += 1
+
+        summary = self._cached_summary(key, older)
+        if summary is None or summary["covered"] < len(older):
+            self._schedule(key, older)
+        if summary is None:
+            return recent
+        return [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary['text']}"}, *recent]
+
+    def _cached_summary(self, key: str, older: List[dict]) -> Optional[dict]:
+        entry = self.summaries.get(key)
+        if entry is None or entry["covered"] > len(older):
+            return None
+        if entry["fingerprint"] != fingerprint(older[:entry["covered"]]):
+            return None  # history was edited or the key was reused
+        self.summaries.move_to_end(key)
+        return entry
+
+    def _schedule(self, key: str, older: List[dict]):
+        if key in self.pending:
+            return
+        self.pending[key] = asyncio.ensure_future(self._build(key, list(older)))
+
+    async def _build(self, key: str, older: List[dict]):
+        try:
+            previous = self._cached_summary(key, older)
+            new_messages = older[previous["covered"]:] if previous else older
+            transcript = "\n".join(
+                f"{'Student' if m['role'] == 'user' else 'Mentor'}: {m['content']}"
+                for m in new_messages if m["role"] in ("user", "assistant")
+            )
+            prompt = [
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": (
+                    f"Current summary:\n{previous['text'] if previous else '(none yet)'}\n\n"
+                    f"New messages:\n{transcript}"
+                )}
+            ]
+            text = (await self.summarize(prompt)).strip()
+            if text:
+                self.summaries[key] = {"covered": len(older), "fingerprint": fingerprint(older), "text": text}
+                self.summaries.move_to_end(key)
+                while len(self.summaries) > MAX_CACHED_SUMMARIES:
+                    self.summaries.popitem(last=False)
+                self.summaries_built += 1
+        except Exception as e:
+            print(f"[WARNING] History summary failed for {key}: {e}")
+        finally:
+            self.pending.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "cached_summaries": len(self.summaries),
+            "pending_summaries": len(self.pending),
+            "summaries_built": self.summaries_built,
+            "trimmed_requests": self.trimmed_requests,
+        }
@@ -1,5 +1,15 @@
 import os
 import glob
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
 import requests
 import numpy as np
 import faiss
@@ -15,84 +25,425 @@ PDFS_DIR = "pdfs"
 CHUNK_SIZE = 400  # characters
 CHUNK_OVERLAP = 50
 
-model = SentenceTransformer(EMBEDDING_MODEL)
+# Versioned knowledge base: every build goes to kb/<version>/ and kb/CURRENT
+# names the live one, so the API never sees a half-written index.
+KB_DIR = "kb"
+KB_CURRENT_PATH = os.path.join(KB_DIR, "CURRENT")
+MANIFEST_NAME = "manifest.json"
+REPORT_NAME = "ingest_report.json"  # written next to faiss_index.bin
+KEEP_VERSIONS = 3
+BENCHMARK_REPORT_PATH = "ingest_benchmark.json"
+
+# Embedding throughput
+ENCODE_BATCH_SIZE = 32
+ENCODE_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+BATCHES_PER_SHARD = 8         # batches handed to a worker at a time
+MIN_CHUNKS_PER_WORKER = 256   # below this a process pool costs more than it saves
+
+class IngestStats:
+    """Per-stage wall-clock timers and counters for one ingestion run"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started_at = datetime.now().isoformat()
+        self.start = time.perf_counter()
+        self.stages = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.worker_scan = []
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - start
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def report(self, **extra):
+        total = time.perf_counter() - self.start
+        embed_time = self.stages.get("embed", 0.0)
+        fetch_time = self.stages.get("fetch", 0.0)
+        report = {
+            "started_at": self.started_at,
+            "total_seconds": round(total, 4),
+            "stages_seconds": {name: round(value, 4) for name, value in sorted(self.stages.items())},
+            "counters": dict(sorted(self.counters.items())),
+            "embeddings_per_sec": round(self.counters["embeddings"] / embed_time, 2) if embed_time else None,
+            "fetch_bytes_per_sec": round(self.counters["bytes_fetched"] / fetch_time, 2) if fetch_time else None,
+            "index_build_seconds": round(self.stages.get("index_build", 0.0), 4),
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "embedding_model": EMBEDDING_MODEL,
+            },
+        }
+        if self.worker_scan:
+            report["worker_scan"] = self.worker_scan
+        report.update(extra)
+        return report
+
+stats = IngestStats()
+
+_model = None
+
+def get_model():
+    """Load the embedding model once per process"""
+    global _model
+    if _model is None:
+        _model = SentenceTransformer(EMBEDDING_MODEL)
+    return _model
 
 def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = min(start + chunk_size, len(text))
-        chunk = text[start:end]
-        if len(chunk.strip()) > 50:  # skip tiny chunks
-            chunks.append(chunk.strip())
-        start += chunk_size - overlap
+    with stats.stage("chunk"):
+        chunks = []
+        start = 0
+        while start < len(text):
+            end = min(start + chunk_size, len(text))
+            chunk = text[start:end]
+            if len(chunk.strip()) > 50:  # skip tiny chunks
+                chunks.append(chunk.strip())
+            start += chunk_size - overlap
+    stats.count("chunks_produced", len(chunks))
     return chunks
 
-def extract_text_from_url(url):
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
+def html_to_text(html):
+    with stats.stage("parse_html"):
+        soup = BeautifulSoup(html, "html.parser")
         # Remove scripts/styles
         for tag in soup(["script", "style", "header", "footer", "nav"]):
             tag.decompose()
         text = soup.get_text(separator=" ", strip=True)
-        return text
+    stats.count("html_pages_parsed")
+    return text
+
+def extract_text_from_url(url):
+    try:
+        with stats.stage("fetch"):
+            resp = requests.get(url, timeout=10)
+            resp.raise_for_status()
+        stats.count("urls_fetched")
+        stats.count("bytes_fetched", len(resp.content))
+        return html_to_text(resp.text)
     except Exception as e:
+        stats.count("fetch_errors")
         print(f"[ERROR] Failed to fetch {url}: {e}")
         return ""
 
 def extract_text_from_pdf(pdf_path):
     try:
-        reader = PdfReader(pdf_path)
-        text = " ".join(page.extract_text() or "" for page in reader.pages)
+        with stats.stage("parse_pdf"):
+            reader = PdfReader(pdf_path)
+            text = " ".join(page.extract_text() or "" for page in reader.pages)
+        stats.count("pdf_files_parsed")
+        stats.count("pdf_pages_parsed", len(reader.pages))
+        stats.count("bytes_read", os.path.getsize(pdf_path))
         return text
     except Exception as e:
+        stats.count("parse_errors")
         print(f"[ERROR] Failed to read {pdf_path}: {e}")
         return ""
 
-def main():
-    docs = []
-    embeddings = []
+def extract_text_from_file(path):
+    """Local .html/.htm/.txt file, as used by the benchmark corpus"""
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        content = f.read()
+    stats.count("bytes_read", os.path.getsize(path))
+    if path.lower().endswith((".html", ".htm")):
+        return html_to_text(content)
+    return content
 
-    # Ingest URLs
+def list_sources():
+    """All configured sources: URLs from links.txt, then PDFs in pdfs/"""
+    sources = []
     if os.path.exists(LINKS_PATH):
         with open(LINKS_PATH, "r", encoding="utf-8") as f:
-            urls = [line.strip() for line in f if line.strip()]
-        for url in urls:
-            print(f"[INFO] Processing URL: {url}")
-            text = extract_text_from_url(url)
-            for chunk in chunk_text(text):
-                docs.append({"text": chunk, "source": url})
+            for line in f:
+                url = line.strip()
+                if url:
+                    sources.append({"source": url, "kind": "url", "location": url})
     else:
         print(f"[WARNING] {LINKS_PATH} not found.")
 
-    # Ingest PDFs
     if os.path.exists(PDFS_DIR):
-        pdf_files = glob.glob(os.path.join(PDFS_DIR, "*.pdf"))
-        for pdf_path in pdf_files:
-            print(f"[INFO] Processing PDF: {pdf_path}")
-            text = extract_text_from_pdf(pdf_path)
-            for chunk in chunk_text(text):
-                docs.append({"text": chunk, "source": os.path.basename(pdf_path)})
+        for pdf_path in sorted(glob.glob(os.path.join(PDFS_DIR, "*.pdf"))):
+            sources.append({"source": os.path.basename(pdf_path), "kind": "pdf", "location": pdf_path})
     else:
         print(f"[WARNING] {PDFS_DIR} directory not found.")
+    return sources
+
+def list_corpus_sources(corpus_dir):
+    """Every PDF, HTML and text file in a local directory (benchmark mode)"""
+    sources = []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "**", "*"), recursive=True)):
+        ext = os.path.splitext(path)[1].lower()
+        if ext == ".pdf":
+            sources.append({"source": os.path.relpath(path, corpus_dir), "kind": "pdf", "location": path})
+        elif ext in (".html", ".htm", ".txt"):
+            sources.append({"source": os.path.relpath(path, corpus_dir), "kind": "file", "location": path})
+    return sources
+
+def file_signature(path):
+    """Cheap change check for local files: size and modification time"""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def read_source(source):
+    """Extract a source's text and a content fingerprint for change detection"""
+    if source["kind"] == "url":
+        print(f"[INFO] Processing URL: {source['location']}")
+        text = extract_text_from_url(source["location"])
+    elif source["kind"] == "pdf":
+        print(f"[INFO] Processing PDF: {source['location']}")
+        text = extract_text_from_pdf(source["location"])
+    else:
+        print(f"[INFO] Processing file: {source['location']}")
+        text = extract_text_from_file(source["location"])
+    return text, hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def token_lengths(model, texts):
+    """Token count of each text as the encoder will see it (after truncation)"""
+    encoded = model.tokenizer(
+        texts,
+        add_special_tokens=True,
+        truncation=True,
+        max_length=model.max_seq_length,
+    )
+    return [len(ids) for ids in encoded["input_ids"]]
+
+def encode_texts(texts, workers=ENCODE_WORKERS, batch_size=ENCODE_BATCH_SIZE,
+                 min_chunks_per_worker=MIN_CHUNKS_PER_WORKER):
+    """Embed texts sorted by token length, sharded across a process pool.
+
+    Sorting keeps every batch close to uniform length so little time is spent
+    on padding; contiguous shards of sorted batches go to the workers and the
+    embeddings are put back into the caller's order before returning.
+    """
+    model = get_model()
+    if not texts:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    with stats.stage("length_sort"):
+        lengths = token_lengths(model, texts)
+        order = np.argsort(lengths, kind="stable")
+        sorted_texts = [texts[i] for i in order]
+
+    workers = max(1, min(workers, len(texts) // max(1, min_chunks_per_worker)))
+    with stats.stage("embed"):
+        sorted_emb = _encode_sorted(model, sorted_texts, workers, batch_size)
+    stats.count("embeddings", len(texts))
+    stats.counters["encode_workers"] = workers
+
+    emb = np.empty_like(sorted_emb, dtype=np.float32)
+    emb[order] = sorted_emb
+    return emb
+
+def _encode_sorted(model, sorted_texts, workers, batch_size):
+    if workers == 1:
+        return model.encode(sorted_texts, batch_size=batch_size, show_progress_bar=True)
+    else:
+        # Give each worker its share of the cores instead of letting every
+        # process spin up a full-size torch thread pool.
+        previous_threads = os.environ.get("OMP_NUM_THREADS")
+        os.environ["OMP_NUM_THREADS"] = str(max(1, (os.cpu_count() or 1) // workers))
+        try:
+            pool = model.start_multi_process_pool(target_devices=["cpu"] * workers)
+        finally:
+            if previous_threads is None:
+                os.environ.pop("OMP_NUM_THREADS", None)
+            else:
+                os.environ["OMP_NUM_THREADS"] = previous_threads
+        try:
+            return model.encode_multi_process(
+                sorted_texts,
+                pool,
+                batch_size=batch_size,
+                chunk_size=batch_size * BATCHES_PER_SHARD,
+            )
+        finally:
+            model.stop_multi_process_pool(pool)
+
+def scan_workers(texts, max_workers, batch_size=ENCODE_BATCH_SIZE):
+    """Encode the same texts with 1..max_workers processes and report throughput"""
+    counts = sorted({1, *[2 ** i for i in range(1, max_workers.bit_length())], max_workers})
+    # The scan is a side experiment; keep it out of the run's stage timings.
+    saved_stages, saved_counters = dict(stats.stages), dict(stats.counters)
+    results = []
+    for workers in counts:
+        start = time.perf_counter()
+        encode_texts(texts, workers=workers, batch_size=batch_size, min_chunks_per_worker=1)
+        elapsed = time.perf_counter() - start
+        rate = len(texts) / elapsed if elapsed > 0 else 0.0
+        results.append({"workers": workers, "chunks_per_sec": round(rate, 2)})
+        print(f"[BENCH] workers={workers:<3} {rate:10.1f} chunks/sec ({elapsed:.2f}s)")
+    stats.stages = defaultdict(float, saved_stages)
+    stats.counters = defaultdict(int, saved_counters)
+    return results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the FAISS knowledge base from links.txt and pdfs/")
+    parser.add_argument("--workers", type=int, default=ENCODE_WORKERS,
+                        help=f"encoder processes (default: {ENCODE_WORKERS})")
+    parser.add_argument("--batch-size", type=int, default=ENCODE_BATCH_SIZE,
+                        help=f"texts per encoder batch (default: {ENCODE_BATCH_SIZE})")
+    parser.add_argument("--scan-workers", action="store_true",
+                        help="report chunks/sec for 1..--workers processes before building the index")
+    parser.add_argument("--benchmark", nargs="?", const=PDFS_DIR, metavar="CORPUS_DIR",
+                        help=f"run the pipeline over a local corpus (default: {PDFS_DIR}) into a scratch "
+                             f"directory and write a report instead of publishing")
+    parser.add_argument("--report", default=BENCHMARK_REPORT_PATH,
+                        help=f"benchmark report path (default: {BENCHMARK_REPORT_PATH})")
+    parser.add_argument("--baseline", help="earlier benchmark report to compare against")
+    return parser.parse_args()
+
+def new_version_name(kb_dir=KB_DIR):
+    base = datetime.now().strftime("v%Y%m%d-%H%M%S")
+    name, n = base, 1
+    while os.path.exists(os.path.join(kb_dir, name)):
+        n += 1
+        name = f"{base}-{n}"
+    return name
+
+def publish_index(emb, docs, manifest, kb_dir=KB_DIR):
+    """Write a new knowledge-base version and atomically point kb/CURRENT at it"""
+    os.makedirs(kb_dir, exist_ok=True)
+    version = new_version_name(kb_dir)
+    staging = os.path.join(kb_dir, f".{version}.tmp")
+    os.makedirs(staging)
+
+    with stats.stage("index_build"):
+        index = faiss.IndexFlatL2(emb.shape[1])
+        index.add(emb)
+    with stats.stage("write"):
+        faiss.write_index(index, os.path.join(staging, VECTOR_STORE_PATH))
+        np.save(os.path.join(staging, DOCS_STORE_PATH), np.array(docs, dtype=object))
+        manifest = dict(manifest, version=version, created_at=datetime.now().isoformat(), chunks=len(docs))
+        with open(os.path.join(staging, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+    with open(os.path.join(staging, REPORT_NAME), "w", encoding="utf-8") as f:
+        json.dump(stats.report(version=version, chunks_indexed=len(docs)), f, indent=2)
+
+    version_dir = os.path.join(kb_dir, version)
+    os.replace(staging, version_dir)
+
+    pointer_path = os.path.join(kb_dir, "CURRENT")
+    pointer_tmp = pointer_path + ".tmp"
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, pointer_path)
+
+    prune_versions(kb_dir, keep=version)
+    return version_dir
+
+def prune_versions(kb_dir, keep):
+    """Remove all but the newest KEEP_VERSIONS builds (never the live one)"""
+    versions = sorted(
+        name for name in os.listdir(kb_dir)
+        if name.startswith("v") and os.path.isdir(os.path.join(kb_dir, name))
+    )
+    for name in versions[:-KEEP_VERSIONS]:
+        if name != keep:
+            shutil.rmtree(os.path.join(kb_dir, name), ignore_errors=True)
+
+def load_current():
+    """Return (index, docs, manifest) for the live version, or None"""
+    if not os.path.exists(KB_CURRENT_PATH):
+        return None
+    with open(KB_CURRENT_PATH, "r", encoding="utf-8") as f:
+        version_dir = os.path.join(KB_DIR, f.read().strip())
+    try:
+        index = faiss.read_index(os.path.join(version_dir, VECTOR_STORE_PATH))
+        docs = np.load(os.path.join(version_dir, DOCS_STORE_PATH), allow_pickle=True).tolist()
+        with open(os.path.join(version_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception as e:
+        print(f"[WARNING] Could not load knowledge base from {version_dir}: {e}")
+        return None
+    return index, docs, manifest
+
+def compare_reports(report, baseline_path):
+    """Print throughput/timing changes against an earlier benchmark report"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"[BENCH] Compared with {baseline_path} ({baseline.get('started_at', 'unknown date')}):")
+    rows = [("total_seconds", report["total_seconds"], baseline.get("total_seconds"))]
+    rows.append(("embeddings_per_sec", report["embeddings_per_sec"], baseline.get("embeddings_per_sec")))
+    for name, value in report["stages_seconds"].items():
+        rows.append((f"stage:{name}", value, baseline.get("stages_seconds", {}).get(name)))
+    for name, value, old in rows:
+        if value is None or not old:
+            continue
+        change = (value - old) / old * 100
+        print(f"[BENCH]   {name:<24} {old:>10.3f} -> {value:>10.3f} ({change:+.1f}%)")
+
+def build(sources, args, kb_dir=KB_DIR):
+    """Run the whole pipeline over sources and publish into kb_dir"""
+    docs = []
+    manifest = {"sources": {}}
+
+    for source in sources:
+        text, fingerprint = read_source(source)
+        chunks = chunk_text(text)
+        entry = {"kind": source["kind"], "fingerprint": fingerprint, "start": len(docs), "count": len(chunks)}
+        if source["kind"] == "pdf":
+            entry["signature"] = file_signature(source["location"])
+        manifest["sources"][source["source"]] = entry
+        for chunk in chunks:
+            docs.append({"text": chunk, "source": source["source"]})
 
     if not docs:
         print("[ERROR] No documents found to ingest.")
-        return
+        return None
 
-    print(f"[INFO] Embedding {len(docs)} chunks...")
     texts = [d["text"] for d in docs]
-    emb = model.encode(texts, show_progress_bar=True, batch_size=32).astype(np.float32)
+    if args.scan_workers:
+        stats.worker_scan = scan_workers(texts, max(1, args.workers), batch_size=args.batch_size)
+
+    print(f"[INFO] Embedding {len(docs)} chunks (up to {args.workers} worker processes)...")
+    start = time.perf_counter()
+    emb = encode_texts(texts, workers=args.workers, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - start
+    print(f"[INFO] Embedded {len(texts)} chunks in {elapsed:.2f}s ({len(texts) / max(elapsed, 1e-9):.1f} chunks/sec)")
 
     print(f"[INFO] Building FAISS index...")
-    dim = emb.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(emb)
-    faiss.write_index(index, VECTOR_STORE_PATH)
-    np.save(DOCS_STORE_PATH, np.array(docs, dtype=object))
-    print(f"[SUCCESS] Ingestion complete. {len(docs)} chunks indexed.")
+    return publish_index(emb, docs, manifest, kb_dir=kb_dir)
+
+def main():
+    args = parse_args()
+    stats.reset()
+
+    if args.benchmark:
+        print(f"[BENCH] Benchmarking ingestion over {args.benchmark}")
+        scratch = tempfile.mkdtemp(prefix="ingest-bench-")
+        try:
+            version_dir = build(list_corpus_sources(args.benchmark), args, kb_dir=scratch)
+            if not version_dir:
+                return
+            with open(os.path.join(version_dir, REPORT_NAME), "r", encoding="utf-8") as f:
+                report = json.load(f)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        report.update(corpus=args.benchmark, workers=args.workers, batch_size=args.batch_size)
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[BENCH] {report['counters'].get('embeddings', 0)} embeddings, "
+              f"{report['embeddings_per_sec']} embeddings/sec, {report['total_seconds']}s total")
+        print(f"[BENCH] Report written to {args.report}")
+        if args.baseline:
+            compare_reports(report, args.baseline)
+        return
+
+    version_dir = build(list_sources(), args)
+    if version_dir:
+        print(f"[SUCCESS] Ingestion complete. {stats.counters['embeddings']} chunks indexed in {version_dir}.")
+        print(f"[INFO] Stage report: {os.path.join(version_dir, REPORT_NAME)}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
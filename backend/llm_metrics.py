@@ -0,0 +1,105 @@
+import bisect
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+# Histogram bucket upper bounds
+TOKENS_PER_SEC_BUCKETS = [1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200, 500, 1000, 2000]
+LOAD_SECONDS_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120]
+
+
+def usage_from_response(data: dict, model: Optional[str] = None) -> dict:
+    """Per-request metrics from the final /api/chat chunk (durations are in ns).
+
+    Fields Ollama left out (older versions, cancelled streams) come back as None.
+    """
+    def ms(field):
+        value = data.get(field)
+        return round(value / 1e6, 3) if value is not None else None
+
+    def rate(count_field, duration_field):
+        count, duration = data.get(count_field), data.get(duration_field)
+        return round(count / (duration / 1e9), 2) if count and duration else None
+
+    return {
+        "model": model or data.get("model"),
+        "prompt_tokens": data.get("prompt_eval_count"),
+        "completion_tokens": data.get("eval_count"),
+        "prompt_eval_ms": ms("prompt_eval_duration"),
+        "eval_ms": ms("eval_duration"),
+        "load_ms": ms("load_duration"),
+        "total_ms": ms("total_duration"),
+        "prompt_tokens_per_sec": rate("prompt_eval_count", "prompt_eval_duration"),
+        "tokens_per_sec": rate("eval_count", "eval_duration"),
+    }
+
+
+class Histogram:
+    """Fixed-bucket histogram; counts[i] is observations <= buckets[i], the last slot is overflow"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + [float("inf")], self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self) -> dict:
+        labels = [f"le_{b}" for b in self.buckets] + ["inf"]
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class LLMTelemetry:
+    """Measured Ollama throughput per model, for capacity planning"""
+
+    def __init__(self):
+        self.models: Dict[str, dict] = defaultdict(lambda: {
+            "generations": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "tokens_per_sec": Histogram(TOKENS_PER_SEC_BUCKETS),
+            "prompt_tokens_per_sec": Histogram(TOKENS_PER_SEC_BUCKETS),
+            "load_seconds": Histogram(LOAD_SECONDS_BUCKETS),
+        })
+
+    def record(self, usage: dict):
+        entry = self.models[usage["model"] or "unknown"]
+        entry["generations"] += 1
+        entry["prompt_tokens"] += usage["prompt_tokens"] or 0
+        entry["completion_tokens"] += usage["completion_tokens"] or 0
+        if usage["tokens_per_sec"] is not None:
+            entry["tokens_per_sec"].observe(usage["tokens_per_sec"])
+        if usage["prompt_tokens_per_sec"] is not None:
+            entry["prompt_tokens_per_sec"].observe(usage["prompt_tokens_per_sec"])
+        if usage["load_ms"] is not None:
+            entry["load_seconds"].observe(usage["load_ms"] / 1000)
+
+    def stats(self) -> dict:
+        return {
+            model: {
+                key: value.snapshot() if isinstance(value, Histogram) else value
+                for key, value in entry.items()
+            }
+            for model, entry in self.models.items()
+        }
@@ -0,0 +1,260 @@
+"""Replay a mixed workload against the running API and report latency per endpoint.
+
+Start one or more stubs (ollama_stub.py) and the API pointed at them, then:
+
+    python ollama_stub.py --port 11501 &
+    OLLAMA_BACKENDS=http://localhost:11501 uvicorn main:app --port 8000 &
+    python loadtest.py --concurrency 20 --duration 60
+
+Every virtual client has its own X-Forwarded-For address, so per-IP rate
+limits and guest quotas apply per client the way they would in production.
+Results go to stdout and, with --out, to a JSON file.
+"""
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+from typing import Dict, List, Optional
+import httpx
+
+DEFAULT_MIX = "guest_chat=3,guest_university=2,user_chat=3,user_code=1,user_stream=2,upload=1"
+
+GENERAL_QUESTIONS = [
+    "Hi! How are you today?",
+    "Can you explain recursion with a simple example?",
+    "Give me three tips to stay focused while studying.",
+    "What is the difference between a list and a tuple in Python?",
+]
+UNIVERSITY_QUESTIONS = [
+    "What courses does the CSE department offer this semester?",
+    "When is the admission deadline for the university?",
+    "How many credits do I need for the statistics course?",
+    "Where can I find the syllabus for web technology?",
+]
+CODE_QUESTIONS = [
+    "Write a Python function that checks whether a string is a palindrome.",
+    "Fix this: for i in range(10) print(i)",
+    "Explain what a SQL JOIN does with an example query.",
+]
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.first_token: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint: str, status, seconds: float, first_token: Optional[float] = None):
+        self.statuses[endpoint][str(status)] += 1
+        if status == 200:
+            self.samples[endpoint].append(seconds)
+            if first_token is not None:
+                self.first_token[endpoint].append(first_token)
+
+    def report(self, wall_seconds: float) -> dict:
+        endpoints = {}
+        for endpoint in sorted(self.statuses):
+            latencies = sorted(self.samples[endpoint])
+            first = sorted(self.first_token[endpoint])
+            total = sum(self.statuses[endpoint].values())
+            endpoints[endpoint] = {
+                "requests": total,
+                "ok": len(latencies),
+                "statuses": dict(self.statuses[endpoint]),
+                "throughput_rps": round(len(latencies) / wall_seconds, 2),
+                "p50_ms": ms(percentile(latencies, 0.50)),
+                "p95_ms": ms(percentile(latencies, 0.95)),
+                "p99_ms": ms(percentile(latencies, 0.99)),
+                "first_token_p50_ms": ms(percentile(first, 0.50)),
+                "first_token_p95_ms": ms(percentile(first, 0.95)),
+            }
+        return {"wall_seconds": round(wall_seconds, 2), "endpoints": endpoints}
+
+
+def ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+class VirtualClient:
+    """One simulated student: an IP address and, for signed-in scenarios, an account"""
+
+    def __init__(self, http: httpx.AsyncClient, recorder: Recorder, number: int):
+        self.http = http
+        self.recorder = recorder
+        self.ip = f"10.{(number >> 16) & 255}.{(number >> 8) & 255}.{number & 255}"
+        self.token: Optional[str] = None
+        self.conversation_id: Optional[int] = None
+        self.history: List[dict] = []
+
+    def headers(self) -> dict:
+        headers = {"X-Forwarded-For": self.ip}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    async def timed(self, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await self.http.request(method, url, headers=self.headers(), **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.record(endpoint, type(e).__name__, time.perf_counter() - start)
+            return None
+        self.recorder.record(endpoint, response.status_code, time.perf_counter() - start)
+        return response
+
+    async def sign_in(self):
+        name = f"lt{uuid.uuid4().hex[:12]}"
+        account = {"email": f"{name}@loadtest.example.com", "password": "loadtest123"}
+        await self.timed("/auth/register", "POST", "/auth/register", json={**account, "username": name[:20]})
+        response = await self.timed("/auth/login", "POST", "/auth/login", json=account)
+        if response is not None and response.status_code == 200:
+            self.token = response.json().get("token")
+
+    async def chat(self, question: str, task_type: str = "general"):
+        self.history = (self.history + [{"role": "user", "content": question}])[-10:]
+        payload = {"messages": self.history, "task_type": task_type}
+        if self.conversation_id:
+            payload["conversation_id"] = self.conversation_id
+        response = await self.timed("/chat", "POST", "/chat", json=payload)
+        if response is not None and response.status_code == 200:
+            data = response.json()
+            self.conversation_id = data.get("conversation_id") or self.conversation_id
+            self.history.append({"role": "assistant", "content": data.get("answer", "")})
+        else:
+            self.history.pop()
+
+    async def chat_stream(self, question: str):
+        self.history = (self.history + [{"role": "user", "content": question}])[-10:]
+        payload = {"messages": self.history, "task_type": "general"}
+        if self.conversation_id:
+            payload["conversation_id"] = self.conversation_id
+        start = time.perf_counter()
+        first_token = None
+        status = None
+        answer = ""
+        try:
+            async with self.http.stream("POST", "/chat/stream", json=payload, headers=self.headers()) as response:
+                status = response.status_code
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event:"):
+                        event = line[6:].strip()
+                    elif line.startswith("data:"):
+                        data = json.loads(line[5:])
+                        if event == "token" and first_token is None:
+                            first_token = time.perf_counter() - start
+                        elif event == "done":
+                            answer = data.get("answer", "")
+                            self.conversation_id = data.get("conversation_id") or self.conversation_id
+                        elif event == "error":
+                            status = data.get("status", "stream_error")
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.recorder.record("/chat/stream", status, time.perf_counter() - start, first_token)
+        if status == 200:
+            self.history.append({"role": "assistant", "content": answer})
+        else:
+            self.history.pop()
+
+    async def upload_and_analyze(self):
+        lines = [f"Week {i}: topic {random.randint(1, 500)} covers {random.choice(['graphs', 'sorting', 'SQL', 'OOP'])}."
+                 for i in range(random.randint(20, 200))]
+        response = await self.timed("/upload", "POST", "/upload",
+                                    files={"file": ("notes.txt", "\n".join(lines).encode(), "text/plain")})
+        if response is None or response.status_code != 200:
+            return
+        await self.timed("/analyze-file", "POST", "/analyze-file", json={
+            "file_content": response.json().get("full_content", ""),
+            "file_type": "document",
+        })
+
+
+async def run_scenario(client: VirtualClient, scenario: str):
+    if scenario == "guest_chat":
+        await client.chat(random.choice(GENERAL_QUESTIONS))
+    elif scenario == "guest_university":
+        await client.chat(random.choice(UNIVERSITY_QUESTIONS))
+    elif scenario == "user_chat":
+        await client.chat(random.choice(GENERAL_QUESTIONS + UNIVERSITY_QUESTIONS))
+    elif scenario == "user_code":
+        await client.chat(random.choice(CODE_QUESTIONS), task_type="code")
+    elif scenario == "user_stream":
+        await client.chat_stream(random.choice(GENERAL_QUESTIONS + UNIVERSITY_QUESTIONS))
+    elif scenario == "upload":
+        await client.upload_and_analyze()
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+async def worker(number: int, http: httpx.AsyncClient, recorder: Recorder, mix: Dict[str, float],
+                 deadline: float, remaining: List[int], think_time: float):
+    scenarios, weights = list(mix), list(mix.values())
+    # Each worker keeps one guest and one signed-in identity for its session.
+    guest = VirtualClient(http, recorder, number * 2)
+    user = VirtualClient(http, recorder, number * 2 + 1)
+    if any(s.startswith("user") for s in scenarios):
+        await user.sign_in()
+    while time.perf_counter() < deadline and remaining[0] > 0:
+        remaining[0] -= 1
+        scenario = random.choices(scenarios, weights)[0]
+        await run_scenario(user if scenario.startswith("user") else guest, scenario)
+        if think_time:
+            await asyncio.sleep(random.expovariate(1 / think_time))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Mixed-workload load test for the Mentor API")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=10, help="simulated clients")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many scenarios (0 = no limit)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"scenario weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--think-time", type=float, default=0, help="mean pause between a client's requests")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", help="also write the report to this JSON file")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    mix = parse_mix(args.mix)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=args.url, timeout=180, limits=limits) as http:
+        start = time.perf_counter()
+        remaining = [args.requests or 10 ** 9]
+        await asyncio.gather(*(
+            worker(i + 1, http, recorder, mix, start + args.duration, remaining, args.think_time)
+            for i in range(args.concurrency)
+        ))
+        wall = time.perf_counter() - start
+
+    report = recorder.report(wall)
+    report["config"] = {"concurrency": args.concurrency, "duration": args.duration, "mix": mix}
+    print(f"\n{'endpoint':<16}{'ok/total':>12}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttft p95':>10}  statuses")
+    for endpoint, r in report["endpoints"].items():
+        print(f"{endpoint:<16}{r['ok']:>6}/{r['requests']:<5}{r['throughput_rps']:>8}{str(r['p50_ms']):>10}"
+              f"{str(r['p95_ms']):>10}{str(r['p99_ms']):>10}{str(r['first_token_p95_ms'] or '-'):>10}  {r['statuses']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[INFO] Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
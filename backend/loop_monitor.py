@@ -0,0 +1,64 @@
+import time
+import asyncio
+from collections import deque
+from typing import Optional
+
+SAMPLE_INTERVAL = 0.1   # seconds between probes
+WINDOW = 600            # samples kept (one minute at the default interval)
+LAG_WARNING = 0.25      # log when the loop was blocked this long
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag: how much later than requested a short sleep wakes up.
+
+    Anything that blocks the loop (a synchronous query, bcrypt, parsing an
+    upload) delays every other request by the same amount and shows up here.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, window: int = WINDOW):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= LAG_WARNING:
+                self.stalls += 1
+                print(f"[WARNING] Event loop blocked for {lag * 1000:.0f} ms")
+
+    def stats(self) -> dict:
+        recent = sorted(self.samples)
+
+        def ms(q: float) -> Optional[float]:
+            if not recent:
+                return None
+            return round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 2)
+
+        return {
+            "current_ms": round(self.samples[-1] * 1000, 2) if self.samples else None,
+            "p50_ms": ms(0.50),
+            "p99_ms": ms(0.99),
+            "window_max_ms": round(recent[-1] * 1000, 2) if recent else None,
+            "max_ms": round(self.max_lag * 1000, 2),
+            "stalls": self.stalls,
+        }
@@ -1,30 +1,57 @@
 import os
 import re
+import json
 import time
+import base64
 import hashlib
-import sqlite3
+import asyncio
+import threading
+import functools
 import jwt
+from concurrent.futures import Future
 from datetime import datetime, timedelta
-from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Request, Depends, UploadFile, File
+from typing import Callable, Dict, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Request, Depends, UploadFile, File, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, validator, Field, EmailStr
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
-import requests
 from collections import defaultdict, deque
 import bcrypt
 from file_processor import FileProcessor
+from ollama_client import OllamaError, collect_chat
+from ollama_pool import OllamaPool
+from circuit_breaker import CircuitBreakers
+from file_analysis import MapReduceAnalysis
+from write_behind import WriteBehindQueue
+from db import ConnectionPool, DatabaseExecutor
+from migrations import MESSAGE_USAGE_COLUMNS, migrate
+import rollups
+from singleflight import SingleFlight
+from model_manager import ModelManager
+from admission import (AdmissionController, AdmissionRejected, PRIORITY_USER_CHAT,
+                       PRIORITY_GUEST_CHAT, PRIORITY_USER_FILE, PRIORITY_GUEST_FILE,
+                       PRIORITY_BACKGROUND)
+from history import HistoryManager, estimate_tokens
+from prompts import MENTOR_SYSTEM_PROMPT, build_chat_messages
+from llm_metrics import LLMTelemetry, usage_from_response
+from loop_monitor import LoopLagMonitor
+from quota import QuotaAccountant, QuotaExceeded
 
 # --- CONFIG ---
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
 # Ollama Configuration (Local AI Models)
-OLLAMA_API_URL = "http://localhost:11434/api/chat"
-OLLAMA_MODELS_URL = "http://localhost:11434/api/tags"
+OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_MODELS_URL = f"{OLLAMA_BASE_URL}/api/tags"
+# Comma-separated Ollama servers to balance across (defaults to the local one)
+OLLAMA_BACKENDS = [u.strip() for u in os.getenv("OLLAMA_BACKENDS", OLLAMA_BASE_URL).split(",") if u.strip()]
+# Seconds without a first token before a chat is also sent to a second backend (0 = off)
+OLLAMA_HEDGE_AFTER = float(os.getenv("OLLAMA_HEDGE_AFTER", "0"))
 
 # AI MODELS - SPECIALIZED MODELS FOR DIFFERENT TASKS
 AI_MODELS = {
@@ -32,22 +59,59 @@ AI_MODELS = {
         "model": "men.01",
         "actual_model": "gemma2:2b",
         "description": "Fast conversational AI for general chat and university questions",
-        "max_tokens": 2000
+        "max_tokens": 2000,
+        "num_ctx": 4096,
+        "num_keep": 192
     },
     "code": {
         "model": "men.02",
         "actual_model": "phi3.5:3.8b",
+        "fallback_model": "gemma2:2b",  # used while phi3.5's circuit is open
         "description": "Advanced AI for code generation and programming",
-        "max_tokens": 2000
+        "max_tokens": 2000,
+        "num_ctx": 4096,
+        "num_keep": 192
     },
     "image": {
         "model": "men.03",
         "actual_model": "gemma2:2b",
         "description": "Fast AI for analysis and reasoning tasks",
-        "max_tokens": 1500
+        "max_tokens": 1500,
+        "num_ctx": 4096,
+        "num_keep": 192
     }
 }
 
+# num_ctx is the context window Ollama allocates per model; num_keep is how many
+# leading prompt tokens (the persona, see prompts.py) survive a context shift.
+# Prompt budget: num_ctx minus room for the answer. History beyond the budget
+# is replaced by a rolling summary (see history.py).
+RESPONSE_TOKEN_RESERVE = 1024
+
+# Admission control: concurrent generations per Ollama model and backend, plus
+# a bounded priority queue in front of each. Beyond that requests fail fast with 503.
+MODEL_CONCURRENCY = {
+    "gemma2:2b": 2,
+    "phi3.5:3.8b": 1
+}
+DEFAULT_MODEL_CONCURRENCY = 1
+ADMISSION_QUEUE_SIZE = 16    # waiting requests per model
+ADMISSION_MAX_WAIT = 45      # seconds a request may expect to wait in the queue
+
+# File analysis: uploads whose prompt exceeds num_ctx - RESPONSE_TOKEN_RESERVE
+# are split into parts, analyzed concurrently and merged (see file_analysis.py)
+ANALYSIS_MAP_CONCURRENCY = 4
+ANALYSIS_PROMPT_OVERHEAD = 300  # instructions and question around each part
+ANALYSIS_CACHE_MAX_ENTRIES = 1000
+ANALYSIS_CACHE_MAX_BYTES = 50 * 1024 * 1024  # least recently used results go first
+
+# Circuit breaker: p95 time to first token (queueing included) above which a
+# model is considered overloaded and chats go to its fallback_model instead.
+MODEL_P95_LIMITS = {
+    "gemma2:2b": 15,
+    "phi3.5:3.8b": 30
+}
+
 # JWT Configuration
 JWT_SECRET_KEY = "your-super-secret-jwt-key-change-in-production"
 JWT_ALGORITHM = "HS256"
@@ -63,6 +127,12 @@ TOKEN_LIMITS = {
 DATABASE_PATH = "chatbot.db"
 VECTOR_STORE_PATH = "faiss_index.bin"
 DOCS_STORE_PATH = "docs_store.npy"
+KB_DIR = "kb"  # versioned builds written by ingest.py / refresh.py
+KB_CURRENT_PATH = os.path.join(KB_DIR, "CURRENT")
+KB_RELOAD_CHECK_INTERVAL = 30  # seconds between checks for a newer build
+CONVERSATIONS_PAGE_SIZE = 50   # conversations per page of GET /conversations
+MESSAGES_PAGE_SIZE = 50        # messages per page (the latest N when a chat is opened)
+MAX_PAGE_SIZE = 200
 
 # --- SECURITY CONFIG ---
 MAX_MESSAGE_LENGTH = 2000
@@ -89,81 +159,19 @@ guest_token_storage = defaultdict(lambda: {"tokens_used": 0, "reset_date": datet
 security = HTTPBearer(auto_error=False)
 
 # --- DATABASE SETUP ---
+# Every helper borrows a connection from this pool (WAL, tuned pragmas) and
+# hands it back with conn.close().
+db_pool = ConnectionPool(DATABASE_PATH)
+schema_info = {}  # result of the startup migration run
+
 def init_database():
-    """Initialize SQLite database with required tables"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    """Bring the SQLite schema up to date and make sure the admin account exists"""
+    global schema_info
+    conn = db_pool.connect()
     cursor = conn.cursor()
 
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            role TEXT DEFAULT 'user',
-            tokens_used_this_month INTEGER DEFAULT 0,
-            tokens_reset_date TEXT DEFAULT CURRENT_TIMESTAMP,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            last_login TEXT DEFAULT CURRENT_TIMESTAMP,
-            is_active INTEGER DEFAULT 1
-        )
-    ''')
-
-    # Conversations table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            title TEXT DEFAULT 'New Chat',
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-
-    # Messages table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            conversation_id INTEGER,
-            role TEXT NOT NULL,
-            content TEXT NOT NULL,
-            tokens_used INTEGER DEFAULT 0,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
-        )
-    ''')
-
-    # Uploaded files table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS uploaded_files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            filename TEXT NOT NULL,
-            file_type TEXT NOT NULL,
-            file_size INTEGER NOT NULL,
-            processed_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-
-    conn.commit()
-
-    # Add role and is_active columns if they don't exist (migration)
-    try:
-        cursor.execute('ALTER TABLE users ADD COLUMN role TEXT DEFAULT "user"')
-        print("[INFO] Added role column to users table")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-
-    try:
-        cursor.execute('ALTER TABLE users ADD COLUMN is_active INTEGER DEFAULT 1')
-        print("[INFO] Added is_active column to users table")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-
-    conn.commit()
+    schema_info = migrate(conn)
+    print(f"[INFO] Database schema v{schema_info['version']} ready in {schema_info['migration_ms']} ms")
 
     # Create or update admin user
     cursor.execute('SELECT id FROM users WHERE email = "admin@srmap.edu.in"')
@@ -230,61 +238,139 @@ async def get_admin_user(current_user: dict = Depends(get_current_user)) -> dict
     if not current_user:
         raise HTTPException(status_code=401, detail="Authentication required")
 
-    if not is_admin(current_user["user_id"]):
+    if not await database.read(is_admin, current_user["user_id"]):
         raise HTTPException(status_code=403, detail="Admin access required")
 
     return current_user
 
-def get_user_tokens_used(user_id: int) -> int:
-    """Get tokens used by user this month"""
-    conn = sqlite3.connect(DATABASE_PATH)
+def read_user_quota(user_id: int) -> Optional[tuple]:
+    """(tokens_used_this_month, tokens_reset_date) as stored for a user, or None"""
+    conn = db_pool.connect()
     cursor = conn.cursor()
 
-    # Check if we need to reset monthly tokens
     cursor.execute('''
         SELECT tokens_used_this_month, tokens_reset_date
         FROM users WHERE id = ?
     ''', (user_id,))
 
     result = cursor.fetchone()
-    if not result:
+    conn.close()
+    return result
+
+# Charges from the quota accountant; a reset replaces last month's count
+QUOTA_CHARGE_SQL = 'UPDATE users SET tokens_used_this_month = tokens_used_this_month + ? WHERE id = ?'
+QUOTA_RESET_SQL = '''
+    UPDATE users
+    SET tokens_used_this_month = ?, tokens_reset_date = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+
+def apply_token_usage(pending: List[tuple]):
+    """Write one flush of the accountant's charges in a single transaction"""
+    conn = db_pool.connect()
+    cursor = conn.cursor()
+
+    cursor.executemany(QUOTA_RESET_SQL, [(tokens, user_id) for user_id, tokens, reset in pending if reset])
+    cursor.executemany(QUOTA_CHARGE_SQL, [(tokens, user_id) for user_id, tokens, reset in pending
+                                          if tokens and not reset])
+
+    conn.commit()
+    conn.close()
+
+def write_token_usage(pending: List[tuple]) -> Future:
+    """Run apply_token_usage on the writer thread; the accountant retries it if the Future fails"""
+    return persistence.submit(functools.partial(apply_token_usage, pending))
+
+async def load_user_quota(user_id: int):
+    """Read a user's stored usage into the accountant, once per process"""
+    if not quota.is_loaded(user_id):
+        row = await database.read(read_user_quota, user_id)
+        if row:
+            quota.load(user_id, *row)
+
+async def user_tokens_used(user_id: int) -> int:
+    """This month's usage, including charges not yet written to the users table"""
+    await load_user_quota(user_id)
+    return quota.used(user_id)
+
+def create_user(email: str, username: str, password_hash: str) -> int:
+    """Insert a new user and return its ID (400 if the email or username is taken)"""
+    conn = db_pool.connect()
+    cursor = conn.cursor()
+
+    # Check if user already exists
+    cursor.execute('SELECT id FROM users WHERE email = ? OR username = ?', (email, username))
+    if cursor.fetchone():
         conn.close()
-        return 0
+        raise HTTPException(status_code=400, detail="User already exists")
 
-    tokens_used, reset_date = result
-    reset_date = datetime.fromisoformat(reset_date)
+    cursor.execute('''
+        INSERT INTO users (email, username, password_hash)
+        VALUES (?, ?, ?)
+    ''', (email, username, password_hash))
 
-    # Reset if it's a new month
-    if reset_date.month != datetime.now().month or reset_date.year != datetime.now().year:
-        cursor.execute('''
-            UPDATE users
-            SET tokens_used_this_month = 0, tokens_reset_date = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (user_id,))
-        conn.commit()
-        tokens_used = 0
+    user_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    return user_id
+
+def get_login_user(email: str) -> Optional[tuple]:
+    """(id, username, password_hash, tokens_used_this_month, role) for an email, or None"""
+    conn = db_pool.connect()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT id, username, password_hash, tokens_used_this_month, role
+        FROM users WHERE email = ?
+    ''', (email,))
 
+    user = cursor.fetchone()
     conn.close()
-    return tokens_used
+    return user
 
-def update_user_tokens(user_id: int, tokens_used: int):
-    """Update user's token usage"""
-    conn = sqlite3.connect(DATABASE_PATH)
+def record_login(user_id: int):
+    """Update last login"""
+    conn = db_pool.connect()
+    cursor = conn.cursor()
+
+    cursor.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user_id,))
+
+    conn.commit()
+    conn.close()
+
+def get_user_profile(user_id: int) -> Optional[tuple]:
+    """(username, email, tokens_used_this_month, created_at, role) for a user, or None"""
+    conn = db_pool.connect()
     cursor = conn.cursor()
 
     cursor.execute('''
-        UPDATE users
-        SET tokens_used_this_month = tokens_used_this_month + ?
-        WHERE id = ?
-    ''', (tokens_used, user_id))
+        SELECT username, email, tokens_used_this_month, created_at, role
+        FROM users WHERE id = ?
+    ''', (user_id,))
+
+    user = cursor.fetchone()
+    conn.close()
+    return user
 
+def record_upload(user_id: int, filename: str, file_type: str, file_size: int) -> int:
+    """Store file info for a signed-in user's upload and return its ID"""
+    conn = db_pool.connect()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        INSERT INTO uploaded_files (user_id, filename, file_type, file_size, processed_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', (user_id, filename, file_type, file_size))
+
+    file_id = cursor.lastrowid
     conn.commit()
     conn.close()
+    return file_id
 
 # --- CONVERSATION FUNCTIONS ---
 def create_conversation(user_id: int, title: str = "New Chat") -> int:
     """Create a new conversation and return its ID"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = db_pool.connect()
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -297,20 +383,48 @@ def create_conversation(user_id: int, title: str = "New Chat") -> int:
     conn.close()
     return conversation_id
 
-def get_user_conversations(user_id: int) -> List[dict]:
-    """Get all conversations for a user"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+def encode_cursor(timestamp: str, row_id: int) -> str:
+    """Opaque pagination cursor for a (timestamp, id) position"""
+    return base64.urlsafe_b64encode(json.dumps([timestamp, row_id]).encode("utf-8")).decode("ascii").rstrip("=")
 
-    cursor.execute('''
-        SELECT id, title, created_at, updated_at
-        FROM conversations
-        WHERE user_id = ?
-        ORDER BY updated_at DESC
-    ''', (user_id,))
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Inverse of encode_cursor; ValueError for anything it did not produce"""
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(timestamp), int(row_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+
+def get_user_conversations(user_id: int, limit: int = CONVERSATIONS_PAGE_SIZE,
+                           cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """One page of a user's conversations, most recently updated first, and the cursor for the next page"""
+    wait_for_queued_writes(("user", user_id))  # updated_at bumps still queued
+    position = decode_cursor(cursor) if cursor else None
+    conn = db_pool.connect()
+    db_cursor = conn.cursor()
+
+    # Keyset pagination on (updated_at, id): idx_conversations_user_updated serves it in order
+    if position:
+        db_cursor.execute('''
+            SELECT id, title, created_at, updated_at
+            FROM conversations
+            WHERE user_id = ? AND (updated_at, id) < (?, ?)
+            ORDER BY updated_at DESC, id DESC
+            LIMIT ?
+        ''', (user_id, *position, limit + 1))
+    else:
+        db_cursor.execute('''
+            SELECT id, title, created_at, updated_at
+            FROM conversations
+            WHERE user_id = ?
+            ORDER BY updated_at DESC, id DESC
+            LIMIT ?
+        ''', (user_id, limit + 1))
+    rows = db_cursor.fetchall()
+    conn.close()
 
     conversations = []
-    for row in cursor.fetchall():
+    for row in rows[:limit]:
         conversations.append({
             "id": row[0],
             "title": row[1],
@@ -318,66 +432,128 @@ def get_user_conversations(user_id: int) -> List[dict]:
             "updated_at": row[3]
         })
 
-    conn.close()
-    return conversations
-
-def get_conversation_messages(conversation_id: int, user_id: int) -> List[dict]:
-    """Get all messages for a conversation"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+    last = conversations[-1] if conversations else None
+    next_cursor = encode_cursor(last["updated_at"], last["id"]) if len(rows) > limit else None
+    return conversations, next_cursor
+
+def get_conversation_messages(conversation_id: int, user_id: int, limit: int = MESSAGES_PAGE_SIZE,
+                              before: Optional[str] = None, after: Optional[str] = None) -> dict:
+    """One page of a conversation's messages, oldest first.
+
+    By default the latest `limit` messages; with `before`, the `limit`
+    messages preceding that cursor (scrolling back); with `after`, the ones
+    following it (catching up). has_more says whether another page exists
+    in the direction being read.
+    """
+    wait_for_queued_writes(("conversation", conversation_id))  # messages still queued
+    position = decode_cursor(after or before) if (after or before) else None
+    page = {"messages": [], "has_more": False, "older_cursor": None, "newer_cursor": after}
+    conn = db_pool.connect()
+    db_cursor = conn.cursor()
 
     # Verify user owns this conversation
-    cursor.execute('''
+    db_cursor.execute('''
         SELECT id FROM conversations
         WHERE id = ? AND user_id = ?
     ''', (conversation_id, user_id))
 
-    if not cursor.fetchone():
+    if not db_cursor.fetchone():
         conn.close()
-        return []
-
-    cursor.execute('''
-        SELECT role, content, tokens_used, created_at
-        FROM messages
-        WHERE conversation_id = ?
-        ORDER BY created_at ASC
-    ''', (conversation_id,))
-
-    messages = []
-    for row in cursor.fetchall():
-        messages.append({
-            "role": row[0],
-            "content": row[1],
-            "tokens_used": row[2],
-            "created_at": row[3]
-        })
-
+        return page
+
+    # Keyset pagination on (created_at, id): idx_messages_conversation_created serves all three
+    if after:
+        db_cursor.execute('''
+            SELECT id, role, content, tokens_used, created_at
+            FROM messages
+            WHERE conversation_id = ? AND (created_at, id) > (?, ?)
+            ORDER BY created_at ASC, id ASC
+            LIMIT ?
+        ''', (conversation_id, *position, limit + 1))
+        rows = db_cursor.fetchall()
+        page["has_more"] = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        if before:
+            db_cursor.execute('''
+                SELECT id, role, content, tokens_used, created_at
+                FROM messages
+                WHERE conversation_id = ? AND (created_at, id) < (?, ?)
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            ''', (conversation_id, *position, limit + 1))
+        else:
+            db_cursor.execute('''
+                SELECT id, role, content, tokens_used, created_at
+                FROM messages
+                WHERE conversation_id = ?
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            ''', (conversation_id, limit + 1))
+        rows = db_cursor.fetchall()
+        page["has_more"] = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
     conn.close()
-    return messages
-
-def save_message(conversation_id: int, role: str, content: str, tokens_used: int = 0):
-    """Save a message to the database"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
 
-    cursor.execute('''
-        INSERT INTO messages (conversation_id, role, content, tokens_used)
-        VALUES (?, ?, ?, ?)
-    ''', (conversation_id, role, content, tokens_used))
-
-    # Update conversation updated_at
-    cursor.execute('''
-        UPDATE conversations
-        SET updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    ''', (conversation_id,))
+    for row in rows:
+        page["messages"].append({
+            "id": row[0],
+            "role": row[1],
+            "content": row[2],
+            "tokens_used": row[3],
+            "created_at": row[4]
+        })
 
-    conn.commit()
-    conn.close()
+    if rows:
+        first, last = rows[0], rows[-1]
+        if after or page["has_more"]:
+            page["older_cursor"] = encode_cursor(first[4], first[0])
+        page["newer_cursor"] = encode_cursor(last[4], last[0])
+    return page
+
+MESSAGE_INSERT_SQL = '''
+    INSERT INTO messages (conversation_id, role, content, tokens_used,
+                          model, prompt_tokens, completion_tokens, prompt_eval_ms, eval_ms, load_ms)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+CONVERSATION_TOUCH_SQL = 'UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE id = ?'
+
+# Message inserts and conversation touches are written in batches by a
+# background thread; readers flush it first.
+persistence = WriteBehindQueue(db_pool.open, touch_sql=CONVERSATION_TOUCH_SQL)
+
+# Endpoints await every helper above through this: reads on a small thread
+# pool, writes on the write-behind thread (the only writer).
+database = DatabaseExecutor(persistence)
+
+# Monthly token usage: checked and charged in memory, flushed to users every few seconds
+quota = QuotaAccountant(write_token_usage)
+
+def message_params(conversation_id: int, role: str, content: str, tokens_used: int,
+                   usage: Optional[dict]) -> tuple:
+    usage = usage or {}
+    return (conversation_id, role, content, tokens_used,
+            *(usage.get(column) for column, _ in MESSAGE_USAGE_COLUMNS))
+
+def queue_message(conversation_id: int, role: str, content: str, tokens_used: int = 0,
+                  usage: Optional[dict] = None, user_id: Optional[int] = None):
+    """Queue a message insert (usage: Ollama metrics for assistant replies).
+
+    The write-behind queue commits it shortly and bumps the conversation's
+    updated_at; reads of the conversation or user wait for it.
+    """
+    keys = [("conversation", conversation_id)] + ([("user", user_id)] if user_id is not None else [])
+    persistence.execute(MESSAGE_INSERT_SQL, message_params(conversation_id, role, content, tokens_used, usage),
+                        touch=conversation_id, keys=keys)
+
+def wait_for_queued_writes(*keys: tuple):
+    """Before a read: wait for the queued writes it would see (not the whole queue)"""
+    if not persistence.wait_for(keys):
+        print(f"[WARNING] Reading {keys} with writes still queued (write-behind is behind)")
 
 def update_conversation_title(conversation_id: int, user_id: int, title: str):
     """Update conversation title"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = db_pool.connect()
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -401,7 +577,7 @@ def generate_conversation_title(first_message: str) -> str:
 # --- ADMIN FUNCTIONS ---
 def is_admin(user_id: int) -> bool:
     """Check if user is admin"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = db_pool.connect()
     cursor = conn.cursor()
 
     cursor.execute('SELECT role FROM users WHERE id = ?', (user_id,))
@@ -412,7 +588,7 @@ def is_admin(user_id: int) -> bool:
 
 def get_all_users() -> List[dict]:
     """Get all users for admin dashboard"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = db_pool.connect()
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -443,7 +619,7 @@ def update_user_role(user_id: int, new_role: str) -> bool:
     if new_role not in ["user", "admin"]:
         return False
 
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = db_pool.connect()
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -457,7 +633,7 @@ def update_user_role(user_id: int, new_role: str) -> bool:
 
 def toggle_user_status(user_id: int) -> bool:
     """Toggle user active/inactive status"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = db_pool.connect()
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -474,49 +650,41 @@ def toggle_user_status(user_id: int) -> bool:
     return success
 
 def get_system_stats() -> dict:
-    """Get system statistics for admin dashboard"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    """Get system statistics for admin dashboard (messages still queued show up a batch later)"""
+    conn = db_pool.connect()
     cursor = conn.cursor()
 
-    # Total users
-    cursor.execute('SELECT COUNT(*) FROM users')
-    total_users = cursor.fetchone()[0]
+    # Totals come from the trigger-maintained rollups (rollups.py), not table scans
+    counters = rollups.read_counters(cursor)
+    tokens_today = rollups.tokens_for_day(cursor)
 
-    # Active users (logged in last 7 days)
+    # Active users (logged in last 7 days), a range on idx_users_last_login
     cursor.execute('''
         SELECT COUNT(*) FROM users
-        WHERE datetime(last_login) > datetime('now', '-7 days')
+        WHERE last_login > datetime('now', '-7 days')
     ''')
     active_users = cursor.fetchone()[0]
 
-    # Total conversations
-    cursor.execute('SELECT COUNT(*) FROM conversations')
-    total_conversations = cursor.fetchone()[0]
-
-    # Total messages
-    cursor.execute('SELECT COUNT(*) FROM messages')
-    total_messages = cursor.fetchone()[0]
-
-    # Tokens used today
-    cursor.execute('''
-        SELECT SUM(tokens_used) FROM messages
-        WHERE date(created_at) = date('now')
-    ''')
-    tokens_today = cursor.fetchone()[0] or 0
-
     conn.close()
 
     return {
-        "total_users": total_users,
+        "total_users": counters["users"],
         "active_users": active_users,
-        "total_conversations": total_conversations,
-        "total_messages": total_messages,
+        "total_conversations": counters["conversations"],
+        "total_messages": counters["messages"],
         "tokens_used_today": tokens_today
     }
 
+def reconcile_stats() -> dict:
+    """Rebuild the admin statistics rollups from the base tables"""
+    conn = db_pool.connect()
+    result = rollups.reconcile(conn)
+    conn.close()
+    return result
+
 def get_all_conversations_admin() -> List[dict]:
-    """Get all conversations for admin monitoring"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    """Get all conversations for admin monitoring (messages still queued show up a batch later)"""
+    conn = db_pool.connect()
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -546,6 +714,87 @@ def get_all_conversations_admin() -> List[dict]:
     conn.close()
     return conversations
 
+# --- ANALYSIS CACHE FUNCTIONS ---
+def normalize_question(question: str) -> str:
+    """Case, spacing and trailing punctuation don't change what is being asked"""
+    return " ".join(question.lower().split()).rstrip(" .?!")
+
+def analysis_cache_key(file_content: str, question: str, file_type: str, model: str) -> Tuple[str, str]:
+    """Return (cache key, content hash) for an analysis request"""
+    content_hash = hashlib.sha256(file_content.encode("utf-8")).hexdigest()
+    key = hashlib.sha256(
+        "\x00".join([content_hash, normalize_question(question), file_type, model]).encode("utf-8")
+    ).hexdigest()
+    return key, content_hash
+
+# Hit bookkeeping for a cached analysis, batched through the write-behind queue
+ANALYSIS_CACHE_TOUCH_SQL = 'UPDATE analysis_cache SET hits = hits + 1, last_used_at = ? WHERE cache_key = ?'
+
+def get_cached_analysis(cache_key: str) -> Optional[dict]:
+    """Cached /analyze-file response for cache_key (read only; see touch_cached_analysis)"""
+    conn = db_pool.connect()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT response FROM analysis_cache WHERE cache_key = ?', (cache_key,))
+    row = cursor.fetchone()
+
+    conn.close()
+    return json.loads(row[0]) if row else None
+
+def touch_cached_analysis(cache_key: str):
+    """Count a cache hit and mark the entry recently used, without waiting for the write"""
+    persistence.execute(ANALYSIS_CACHE_TOUCH_SQL, (time.time(), cache_key))
+
+def store_cached_analysis(cache_key: str, content_hash: str, question: str, file_type: str,
+                          model: str, response: dict):
+    """Cache an analysis, then evict least recently used entries beyond the size bounds"""
+    payload = json.dumps(response)
+    conn = db_pool.connect()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        INSERT OR REPLACE INTO analysis_cache
+            (cache_key, content_hash, question, file_type, model, response, size_bytes, last_used_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (cache_key, content_hash, normalize_question(question), file_type, model, payload,
+          len(payload.encode("utf-8")), time.time()))
+
+    cursor.execute('''
+        DELETE FROM analysis_cache WHERE cache_key IN (
+            SELECT cache_key FROM (
+                SELECT cache_key,
+                       ROW_NUMBER() OVER (ORDER BY last_used_at DESC) AS position,
+                       SUM(size_bytes) OVER (ORDER BY last_used_at DESC ROWS UNBOUNDED PRECEDING) AS running_bytes
+                FROM analysis_cache
+            ) WHERE position > ? OR running_bytes > ?
+        )
+    ''', (ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_MAX_BYTES))
+
+    conn.commit()
+    conn.close()
+
+def purge_analysis_cache() -> int:
+    """Delete every cached analysis and return how many there were"""
+    conn = db_pool.connect()
+    cursor = conn.cursor()
+
+    cursor.execute('DELETE FROM analysis_cache')
+    removed = cursor.rowcount
+
+    conn.commit()
+    conn.close()
+    return removed
+
+def get_analysis_cache_stats() -> dict:
+    conn = db_pool.connect()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT COUNT(*), COALESCE(SUM(size_bytes), 0), COALESCE(SUM(hits), 0) FROM analysis_cache')
+    entries, size_bytes, hits = cursor.fetchone()
+
+    conn.close()
+    return {"entries": entries, "size_bytes": size_bytes, "stored_hits": hits}
+
 # --- SECURITY FUNCTIONS ---
 def get_client_ip(request: Request) -> str:
     """Get client IP address from request"""
@@ -675,12 +924,166 @@ class AdminLogin(BaseModel):
     email: EmailStr
     password: str
 
+def model_options(actual_model: str) -> dict:
+    """Ollama options for every request to a model, preloads included.
+
+    Ollama reloads a model whenever num_ctx changes, so every caller must send
+    the same value from AI_MODELS.
+    """
+    for config in AI_MODELS.values():
+        if config["actual_model"] == actual_model:
+            return {"num_ctx": config["num_ctx"], "num_keep": config["num_keep"]}
+    return {}
+
 # --- INIT ---
 app = FastAPI(title="Mentor Chatbot API", version="3.0.0")
 
 # Initialize file processor
 file_processor = FileProcessor()
 
+# Shared async Ollama client: one keep-alive connection pool per backend,
+# requests routed to the least busy healthy backend
+ollama = OllamaPool(OLLAMA_BACKENDS, hedge_after=OLLAMA_HEDGE_AFTER or None)
+
+# Identical concurrent prompts share one generation
+llm_flights = SingleFlight()
+
+# Preloads every configured model and keeps recently used ones resident
+model_manager = ModelManager(ollama, [config["actual_model"] for config in AI_MODELS.values()], model_options)
+
+def admission_limits(backends: int) -> Tuple[Dict[str, int], int]:
+    """Per-model generation limits, and the default, for this many Ollama backends"""
+    backends = max(1, backends)  # with none up the pool still tries one
+    return ({model: limit * backends for model, limit in MODEL_CONCURRENCY.items()},
+            DEFAULT_MODEL_CONCURRENCY * backends)
+
+def resize_admission(healthy_backends: int):
+    """Follow the pool's health: admit only what the backends that are up can run"""
+    limits, default_limit = admission_limits(healthy_backends)
+    admission.resize(limits, default_limit)
+    print(f"[INFO] {healthy_backends} healthy Ollama backend(s); admission limits now {limits}")
+
+# Limits how many generations each model runs at once
+admission = AdmissionController(
+    *admission_limits(len(ollama.backends)),
+    queue_size=ADMISSION_QUEUE_SIZE,
+    max_wait=ADMISSION_MAX_WAIT
+)
+ollama.on_health_change = resize_admission
+
+# Per-model error rate / latency tracking that decides when to use fallbacks
+circuit_breakers = CircuitBreakers(MODEL_P95_LIMITS)
+
+def generation_priority(is_authenticated: bool, interactive: bool) -> int:
+    if interactive:
+        return PRIORITY_USER_CHAT if is_authenticated else PRIORITY_GUEST_CHAT
+    return PRIORITY_USER_FILE if is_authenticated else PRIORITY_GUEST_FILE
+
+def admission_error(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+
+# Measured tokens/sec and load times per model (see /metrics)
+llm_telemetry = LLMTelemetry()
+
+async def generate_stream(model: str, messages: List[dict], options: Optional[dict] = None,
+                          priority: int = PRIORITY_GUEST_FILE, owner: Optional[str] = None,
+                          probe: bool = False):
+    """Stream a chat completion through admission control.
+
+    Joining an identical generation that is already running costs the model
+    nothing, so those requests skip the queue; the admission slot is held
+    until the generation itself ends. Each generation's outcome
+    goes to the model's circuit breaker once, from the request that started
+    it, and from a half-open probe however it was served. A probe that ends
+    without an outcome (refused, client gone) hands the probe back.
+    """
+    model_manager.record_request(model)
+    key = SingleFlight.key(model, messages, options)
+
+    def start():
+        return ollama.stream_chat(model, messages, options=options, keep_alive=model_manager.keep_alive_for(model))
+
+    requested = time.perf_counter()
+    first_token = None
+    outcome = None  # (ok, first-token latency) once the generation has ended
+    reports = probe
+    ticket = None
+    handed_over = False
+    try:
+        if not llm_flights.running(key):
+            ticket = await admission.acquire(model, priority, owner)
+        if ticket is not None and not llm_flights.running(key):
+            # The slot belongs to the generation, not this request: joined
+            # requests keep it running after the starter goes away.
+            chunks = llm_flights.stream(key, start, on_finish=functools.partial(admission.release, ticket))
+            handed_over = reports = True
+        else:
+            if ticket is not None:
+                admission.release(ticket)  # someone started it while we queued
+            chunks = llm_flights.stream(key, start)
+        async for chunk in chunks:
+            if first_token is None:
+                first_token = time.perf_counter() - requested
+            if chunk.get("done") and handed_over:
+                # Recorded once per generation, by the request that started it
+                llm_telemetry.record(usage_from_response(chunk, model))
+            yield chunk
+        outcome = (True, first_token)
+    except OllamaError:
+        outcome = (False, None)
+        raise
+    finally:
+        if ticket is not None and not handed_over:
+            admission.release(ticket)
+        if reports and outcome is not None:
+            circuit_breakers.record(model, ok=outcome[0], latency=outcome[1])
+        elif probe:
+            circuit_breakers.release_probe(model)
+
+async def generate(model: str, messages: List[dict], options: Optional[dict] = None,
+                   priority: int = PRIORITY_GUEST_FILE, owner: Optional[str] = None) -> dict:
+    """Complete a chat (admission-controlled, coalesced with identical requests)"""
+    return await collect_chat(generate_stream(model, messages, options, priority=priority, owner=owner))
+
+async def summarize_history(prompt: List[dict]) -> str:
+    """Background summary of older turns, on the general model at lowest priority"""
+    model = AI_MODELS["general"]["actual_model"]
+    data = await generate(model, prompt, model_options(model), priority=PRIORITY_BACKGROUND)
+    return data["message"]["content"]
+
+# Keeps long conversations inside each model's context budget
+history_manager = HistoryManager(summarize_history)
+
+# /analyze-file cache lookups since startup
+analysis_cache_counters = {"hits": 0, "misses": 0}
+
+# Running totals of chat pipeline stage timings (ms), for /metrics
+chat_stage_totals = defaultdict(lambda: {"count": 0, "total_ms": 0.0})
+
+# Anything still blocking the event loop shows up as lag on /metrics
+loop_monitor = LoopLagMonitor()
+
+@app.on_event("startup")
+async def start_model_manager():
+    global kb_watcher
+    await ollama.start()
+    await model_manager.start()
+    await loop_monitor.start()
+    await quota.start()
+    kb_watcher = asyncio.ensure_future(watch_knowledge_base())
+
+@app.on_event("shutdown")
+async def close_ollama_client():
+    if kb_watcher is not None:
+        kb_watcher.cancel()
+    await loop_monitor.stop()
+    await model_manager.stop()
+    await ollama.close()
+    await quota.stop()  # queues the last token charges before the writer drains
+    await asyncio.to_thread(database.close)
+    await asyncio.to_thread(persistence.close)
+    db_pool.close()
+
 # Initialize database
 init_database()
 
@@ -700,20 +1103,76 @@ app.add_middleware(
 model = SentenceTransformer(EMBEDDING_MODEL)
 
 # --- LOAD VECTOR STORE ---
-if os.path.exists(VECTOR_STORE_PATH) and os.path.exists(DOCS_STORE_PATH):
-    index = faiss.read_index(VECTOR_STORE_PATH)
-    docs = np.load(DOCS_STORE_PATH, allow_pickle=True).tolist()
+def current_kb_version() -> Optional[str]:
+    """Name of the live knowledge-base build, or None for the legacy files"""
+    try:
+        with open(KB_CURRENT_PATH, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def load_vector_store(version: Optional[str]):
+    """Load (index, docs) for a kb/ version, falling back to the legacy paths"""
+    base = os.path.join(KB_DIR, version) if version else "."
+    index_path = os.path.join(base, VECTOR_STORE_PATH)
+    docs_path = os.path.join(base, DOCS_STORE_PATH)
+    if os.path.exists(index_path) and os.path.exists(docs_path):
+        return faiss.read_index(index_path), np.load(docs_path, allow_pickle=True).tolist()
+    return None
+
+kb_lock = threading.Lock()
+kb_version = current_kb_version()
+kb_watcher: Optional[asyncio.Task] = None
+loaded = load_vector_store(kb_version)
+if not loaded:
+    kb_version = None
+    loaded = load_vector_store(None)
+if loaded:
+    index, docs = loaded
 else:
     index = faiss.IndexFlatL2(384)
     docs = []
     print("[WARNING] FAISS index or docs store not found. Please run ingest.py first.")
 
+def reload_index_if_newer():
+    """Swap in a newer knowledge-base build published by refresh.py.
+
+    Runs in a worker thread: the FAISS and docs load happens outside
+    kb_lock, and searches only wait for the swap itself.
+    """
+    global index, docs, kb_version
+    version = current_kb_version()
+    if not version or version == kb_version:
+        return
+    try:
+        loaded = load_vector_store(version)
+    except Exception as e:
+        print(f"[ERROR] Failed to load knowledge base {version}: {e}")
+        return
+    if not loaded:
+        return
+    with kb_lock:
+        index, docs = loaded
+        kb_version = version
+    print(f"[INFO] Knowledge base reloaded: {version} ({len(docs)} chunks)")
+
+async def watch_knowledge_base():
+    """Look for a newer build every KB_RELOAD_CHECK_INTERVAL, off the request path"""
+    while True:
+        await asyncio.sleep(KB_RELOAD_CHECK_INTERVAL)
+        try:
+            await asyncio.to_thread(reload_index_if_newer)
+        except Exception as e:
+            print(f"[ERROR] Knowledge base check failed: {e}")
+
 def search_index(query, top_k=4):
-    if index.ntotal == 0:
+    with kb_lock:
+        current_index, current_docs = index, docs
+    if current_index.ntotal == 0:
         return []
     q_emb = model.encode([query]).astype(np.float32)
-    D, I = index.search(q_emb, top_k)
-    return [docs[i] for i in I[0] if i < len(docs)]
+    D, I = current_index.search(q_emb, top_k)
+    return [current_docs[i] for i in I[0] if 0 <= i < len(current_docs)]
 
 def is_university_question(user_input):
     university_keywords = [
@@ -728,25 +1187,9 @@ def is_university_question(user_input):
 async def register(user_data: UserRegister):
     """Register a new user"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-
-        # Check if user already exists
-        cursor.execute('SELECT id FROM users WHERE email = ? OR username = ?',
-                      (user_data.email, user_data.username))
-        if cursor.fetchone():
-            raise HTTPException(status_code=400, detail="User already exists")
-
-        # Hash password and create user
-        password_hash = hash_password(user_data.password)
-        cursor.execute('''
-            INSERT INTO users (email, username, password_hash)
-            VALUES (?, ?, ?)
-        ''', (user_data.email, user_data.username, password_hash))
-
-        user_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        # Hash password (bcrypt is deliberately slow: keep it off the event loop) and create user
+        password_hash = await asyncio.to_thread(hash_password, user_data.password)
+        user_id = await database.write(create_user, user_data.email, user_data.username, password_hash)
 
         # Create JWT token
         token = create_jwt_token(user_id, user_data.email)
@@ -772,25 +1215,14 @@ async def register(user_data: UserRegister):
 async def login(user_data: UserLogin):
     """Login user"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-
         # Get user
-        cursor.execute('''
-            SELECT id, username, password_hash, tokens_used_this_month, role
-            FROM users WHERE email = ?
-        ''', (user_data.email,))
-
-        user = cursor.fetchone()
-        if not user or not verify_password(user_data.password, user[2]):
+        user = await database.read(get_login_user, user_data.email)
+        if not user or not await asyncio.to_thread(verify_password, user_data.password, user[2]):
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
-        user_id, username, _, tokens_used, role = user
-
-        # Update last login
-        cursor.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user_id,))
-        conn.commit()
-        conn.close()
+        user_id, username, _, _, role = user
+        await database.write(record_login, user_id)
+        tokens_used = await user_tokens_used(user_id)
 
         # Create JWT token
         token = create_jwt_token(user_id, user_data.email)
@@ -821,20 +1253,12 @@ async def get_current_user_info(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=401, detail="Not authenticated")
 
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT username, email, tokens_used_this_month, created_at, role
-            FROM users WHERE id = ?
-        ''', (current_user["user_id"],))
-
-        user = cursor.fetchone()
+        user = await database.read(get_user_profile, current_user["user_id"])
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
-        username, email, tokens_used, created_at, role = user
-        conn.close()
+        username, email, _, created_at, role = user
+        tokens_used = await user_tokens_used(current_user["user_id"])
 
         return JSONResponse(content={
             "user": {
@@ -855,15 +1279,33 @@ async def get_current_user_info(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail="Failed to get user info")
 
 # --- CONVERSATION ENDPOINTS ---
+def check_cursors(*cursors: Optional[str]):
+    """400 for a pagination cursor this server did not issue"""
+    for cursor in cursors:
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @app.get("/conversations")
-async def get_conversations(current_user: dict = Depends(get_current_user)):
-    """Get all conversations for the current user"""
+async def get_conversations(
+    limit: int = Query(CONVERSATIONS_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """A page of the current user's conversations, most recently updated first.
+
+    Pass the returned next_cursor as `cursor` for the next page (null when there is none).
+    """
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
+    check_cursors(cursor)
 
     try:
-        conversations = get_user_conversations(current_user["user_id"])
-        return JSONResponse(content={"conversations": conversations})
+        conversations, next_cursor = await database.read(get_user_conversations, current_user["user_id"],
+                                                         limit, cursor)
+        return JSONResponse(content={"conversations": conversations, "next_cursor": next_cursor})
     except Exception as e:
         print(f"[ERROR] Get conversations failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get conversations")
@@ -878,7 +1320,8 @@ async def create_new_conversation(
         raise HTTPException(status_code=401, detail="Not authenticated")
 
     try:
-        conversation_id = create_conversation(
+        conversation_id = await database.write(
+            create_conversation,
             current_user["user_id"],
             conversation_data.title
         )
@@ -893,15 +1336,26 @@ async def create_new_conversation(
 @app.get("/conversations/{conversation_id}/messages")
 async def get_conversation_messages_endpoint(
     conversation_id: int,
+    limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all messages for a specific conversation"""
+    """A page of a conversation's messages, oldest first: the latest `limit` by default.
+
+    Pass older_cursor as `before` to scroll back, or newer_cursor as `after`
+    to fetch messages added since.
+    """
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    check_cursors(before, after)
 
     try:
-        messages = get_conversation_messages(conversation_id, current_user["user_id"])
-        return JSONResponse(content={"messages": messages})
+        page = await database.read(get_conversation_messages, conversation_id, current_user["user_id"],
+                                   limit, before, after)
+        return JSONResponse(content=page)
     except Exception as e:
         print(f"[ERROR] Get conversation messages failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get messages")
@@ -917,7 +1371,8 @@ async def update_conversation_title_endpoint(
         raise HTTPException(status_code=401, detail="Not authenticated")
 
     try:
-        update_conversation_title(
+        await database.write(
+            update_conversation_title,
             conversation_id,
             current_user["user_id"],
             conversation_data.title
@@ -932,25 +1387,13 @@ async def update_conversation_title_endpoint(
 async def admin_login(admin_data: AdminLogin):
     """Admin login with separate authentication"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-
         # Get admin user
-        cursor.execute('''
-            SELECT id, username, password_hash, role
-            FROM users WHERE email = ? AND role = 'admin'
-        ''', (admin_data.email,))
-
-        user = cursor.fetchone()
-        if not user or not verify_password(admin_data.password, user[2]):
+        user = await database.read(get_login_user, admin_data.email)
+        if not user or user[4] != "admin" or not await asyncio.to_thread(verify_password, admin_data.password, user[2]):
             raise HTTPException(status_code=401, detail="Invalid admin credentials")
 
-        user_id, username, _, role = user
-
-        # Update last login
-        cursor.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user_id,))
-        conn.commit()
-        conn.close()
+        user_id, username, _, _, role = user
+        await database.write(record_login, user_id)
 
         # Create JWT token
         token = create_jwt_token(user_id, admin_data.email)
@@ -976,17 +1419,30 @@ async def admin_login(admin_data: AdminLogin):
 async def get_admin_stats(admin_user: dict = Depends(get_admin_user)):
     """Get system statistics for admin dashboard"""
     try:
-        stats = get_system_stats()
+        stats = await database.read(get_system_stats)
         return JSONResponse(content={"stats": stats})
     except Exception as e:
         print(f"[ERROR] Get admin stats failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get statistics")
 
+@app.post("/admin/stats/reconcile")
+async def reconcile_admin_stats(admin_user: dict = Depends(get_admin_user)):
+    """Recount the statistics rollups from scratch (admin only)"""
+    try:
+        result = await database.write(reconcile_stats)
+        if result["counter_drift"] or result["days_corrected"]:
+            print(f"[WARNING] Statistics rollups had drifted: {result['counter_drift']}, "
+                  f"{len(result['days_corrected'])} day(s) corrected")
+        return JSONResponse(content={"message": "Statistics reconciled", **result})
+    except Exception as e:
+        print(f"[ERROR] Reconcile stats failed: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to reconcile statistics")
+
 @app.get("/admin/users")
 async def get_all_users_admin(admin_user: dict = Depends(get_admin_user)):
     """Get all users for admin management"""
     try:
-        users = get_all_users()
+        users = await database.read(get_all_users)
         return JSONResponse(content={"users": users})
     except Exception as e:
         print(f"[ERROR] Get all users failed: {str(e)}")
@@ -1000,7 +1456,7 @@ async def update_user_role_endpoint(
 ):
     """Update user role (admin only)"""
     try:
-        success = update_user_role(user_id, role_data.role)
+        success = await database.write(update_user_role, user_id, role_data.role)
         if success:
             return JSONResponse(content={"message": f"User role updated to {role_data.role}"})
         else:
@@ -1018,7 +1474,7 @@ async def toggle_user_status_endpoint(
 ):
     """Toggle user active/inactive status"""
     try:
-        success = toggle_user_status(user_id)
+        success = await database.write(toggle_user_status, user_id)
         if success:
             return JSONResponse(content={"message": "User status toggled successfully"})
         else:
@@ -1029,11 +1485,21 @@ async def toggle_user_status_endpoint(
         print(f"[ERROR] Toggle user status failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to toggle user status")
 
+@app.delete("/admin/analysis-cache")
+async def purge_analysis_cache_endpoint(admin_user: dict = Depends(get_admin_user)):
+    """Drop all cached file analyses (admin only)"""
+    try:
+        removed = await database.write(purge_analysis_cache)
+        return JSONResponse(content={"message": f"Removed {removed} cached analyses", "removed": removed})
+    except Exception as e:
+        print(f"[ERROR] Purge analysis cache failed: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to purge analysis cache")
+
 @app.get("/admin/conversations")
 async def get_all_conversations_admin_endpoint(admin_user: dict = Depends(get_admin_user)):
     """Get all conversations for admin monitoring"""
     try:
-        conversations = get_all_conversations_admin()
+        conversations = await database.read(get_all_conversations_admin)
         return JSONResponse(content={"conversations": conversations})
     except Exception as e:
         print(f"[ERROR] Get admin conversations failed: {str(e)}")
@@ -1063,8 +1529,9 @@ async def upload_file(
             auth_msg = "Sign up for 10MB limit!" if not current_user else ""
             raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {limit_mb}MB. {auth_msg}")
 
-        # Process the file
-        result = file_processor.process_file(
+        # Process the file (CPU-bound parsing/OCR, so in a worker thread)
+        result = await asyncio.to_thread(
+            file_processor.process_file,
             file_content=file_content,
             filename=file.filename,
             file_type=file.content_type
@@ -1076,17 +1543,8 @@ async def upload_file(
         # Store file info in database (optional, only for logged in users)
         file_id = None
         if user_id:
-            conn = sqlite3.connect(DATABASE_PATH)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                INSERT INTO uploaded_files (user_id, filename, file_type, file_size, processed_at)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (user_id, file.filename, result["file_type"], result["file_size"]))
-
-            file_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            file_id = await database.write(record_upload, user_id, file.filename,
+                                           result["file_type"], result["file_size"])
 
         return JSONResponse(content={
             "message": "File processed successfully",
@@ -1144,32 +1602,69 @@ async def analyze_file_with_ai(
         model_config = AI_MODELS.get("general", AI_MODELS["general"])
         selected_model = model_config["actual_model"]
 
-        payload = {
-            "model": selected_model,
-            "messages": messages,
-            "stream": False
-        }
-
-        # Make API request to Ollama
-        response = requests.post(
-            OLLAMA_API_URL,
-            json=payload,
-            headers={"Content-Type": "application/json"},
-            timeout=120
-        )
-
-        if response.status_code == 200:
-            data = response.json()
-            answer = data["message"]["content"]
-
-            return JSONResponse(content={
-                "analysis": answer,
-                "file_type": file_type,
-                "model_used": model_config["model"]
-            })
-        else:
+        # Same file, same question, same model: reuse the earlier answer
+        cache_key, content_hash = analysis_cache_key(file_content, question, file_type, selected_model)
+        cached = await database.read(get_cached_analysis, cache_key)
+        if cached is not None:
+            touch_cached_analysis(cache_key)
+            analysis_cache_counters["hits"] += 1
+            return JSONResponse(content={**cached, "cached": True})
+        analysis_cache_counters["misses"] += 1
+
+        priority = generation_priority(current_user is not None, interactive=False)
+        owner = str(current_user["user_id"]) if current_user else None
+        options = model_options(selected_model)
+        prompt_budget = model_config["num_ctx"] - RESPONSE_TOKEN_RESERVE
+
+        try:
+            if sum(estimate_tokens(m["content"]) for m in messages) <= prompt_budget:
+                data = await generate(selected_model, messages, options, priority=priority, owner=owner)
+                answer = data["message"]["content"]
+                coverage = {"mode": "single_pass"}
+            else:
+                # Too big for one prompt: analyze it in parts and merge the results
+                async def complete(chunk_messages: List[dict], chunk_options: dict) -> str:
+                    # No owner: the parts of one upload run side by side on purpose
+                    data = await generate(selected_model, chunk_messages, {**options, **chunk_options},
+                                          priority=priority)
+                    return data["message"]["content"]
+
+                analysis = MapReduceAnalysis(
+                    complete, system_prompt,
+                    chunk_tokens=prompt_budget - ANALYSIS_PROMPT_OVERHEAD,
+                    concurrency=min(ANALYSIS_MAP_CONCURRENCY, admission.limit_for(selected_model))
+                )
+                # The user's one-at-a-time slot covers the whole analysis, not each part
+                if owner is not None:
+                    admission.hold_owner(selected_model, owner)
+                try:
+                    answer = await analysis.run(file_content, file_type, question)
+                finally:
+                    if owner is not None:
+                        admission.release_owner(owner)
+                coverage = {
+                    "mode": "map_reduce",
+                    "chunks_total": analysis.chunks_total,
+                    "chunks_analyzed": analysis.chunks_analyzed,
+                    "partial": analysis.chunks_analyzed < analysis.chunks_total
+                }
+        except AdmissionRejected as e:
+            raise admission_error(e)
+        except (OllamaError, RuntimeError) as e:
+            print(f"[ERROR] Ollama API failed: {e}")
             raise HTTPException(status_code=503, detail="AI analysis service unavailable")
 
+        result = {
+            "analysis": answer,
+            "file_type": file_type,
+            "model_used": model_config["model"],
+            **coverage
+        }
+        if not coverage.get("partial"):
+            await database.write(store_cached_analysis, cache_key, content_hash, question,
+                                 file_type, selected_model, result)
+        return JSONResponse(content={**result, "cached": False})
+
     except HTTPException:
         raise
     except Exception as e:
@@ -1177,8 +1672,44 @@ async def analyze_file_with_ai(
         raise HTTPException(status_code=500, detail="File analysis failed")
 
 # --- CHAT ENDPOINT ---
-@app.post("/chat")
-async def chat(req: ChatRequest, request: Request, current_user: dict = Depends(get_current_user)):
+def elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+def record_chat_timings(timings: dict):
+    for stage, ms in timings.items():
+        totals = chat_stage_totals[stage]
+        totals["count"] += 1
+        totals["total_ms"] += ms
+
+def chat_conversation_stage(user_id: int, user_message: str, timings: dict) -> int:
+    """Create the conversation row for a new chat (only once the quota check passed)"""
+    start = time.perf_counter()
+    title = generate_conversation_title(user_message)
+    conversation_id = create_conversation(user_id, title)
+    timings["conversation"] = elapsed_ms(start)
+    return conversation_id
+
+def chat_retrieval_stage(user_message: str, timings: dict) -> List[dict]:
+    """Keyword gate, then query embedding and FAISS search"""
+    start = time.perf_counter()
+    is_university = is_university_question(user_message)
+    timings["keyword_gate"] = elapsed_ms(start)
+    if not is_university:
+        return []
+    start = time.perf_counter()
+    context_chunks = search_index(user_message)
+    timings["retrieval"] = elapsed_ms(start)
+    return context_chunks
+
+async def prepare_chat(req: ChatRequest, request: Request, current_user: Optional[dict]) -> dict:
+    """Rate-limit and quota-check a chat request and build its Ollama prompt.
+
+    The SQLite work (quota, new conversation) and retrieval (embedding, FAISS)
+    are independent, so they run side by side in worker threads.
+    """
+    prepare_start = time.perf_counter()
+    timings = {}
+
     # Rate limiting check
     client_ip = get_client_ip(request)
     if is_rate_limited(client_ip):
@@ -1187,148 +1718,253 @@ async def chat(req: ChatRequest, request: Request, current_user: dict = Depends(
             detail="Rate limit exceeded. Please try again later."
         )
 
-    try:
-        # Check token limits
-        is_authenticated = current_user is not None
-        if is_authenticated:
-            user_id = current_user["user_id"]
-            tokens_used = get_user_tokens_used(user_id)
-            token_limit = TOKEN_LIMITS["user"]
+    # Get user message (already validated by pydantic)
+    user_message = req.messages[-1]["content"]
+
+    is_authenticated = current_user is not None
+    user_id = current_user["user_id"] if is_authenticated else None
+    retrieval = asyncio.to_thread(chat_retrieval_stage, user_message, timings)
+    reservation = None
+    if is_authenticated:
+        # Check and hold the quota in memory; SQLite is only read the first time
+        token_limit = TOKEN_LIMITS["user"]
+        start = time.perf_counter()
+        await load_user_quota(user_id)
+        try:
+            reservation = quota.reserve(user_id, estimate_tokens(user_message) + RESPONSE_TOKEN_RESERVE,
+                                        token_limit)
+        except QuotaExceeded:
+            retrieval.close()  # never started
+            raise HTTPException(
+                status_code=429,
+                detail=f"Monthly token limit ({token_limit}) exceeded. Limit resets next month."
+            )
+        timings["quota"] = elapsed_ms(start)
 
-            if tokens_used >= token_limit:
-                raise HTTPException(
-                    status_code=429,
-                    detail=f"Monthly token limit ({token_limit}) exceeded. Limit resets next month."
+        try:
+            if req.conversation_id:
+                conversation_id = req.conversation_id
+                context_chunks = await retrieval
+            else:
+                conversation_id, context_chunks = await asyncio.gather(
+                    database.write(chat_conversation_stage, user_id, user_message, timings),
+                    retrieval
                 )
-        else:
-            # Guest user - IP-based daily tracking
-            token_limit = TOKEN_LIMITS["guest"]
+        except BaseException:
+            quota.release(reservation)
+            raise
+    else:
+        # Guest user - IP-based daily tracking (in memory, no need for a thread)
+        token_limit = TOKEN_LIMITS["guest"]
+        conversation_id = None
 
-            # Estimate tokens for this request
-            user_message = req.messages[-1]["content"]
-            estimated_tokens = len(user_message.split()) * 2  # Rough estimate including response
+        # Estimate tokens for this request
+        estimated_tokens = len(user_message.split()) * 2  # Rough estimate including response
 
-            # Check if guest would exceed daily limit
-            if is_guest_limit_exceeded(client_ip, estimated_tokens):
-                raise HTTPException(
-                    status_code=429,
-                    detail={
-                        "error": "daily_limit_exceeded",
-                        "message": f"Daily limit of {token_limit} tokens exceeded. Sign up for 80,000 tokens/month!",
-                        "tokens_used": get_guest_tokens_used(client_ip),
-                        "tokens_limit": token_limit,
-                        "reset_time": "midnight"
-                    }
-                )
+        # Check if guest would exceed daily limit
+        if is_guest_limit_exceeded(client_ip, estimated_tokens):
+            retrieval.close()  # never started
+            raise HTTPException(
+                status_code=429,
+                detail={
+                    "error": "daily_limit_exceeded",
+                    "message": f"Daily limit of {token_limit} tokens exceeded. Sign up for 80,000 tokens/month!",
+                    "tokens_used": get_guest_tokens_used(client_ip),
+                    "tokens_limit": token_limit,
+                    "reset_time": "midnight"
+                }
+            )
+        context_chunks = await retrieval
 
-        # Get user message (already validated by pydantic)
-        user_message = req.messages[-1]["content"]
+    context = "\n".join([c["text"] for c in context_chunks])
+    context_type = "university" if context_chunks else "general"
 
-        # Handle conversation for authenticated users
-        conversation_id = None
-        if is_authenticated:
-            if req.conversation_id:
-                # Use existing conversation
-                conversation_id = req.conversation_id
-            else:
-                # Create new conversation
-                title = generate_conversation_title(user_message)
-                conversation_id = create_conversation(user_id, title)
-
-        # University context retrieval
-        context_chunks = []
-        context_type = "general"
-        if is_university_question(user_message):
-            context_chunks = search_index(user_message)
-            context = "\n".join([c["text"] for c in context_chunks])
-            context_type = "university" if context_chunks else "general"
-        else:
-            context = ""
+    # Select AI model based on task type
+    model_config = AI_MODELS.get(req.task_type, AI_MODELS["general"])
 
-        # Select AI model based on task type
-        model_config = AI_MODELS.get(req.task_type, AI_MODELS["general"])
-        selected_model = model_config["actual_model"]
-        display_model = model_config["model"]
-
-        # System prompt
-        system_prompt = (
-            "You are Mentor, a caring and supportive AI teacher for SRM University AP students, created by Kommi Nithin.\n"
-            "- Always greet back warmly when someone says hi/hello (like 'Hi there! 😊' or 'Hello! Great to see you!')\n"
-            "- Be like a friendly, encouraging teacher who genuinely cares about students\n"
-            "- Use warm, supportive language with appropriate emojis\n"
-            "- Always be positive, encouraging, and ready to help with anything\n"
-            "- Show enthusiasm for helping students learn and grow\n"
-            "- Be conversational and approachable, never formal or distant\n"
-            "- Make every student feel valued and supported\n"
-            "- Respond with the warmth and care of a favorite teacher"
-        )
-        if context:
-            system_prompt += f"\n\nContext:\n{context}"
-
-        # Prepare Ollama API request
-        payload = {
-            "model": selected_model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                *req.messages
-            ],
-            "stream": False
-        }
-        headers = {
-            "Content-Type": "application/json"
-        }
+    # Fit the history to the model's context window
+    start = time.perf_counter()
+    history_key = f"conversation:{conversation_id}" if conversation_id else \
+        f"guest:{client_ip}:{hashlib.sha1(req.messages[0]['content'].encode('utf-8')).hexdigest()}"
+    history_budget = model_config["num_ctx"] - RESPONSE_TOKEN_RESERVE - \
+        estimate_tokens(MENTOR_SYSTEM_PROMPT) - estimate_tokens(context)
+    history = history_manager.fit(history_key, req.messages, history_budget)
+    timings["history"] = elapsed_ms(start)
+    timings["prepare_total"] = elapsed_ms(prepare_start)
 
-        # Make API request to Ollama
-        response = requests.post(
-            OLLAMA_API_URL,
-            json=payload,
-            headers=headers,
-            timeout=120  # Increased timeout for model loading
-        )
+    return {
+        "client_ip": client_ip,
+        "is_authenticated": is_authenticated,
+        "user_id": user_id,
+        "token_limit": token_limit,
+        "reservation": reservation,
+        "user_message": user_message,
+        "conversation_id": conversation_id,
+        "context_chunks": context_chunks,
+        "context_type": context_type,
+        "selected_model": model_config["actual_model"],
+        "display_model": model_config["model"],
+        "fallback_model": model_config.get("fallback_model"),
+        "fallback_used": False,
+        "priority": generation_priority(is_authenticated, interactive=True),
+        "owner": str(user_id) if is_authenticated else None,
+        "options": model_options(model_config["actual_model"]),
+        "messages": build_chat_messages(history, context),
+        "timings": timings
+    }
 
-        if response.status_code == 200:
-            data = response.json()
-            answer = data["message"]["content"]
+def display_name(actual_model: str) -> str:
+    """The men.0x name we show for an Ollama model"""
+    for config in AI_MODELS.values():
+        if config["actual_model"] == actual_model:
+            return config["model"]
+    return actual_model
+
+def chat_models(chat_ctx: dict) -> List[str]:
+    """Models to try for a chat, in order: the task's model, then its fallback"""
+    models = [chat_ctx["selected_model"]]
+    if chat_ctx["fallback_model"] and chat_ctx["fallback_model"] != chat_ctx["selected_model"]:
+        models.append(chat_ctx["fallback_model"])
+    return models
+
+def precheck_chat_admission(chat_ctx: dict):
+    """Raise AdmissionRejected unless the chat's model or its fallback would be admitted"""
+    rejection = None
+    for model in chat_models(chat_ctx):
+        try:
+            admission.check(model, chat_ctx["priority"], chat_ctx["owner"])
+            return
+        except AdmissionRejected as e:
+            if e.status_code == 429:
+                raise
+            rejection = e
+    raise rejection
+
+async def generate_chat(chat_ctx: dict):
+    """Stream the chat's answer, moving to the fallback model when the primary
+    is tripped, busy, or fails before producing anything.
+
+    chat_ctx["selected_model"] / ["display_model"] end up naming the model
+    that actually served the answer.
+    """
+    models = chat_models(chat_ctx)
+    for i, model in enumerate(models):
+        last = i == len(models) - 1
+        # Asked for every model, so a fallback-only model's breaker still moves on to half-open
+        allowed = circuit_breakers.allow(model)
+        if not allowed and not last:
+            continue
+        probe = allowed and circuit_breakers.probing(model)
+        if model != models[0]:
+            chat_ctx["selected_model"] = model
+            chat_ctx["display_model"] = display_name(model)
+            chat_ctx["fallback_used"] = True
+        started = False
+        try:
+            async for chunk in generate_stream(model, chat_ctx["messages"], chat_ctx["options"],
+                                               priority=chat_ctx["priority"], owner=chat_ctx["owner"],
+                                               probe=probe):
+                started = True
+                yield chunk
+            return
+        except (OllamaError, AdmissionRejected) as e:
+            if started or last or getattr(e, "status_code", None) == 429:
+                raise
+            print(f"[WARNING] {model} unavailable ({e}); falling back to {models[i + 1]}")
+
+def charge_chat_tokens(chat_ctx: dict, tokens_used: int) -> int:
+    """Charge tokens to the user or guest IP and return what they have left"""
+    if chat_ctx["is_authenticated"]:
+        return chat_ctx["token_limit"] - quota.settle(chat_ctx["reservation"], tokens_used)
+    update_guest_tokens(chat_ctx["client_ip"], tokens_used)
+    return chat_ctx["token_limit"] - get_guest_tokens_used(chat_ctx["client_ip"])
+
+def release_chat_quota(chat_ctx: dict):
+    """Let go of the quota held for a request that was not charged (no-op once it was)"""
+    if chat_ctx["reservation"] is not None:
+        quota.release(chat_ctx["reservation"])
+
+def billable_tokens(user_message: str, answer: str, usage: Optional[dict] = None) -> int:
+    """Tokens charged for one exchange: the student's message plus the generated answer.
+
+    The answer is counted by Ollama when it reports eval_count. Persona,
+    history and retrieved context are server-side and not billed.
+    """
+    if usage and usage.get("completion_tokens") is not None:
+        return estimate_tokens(user_message) + usage["completion_tokens"]
+    return estimate_tokens(user_message) + (estimate_tokens(answer) if answer else 0)
+
+def persist_chat(chat_ctx: dict, answer: str, tokens_used: int, usage: Optional[dict] = None):
+    """Queue the exchange on the write-behind queue (returns at once)"""
+    try:
+        conversation_id = chat_ctx["conversation_id"]
+        if conversation_id:
+            user_id = chat_ctx["user_id"]
+            queue_message(conversation_id, "user", chat_ctx["user_message"], 0, user_id=user_id)
+            queue_message(conversation_id, "assistant", answer, tokens_used, usage, user_id=user_id)
+    except Exception as e:
+        print(f"[ERROR] Saving chat failed: {str(e)}")
 
-            # Calculate tokens used (approximate)
-            tokens_used_estimate = len(user_message.split()) + len(answer.split())
+def finish_chat(chat_ctx: dict, answer: str, usage: Optional[dict] = None) -> Tuple[dict, Callable[[], None]]:
+    """Charge the exchange and build the /chat response body, plus the persistence
+    step to run before it is sent"""
+    user_message = chat_ctx["user_message"]
 
-            # Update user tokens if authenticated
-            if is_authenticated:
-                update_user_tokens(user_id, tokens_used_estimate)
-                remaining_tokens = token_limit - get_user_tokens_used(user_id)
+    tokens_used = billable_tokens(user_message, answer, usage)
+    remaining_tokens = charge_chat_tokens(chat_ctx, tokens_used)
+    conversation_id = chat_ctx["conversation_id"]
+    persist = functools.partial(persist_chat, chat_ctx, answer, tokens_used, usage)
+    record_chat_timings(chat_ctx["timings"])
 
-                # Save messages to conversation
-                if conversation_id:
-                    save_message(conversation_id, "user", user_message, 0)
-                    save_message(conversation_id, "assistant", answer, tokens_used_estimate)
-            else:
-                # Update guest tokens
-                update_guest_tokens(client_ip, tokens_used_estimate)
-                remaining_tokens = token_limit - get_guest_tokens_used(client_ip)
-
-            # If university context, append citation
-            if context_type == "university" and context_chunks:
-                source_url = context_chunks[0]["source"]
-                answer += f"\n\nLearn more: [{source_url}]({source_url})"
-
-            return JSONResponse(content={
-                "answer": answer,
-                "context_type": context_type,
-                "sources_used": len(context_chunks),
-                "tokens_used": tokens_used_estimate,
-                "tokens_remaining": max(0, remaining_tokens),
-                "model_used": display_model,
-                "is_authenticated": is_authenticated,
-                "conversation_id": conversation_id
-            })
-        else:
-            # Log error for debugging
-            print(f"[ERROR] Ollama API failed: {response.status_code} - {response.text}")
-            raise HTTPException(
-                status_code=503,
-                detail="AI service temporarily unavailable. Please try again."
-            )
+    # If university context, append citation
+    context_chunks = chat_ctx["context_chunks"]
+    if chat_ctx["context_type"] == "university" and context_chunks:
+        source_url = context_chunks[0]["source"]
+        answer += f"\n\nLearn more: [{source_url}]({source_url})"
+
+    return {
+        "answer": answer,
+        "context_type": chat_ctx["context_type"],
+        "sources_used": len(context_chunks),
+        "tokens_used": tokens_used,
+        "usage": usage,
+        "tokens_remaining": max(0, remaining_tokens),
+        "model_used": chat_ctx["display_model"],
+        "served_by": chat_ctx["selected_model"],
+        "fallback_used": chat_ctx["fallback_used"],
+        "is_authenticated": chat_ctx["is_authenticated"],
+        "conversation_id": conversation_id,
+        "timings": chat_ctx["timings"]
+    }, persist
+
+@app.post("/chat")
+async def chat(req: ChatRequest, request: Request, current_user: dict = Depends(get_current_user)):
+    try:
+        chat_ctx = await prepare_chat(req, request, current_user)
+
+        try:
+            # Make API request to Ollama
+            try:
+                start = time.perf_counter()
+                data = await collect_chat(generate_chat(chat_ctx))
+                chat_ctx["timings"]["generation"] = elapsed_ms(start)
+            except AdmissionRejected as e:
+                raise admission_error(e)
+            except OllamaError as e:
+                # Log error for debugging
+                print(f"[ERROR] Ollama API failed: {e}")
+                raise HTTPException(
+                    status_code=503,
+                    detail="AI service temporarily unavailable. Please try again."
+                )
+
+            usage = usage_from_response(data, chat_ctx["selected_model"])
+            body, persist = finish_chat(chat_ctx, data["message"]["content"], usage)
+        finally:
+            release_chat_quota(chat_ctx)  # no-op once finish_chat has charged it
+        # Queued before answering, so the client's next read waits for it
+        persist()
+        return JSONResponse(content=body)
 
     except HTTPException:
         # Re-raise HTTP exceptions (rate limiting, validation errors)
@@ -1341,6 +1977,107 @@ async def chat(req: ChatRequest, request: Request, current_user: dict = Depends(
             detail="An unexpected error occurred. Please try again."
         )
 
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest, request: Request, current_user: dict = Depends(get_current_user)):
+    """Streaming variant of /chat.
+
+    Emits `meta` once, with the first generated chunk (only then is the
+    serving model known, fallback included), a `token` event per generated
+    piece (the citation is sent as the last token), then `done` with the same
+    body /chat returns. Failures after the stream has started arrive as an
+    `error` event.
+    """
+    try:
+        chat_ctx = await prepare_chat(req, request, current_user)
+        # Fail fast with a real status code before the event stream starts
+        try:
+            precheck_chat_admission(chat_ctx)
+        except BaseException:
+            release_chat_quota(chat_ctx)
+            raise
+    except AdmissionRejected as e:
+        raise admission_error(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Unexpected error in chat stream endpoint: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="An unexpected error occurred. Please try again."
+        )
+
+    async def events():
+        parts = []
+        final_chunk = None
+        persist = None
+        try:
+            try:
+                start = time.perf_counter()
+                async for chunk in generate_chat(chat_ctx):
+                    if "first_token" not in chat_ctx["timings"]:
+                        chat_ctx["timings"]["first_token"] = elapsed_ms(start)
+                        # generate_chat has settled on a model by now
+                        yield sse_event("meta", {
+                            "conversation_id": chat_ctx["conversation_id"],
+                            "model_used": chat_ctx["display_model"],
+                            "served_by": chat_ctx["selected_model"],
+                            "fallback_used": chat_ctx["fallback_used"],
+                            "context_type": chat_ctx["context_type"],
+                            "sources_used": len(chat_ctx["context_chunks"]),
+                            "is_authenticated": chat_ctx["is_authenticated"]
+                        })
+                    if chunk.get("done"):
+                        final_chunk = chunk
+                    token = chunk.get("message", {}).get("content", "")
+                    if token:
+                        parts.append(token)
+                        yield sse_event("token", {"content": token})
+            except AdmissionRejected as e:
+                yield sse_event("error", {
+                    "status": e.status_code,
+                    "detail": e.reason,
+                    "retry_after": e.retry_after
+                })
+                return
+            except OllamaError as e:
+                print(f"[ERROR] Ollama API failed: {e}")
+                yield sse_event("error", {
+                    "status": 503,
+                    "detail": "AI service temporarily unavailable. Please try again."
+                })
+                return
+
+            chat_ctx["timings"]["generation"] = elapsed_ms(start)
+            answer = "".join(parts)
+            usage = usage_from_response(final_chunk, chat_ctx["selected_model"]) if final_chunk else None
+            result, persist = finish_chat(chat_ctx, answer, usage)
+            # Queued before `done`, so the client's next read waits for it
+            persist()
+
+            citation = result["answer"][len(answer):]
+            if citation:
+                yield sse_event("token", {"content": citation})
+            yield sse_event("done", result)
+        finally:
+            if persist is None and parts:
+                # Client went away mid-answer: still charge for what was generated.
+                charge_chat_tokens(chat_ctx, billable_tokens(chat_ctx["user_message"], "".join(parts)))
+            release_chat_quota(chat_ctx)
+
+    # events() releases the hold in its finally, but a stream the client drops
+    # before the first chunk never runs it. This runs once the response ends,
+    # and the accountant's hold expiry catches anything that skips both.
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release_chat_quota, chat_ctx)
+    )
+
 # --- HEALTH CHECK ENDPOINT ---
 @app.get("/health")
 async def health_check():
@@ -1353,7 +2090,9 @@ async def health_check():
             "rate_limiting": True,
             "cors_security": True,
             "error_handling": True
-        }
+        },
+        "models": model_manager.state(),
+        "ollama": ollama.stats()
     }
 
 # --- METRICS ENDPOINT ---
@@ -1364,5 +2103,22 @@ async def get_metrics():
         "active_rate_limits": len(rate_limit_storage),
         "blocked_ips": len(blocked_ips),
         "vector_store_docs": len(docs) if docs else 0,
-        "faiss_index_size": index.ntotal if index else 0
+        "faiss_index_size": index.ntotal if index else 0,
+        "knowledge_base_version": kb_version,
+        "llm_coalescing": llm_flights.stats(),
+        "admission": admission.stats(),
+        "circuit_breakers": circuit_breakers.stats(),
+        "write_behind": persistence.stats(),
+        "db_pool": db_pool.stats(),
+        "db_executor": database.stats(),
+        "event_loop_lag": loop_monitor.stats(),
+        "quota": quota.stats(),
+        "schema": schema_info,
+        "analysis_cache": {**analysis_cache_counters, **(await database.read(get_analysis_cache_stats))},
+        "chat_stages_avg_ms": {
+            stage: round(totals["total_ms"] / totals["count"], 2)
+            for stage, totals in chat_stage_totals.items() if totals["count"]
+        },
+        "history": history_manager.stats(),
+        "llm": llm_telemetry.stats()
     }
\ No newline at end of file
@@ -0,0 +1,327 @@
+"""Microbenchmarks for the per-request CPU work in main.py, ingest.py and file_processor.py.
+
+Each benchmark reports ops/sec plus, from a separate tracemalloc pass, the
+memory still held after each call (retained, not total allocated) and the
+peak while the calls run. Results are compared against a stored baseline and
+anything slower (or hungrier) than --threshold is flagged as a regression;
+the exit code is 1 if there are any.
+
+    python microbench.py --stub-encoder --save-baseline    # record microbench_baseline.json
+    python microbench.py --stub-encoder                     # compare against it
+    python microbench.py --filter process_                  # only the file handlers
+
+--stub-encoder swaps sentence-transformers for a deterministic hash-based
+encoder, so the suite runs offline and search_index measures FAISS search
+and our own overhead rather than the embedding model. The app is imported
+inside a temporary directory, so its SQLite file and knowledge base are
+throwaway fixtures.
+"""
+import io
+import os
+import sys
+import json
+import time
+import zlib
+import types
+import random
+import argparse
+import tempfile
+import platform
+import tracemalloc
+from typing import Callable, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BACKEND_DIR, "microbench_baseline.json")
+EMBEDDING_DIM = 384
+INDEX_SIZE = 5000          # synthetic knowledge-base chunks
+MIN_TIME = 0.5             # seconds of timed calls per benchmark
+ALLOC_CALLS = 5            # calls traced by tracemalloc
+REGRESSION_THRESHOLD = 0.2
+
+
+def install_stub_encoder():
+    """Register a fake sentence_transformers module before anything imports the real one"""
+    import numpy as np
+
+    class StubSentenceTransformer:
+        def __init__(self, name=None, *args, **kwargs):
+            self.name = name
+
+        def encode(self, sentences, *args, **kwargs):
+            if isinstance(sentences, str):
+                sentences = [sentences]
+            vectors = [
+                np.random.default_rng(zlib.crc32(s.encode("utf-8"))).standard_normal(EMBEDDING_DIM)
+                for s in sentences
+            ]
+            return np.asarray(vectors, dtype=np.float32)
+
+    module = types.ModuleType("sentence_transformers")
+    module.SentenceTransformer = StubSentenceTransformer
+    sys.modules["sentence_transformers"] = module
+
+
+# --- Fixtures ---
+WORDS = ("student semester course exam lecture campus faculty credits assignment syllabus "
+         "graph sorting database network python function variable loop recursion").split()
+
+
+def make_text(words: int, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    lines, line = [], []
+    for i in range(words):
+        line.append(rng.choice(WORDS))
+        if len(line) == 12:
+            lines.append(" ".join(line) + ".")
+            line = []
+    return "\n".join(lines + [" ".join(line)])
+
+
+def make_pdf(pages: int) -> bytes:
+    """Smallest valid multi-page PDF with one line of Helvetica text per page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for p in range(pages):
+        text = make_text(20, seed=p).replace("\n", " ")[:90]
+        stream = f"BT /F1 11 Tf 50 750 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def make_docx(paragraphs: int) -> bytes:
+    from docx import Document
+    doc = Document()
+    for p in range(paragraphs):
+        doc.add_paragraph(make_text(40, seed=p))
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def make_xlsx(rows: int) -> bytes:
+    import openpyxl
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["id", "name", "course", "marks"])
+    for r in range(rows):
+        sheet.append([r, f"student{r}", WORDS[r % len(WORDS)], r % 100])
+    out = io.BytesIO()
+    workbook.save(out)
+    return out.getvalue()
+
+
+def make_png(width: int = 800, height: int = 200) -> bytes:
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", (width, height), "white")
+    ImageDraw.Draw(image).text((10, 80), "Lecture 4: sorting algorithms and recursion", fill="black")
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def make_code(functions: int) -> bytes:
+    body = "".join(
+        f"def handler_{i}(items):\n    total = 0\n    for item in items:\n"
+        f"        if item % {i + 2} == 0:\n            total += item\n    return total\n\n"
+        for i in range(functions)
+    )
+    return ("import os\nimport sys\n\n" + body + "class Runner:\n    pass\n").encode()
+
+
+def make_csv(rows: int) -> bytes:
+    return ("id,name,course,marks\n" + "".join(
+        f"{r},student{r},{WORDS[r % len(WORDS)]},{r % 100}\n" for r in range(rows))).encode()
+
+
+def make_json(items: int) -> bytes:
+    return json.dumps({"students": [{"id": i, "courses": WORDS[:i % 5 + 1], "gpa": i % 10} for i in range(items)]}).encode()
+
+
+def make_markdown(sections: int) -> bytes:
+    return "".join(f"# Unit {s}\n\n{make_text(80, seed=s)}\n\n[notes](https://srmap.edu.in/{s})\n\n"
+                   for s in range(sections)).encode()
+
+
+# --- Suite ---
+def build_suite(stub_encoder: bool) -> Dict[str, Callable[[], object]]:
+    sys.path.insert(0, BACKEND_DIR)
+    workdir = tempfile.mkdtemp(prefix="microbench-")
+    os.chdir(workdir)  # main.py creates chatbot.db and looks for kb/ in the cwd
+
+    import numpy as np
+    import faiss
+    import main
+    import ingest
+    from file_processor import FileProcessor
+
+    # Synthetic knowledge base so search_index has real work to do
+    rng = np.random.default_rng(0)
+    main.index = faiss.IndexFlatL2(EMBEDDING_DIM)
+    main.index.add(rng.standard_normal((INDEX_SIZE, EMBEDDING_DIM)).astype(np.float32))
+    main.docs = [{"text": make_text(60, seed=i), "source": f"https://srmap.edu.in/{i}"} for i in range(INDEX_SIZE)]
+
+    messages = [{"role": "user" if i % 2 == 0 else "assistant", "content": make_text(60, seed=i)}
+                for i in range(main.MAX_MESSAGES_PER_REQUEST)]
+    user_text = "Can you explain the students' exam schedule for this semester's database course? " * 10
+    token = main.create_jwt_token(42, "student@srmap.edu.in")
+    long_text = make_text(30000)
+    processor = FileProcessor()
+    fixtures = {
+        "pdf": make_pdf(20),
+        "docx": make_docx(100),
+        "xlsx": make_xlsx(500),
+        "png": make_png(),
+        "code": make_code(100),
+        "csv": make_csv(2000),
+        "json": make_json(500),
+        "markdown": make_markdown(30),
+        "text": make_text(20000).encode(),
+    }
+
+    return {
+        "sanitize_input": lambda: main.sanitize_input(user_text),
+        "validate_messages": lambda: main.validate_messages(messages),
+        "is_university_question": lambda: main.is_university_question(user_text),
+        "search_index": lambda: main.search_index("When is the database exam this semester?"),
+        "chunk_text": lambda: ingest.chunk_text(long_text),
+        "jwt_encode": lambda: main.create_jwt_token(42, "student@srmap.edu.in"),
+        "jwt_verify": lambda: main.verify_jwt_token(token),
+        "process_pdf": lambda: processor.process_pdf(fixtures["pdf"], "notes.pdf"),
+        "process_docx": lambda: processor.process_docx(fixtures["docx"], "notes.docx"),
+        "process_excel": lambda: processor.process_excel(fixtures["xlsx"], "marks.xlsx"),
+        "process_image": lambda: processor.process_image(fixtures["png"], "slide.png"),
+        "process_code": lambda: processor.process_code(fixtures["code"], "handlers.py"),
+        "process_csv": lambda: processor.process_csv(fixtures["csv"], "marks.csv"),
+        "process_json": lambda: processor.process_json(fixtures["json"], "students.json"),
+        "process_markdown": lambda: processor.process_markdown(fixtures["markdown"], "units.md"),
+        "process_text": lambda: processor.process_text(fixtures["text"], "notes.txt"),
+    }
+
+
+def measure(fn: Callable[[], object], min_time: float) -> dict:
+    result = fn()  # warm-up, also surfaces handler errors
+    error = result.get("error") if isinstance(result, dict) else None
+
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    batch = 1
+    while elapsed < min_time:
+        for _ in range(batch):
+            fn()
+        calls += batch
+        elapsed = time.perf_counter() - start
+        batch = min(batch * 2, 1000)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    for _ in range(ALLOC_CALLS):
+        fn()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    retained = sum(s.size_diff for s in stats if s.size_diff > 0)
+    blocks = sum(s.count_diff for s in stats if s.count_diff > 0)
+
+    return {
+        "ops_per_sec": round(calls / elapsed, 2),
+        "us_per_op": round(elapsed / calls * 1e6, 2),
+        "retained_kb_per_op": round(retained / ALLOC_CALLS / 1024, 2),
+        "retained_blocks_per_op": round(blocks / ALLOC_CALLS, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "error": error,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if r["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append(f"{name}: {r['ops_per_sec']} ops/s vs baseline {base['ops_per_sec']}")
+        if base.get("peak_kb") and r["peak_kb"] > base["peak_kb"] * (1 + threshold) and r["peak_kb"] - base["peak_kb"] > 64:
+            regressions.append(f"{name}: peak {r['peak_kb']} KB vs baseline {base['peak_kb']} KB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for backend hot paths")
+    parser.add_argument("--stub-encoder", action="store_true", help="run offline with a hash-based fake encoder")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="seconds of timed calls per benchmark")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="flag results this fraction worse than baseline (default: 0.2)")
+    args = parser.parse_args()
+
+    if args.stub_encoder:
+        install_stub_encoder()
+    suite = build_suite(args.stub_encoder)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("stub_encoder") != args.stub_encoder:
+            print("[WARNING] Baseline was recorded with a different encoder setting; comparing anyway")
+        baseline = stored.get("results", {})
+
+    results = {}
+    print(f"{'benchmark':<24}{'ops/sec':>12}{'us/op':>12}{'KB/op':>10}{'peak KB':>10}  vs baseline")
+    for name, fn in suite.items():
+        if args.filter not in name:
+            continue
+        r = measure(fn, args.min_time)
+        results[name] = r
+        base = baseline.get(name)
+        change = f"{(r['ops_per_sec'] / base['ops_per_sec'] - 1) * 100:+.1f}%" if base else "-"
+        note = f"  ({r['error']})" if r["error"] else ""
+        print(f"{name:<24}{r['ops_per_sec']:>12}{r['us_per_op']:>12}{r['retained_kb_per_op']:>10}"
+              f"{r['peak_kb']:>10}  {change}{note}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "stub_encoder": args.stub_encoder,
+                "environment": {"python": platform.python_version(), "machine": platform.machine(),
+                                "cpus": os.cpu_count()},
+                "results": results,
+            }, f, indent=2)
+        print(f"\n[INFO] Baseline written to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n[WARNING] {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for line in regressions:
+            print(f"  - {line}")
+        sys.exit(1)
+    if baseline:
+        print(f"\n[INFO] No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import time
+import sqlite3
+from typing import Callable, List, Tuple
+from rollups import rebuild as rebuild_rollups
+
+# Ollama's measured usage for assistant messages
+MESSAGE_USAGE_COLUMNS = [
+    ("model", "TEXT"),
+    ("prompt_tokens", "INTEGER"),
+    ("completion_tokens", "INTEGER"),
+    ("prompt_eval_ms", "REAL"),
+    ("eval_ms", "REAL"),
+    ("load_ms", "REAL"),
+]
+
+
+def add_column(cursor: sqlite3.Cursor, table: str, column: str, column_type: str):
+    """ALTER TABLE ADD COLUMN unless the column is already there"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+
+def base_schema(cursor: sqlite3.Cursor):
+    # Databases created before versioning already have some or all of this,
+    # so every step is safe to repeat.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT DEFAULT 'user',
+            tokens_used_this_month INTEGER DEFAULT 0,
+            tokens_reset_date TEXT DEFAULT CURRENT_TIMESTAMP,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            last_login TEXT DEFAULT CURRENT_TIMESTAMP,
+            is_active INTEGER DEFAULT 1
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            title TEXT DEFAULT 'New Chat',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id INTEGER,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            tokens_used INTEGER DEFAULT 0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS uploaded_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            processed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    # File analysis results, reused for identical uploads and questions
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            cache_key TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            question TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            model TEXT NOT NULL,
+            response TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            hits INTEGER DEFAULT 0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            last_used_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache (last_used_at)')
+
+    add_column(cursor, 'users', 'role', "TEXT DEFAULT 'user'")
+    add_column(cursor, 'users', 'is_active', 'INTEGER DEFAULT 1')
+    for column, column_type in MESSAGE_USAGE_COLUMNS:
+        add_column(cursor, 'messages', column, column_type)
+
+
+def hot_query_indexes(cursor: sqlite3.Cursor):
+    # A conversation's messages in order
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_conversation_created
+        ON messages (conversation_id, created_at, id)
+    ''')
+    # A user's conversation list, most recently updated first
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversations_user_updated
+        ON conversations (user_id, updated_at, id)
+    ''')
+    # Time-range queries such as today's token usage
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_created ON messages (created_at)')
+    cursor.execute('ANALYZE')
+
+
+def stats_rollups(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_token_usage (
+            day TEXT PRIMARY KEY,
+            tokens INTEGER NOT NULL DEFAULT 0,
+            messages INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    for table in ("users", "conversations", "messages"):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_insert AFTER INSERT ON {table}
+            BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = '{table}';
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_delete AFTER DELETE ON {table}
+            BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = '{table}';
+            END
+        ''')
+
+    # Daily buckets follow date(created_at) in UTC, like CURRENT_TIMESTAMP
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_messages_daily_insert AFTER INSERT ON messages
+        BEGIN
+            INSERT INTO daily_token_usage (day, tokens, messages)
+            VALUES (date(NEW.created_at), COALESCE(NEW.tokens_used, 0), 1)
+            ON CONFLICT (day) DO UPDATE SET tokens = tokens + excluded.tokens, messages = messages + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_messages_daily_delete AFTER DELETE ON messages
+        BEGIN
+            UPDATE daily_token_usage
+            SET tokens = tokens - COALESCE(OLD.tokens_used, 0), messages = messages - 1
+            WHERE day = date(OLD.created_at);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_messages_daily_update AFTER UPDATE OF tokens_used, created_at ON messages
+        BEGIN
+            UPDATE daily_token_usage
+            SET tokens = tokens - COALESCE(OLD.tokens_used, 0), messages = messages - 1
+            WHERE day = date(OLD.created_at);
+            INSERT INTO daily_token_usage (day, tokens, messages)
+            VALUES (date(NEW.created_at), COALESCE(NEW.tokens_used, 0), 1)
+            ON CONFLICT (day) DO UPDATE SET tokens = tokens + excluded.tokens, messages = messages + 1;
+        END
+    ''')
+
+    # Active users are a time window, not a running total: index the range instead
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_last_login ON users (last_login)')
+
+    # Backfill from what is already there
+    rebuild_rollups(cursor)
+
+
+# (version, description, step); append new steps, never edit applied ones.
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "base schema", base_schema),
+    (2, "indexes for message history, conversation lists and daily usage", hot_query_indexes),
+    (3, "trigger-maintained counters and daily token buckets for admin stats", stats_rollups),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn) -> dict:
+    """Apply pending migrations, each in its own transaction together with
+    its PRAGMA user_version bump. Returns what was done and how long it took."""
+    start = time.perf_counter()
+    from_version = schema_version(conn)
+    if from_version > SCHEMA_VERSION:
+        print(f"[WARNING] Database schema v{from_version} is newer than this code (v{SCHEMA_VERSION})")
+
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= from_version:
+            continue
+        step_start = time.perf_counter()
+        conn.execute('BEGIN')
+        try:
+            step(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            print(f"[ERROR] Migration {version} ({description}) failed")
+            raise
+        elapsed_ms = round((time.perf_counter() - step_start) * 1000, 2)
+        applied.append({"version": version, "description": description, "ms": elapsed_ms})
+        print(f"[INFO] Applied migration {version}: {description} ({elapsed_ms} ms)")
+
+    conn.execute('PRAGMA optimize')
+    return {
+        "from_version": from_version,
+        "version": schema_version(conn),
+        "applied": applied,
+        "migration_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
@@ -0,0 +1,147 @@
+import re
+import time
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Union
+from ollama_client import OllamaClient, OllamaError
+from ollama_pool import OllamaPool
+
+# Warm-keeping
+CHECK_INTERVAL = 60            # seconds between /api/ps polls
+MIN_KEEP_ALIVE = 10 * 60       # never ask for less than this (seconds)
+MAX_KEEP_ALIVE = 2 * 60 * 60   # or more than this
+KEEP_ALIVE_GAP_FACTOR = 3      # keep a model loaded for 3x its typical idle gap
+TRAFFIC_WINDOW = 60 * 60       # inter-arrival gaps are measured over the last hour
+MAX_TRACKED_REQUESTS = 500
+PRELOAD_TIMEOUT = 180          # cold loads of the bigger models can be slow
+
+
+def parse_ollama_time(value: Optional[str]) -> Optional[float]:
+    """Ollama timestamps carry nanoseconds; trim to what datetime understands"""
+    if not value:
+        return None
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value).replace("Z", "+00:00")
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+class ModelManager:
+    """Preloads the configured Ollama models and keeps the busy ones resident"""
+
+    def __init__(self, client: Union[OllamaClient, OllamaPool], models: List[str],
+                 options: Optional[Callable[[str], dict]] = None):
+        self.client = client
+        self.options = options  # model -> the Ollama options its chats use (num_ctx)
+        self.models = list(dict.fromkeys(models))
+        self.requests: Dict[str, deque] = {m: deque(maxlen=MAX_TRACKED_REQUESTS) for m in self.models}
+        self.loaded: Dict[str, dict] = {}
+        self.installed: Optional[List[str]] = None
+        self.last_load_seconds: Dict[str, float] = {}
+        self.last_error: Optional[str] = None
+        self.last_check: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def record_request(self, model: str):
+        """Note a generation so keep_alive follows real traffic"""
+        self.requests.setdefault(model, deque(maxlen=MAX_TRACKED_REQUESTS)).append(time.time())
+
+    def keep_alive_for(self, model: str) -> int:
+        """Seconds Ollama should keep model loaded after its last request"""
+        now = time.time()
+        stamps = [t for t in self.requests.get(model, ()) if now - t <= TRAFFIC_WINDOW]
+        if len(stamps) < 2:
+            return MIN_KEEP_ALIVE
+        gaps = sorted(b - a for a, b in zip(stamps, stamps[1:]))
+        typical_gap = gaps[int(len(gaps) * 0.9) - 1] if len(gaps) >= 10 else gaps[-1]
+        return int(min(MAX_KEEP_ALIVE, max(MIN_KEEP_ALIVE, typical_gap * KEEP_ALIVE_GAP_FACTOR)))
+
+    async def preload(self, model: str):
+        """Load model into memory (on every backend when client is a pool)"""
+        start = time.perf_counter()
+        options = self.options(model) if self.options else None
+        load_seconds = await self.client.load(model, keep_alive=self.keep_alive_for(model), timeout=PRELOAD_TIMEOUT,
+                                              options=options)
+        self.last_load_seconds[model] = load_seconds if load_seconds is not None else time.perf_counter() - start
+        print(f"[INFO] Model {model} warm ({self.last_load_seconds[model]:.1f}s load)")
+
+    async def refresh_state(self):
+        """Read which models Ollama has installed and which are loaded right now"""
+        tags = await self.client.get_json("/api/tags")
+        self.installed = [m.get("name") for m in tags.get("models", [])]
+        ps = await self.client.get_json("/api/ps")
+        self.loaded = {
+            m.get("name"): {"expires_at": parse_ollama_time(m.get("expires_at")), "size_vram": m.get("size_vram")}
+            for m in ps.get("models", [])
+        }
+        self.last_check = time.time()
+
+    def _needs_ping(self, model: str) -> bool:
+        stamps = self.requests.get(model)
+        recently_used = bool(stamps) and time.time() - stamps[-1] < self.keep_alive_for(model)
+        info = self.loaded.get(model)
+        if info is None:
+            # Unloaded while still in use (evicted, Ollama restart): reload it.
+            return recently_used
+        expires_at = info.get("expires_at")
+        expiring = expires_at is not None and expires_at - time.time() < 2 * CHECK_INTERVAL
+        return recently_used and expiring
+
+    async def _run(self):
+        first_pass = True
+        while True:
+            try:
+                await self.refresh_state()
+                for model in self.models:
+                    if self.installed is not None and model not in self.installed:
+                        continue
+                    # Everything is preloaded once at startup; afterwards only
+                    # models with recent traffic are kept from expiring.
+                    if (first_pass and model not in self.loaded) or (not first_pass and self._needs_ping(model)):
+                        await self.preload(model)
+                if first_pass:
+                    await self.refresh_state()
+                first_pass = False
+                self.last_error = None
+            except OllamaError as e:
+                self.last_error = str(e)
+                print(f"[WARNING] Model manager: {e}")
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"[ERROR] Model manager failed: {e}")
+            await asyncio.sleep(CHECK_INTERVAL)
+
+    def state(self) -> dict:
+        now = time.time()
+        models = {}
+        for model in self.models:
+            info = self.loaded.get(model)
+            stamps = self.requests.get(model)
+            models[model] = {
+                "installed": None if self.installed is None else model in self.installed,
+                "loaded": info is not None,
+                "expires_in": round(info["expires_at"] - now) if info and info.get("expires_at") else None,
+                "keep_alive": self.keep_alive_for(model),
+                "last_request_age": round(now - stamps[-1]) if stamps else None,
+                "last_load_seconds": round(self.last_load_seconds[model], 2) if model in self.last_load_seconds else None,
+            }
+        return {
+            "models": models,
+            "last_check_age": round(now - self.last_check) if self.last_check else None,
+            "error": self.last_error,
+        }
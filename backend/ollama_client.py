@@ -0,0 +1,209 @@
+import json
+import time
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional
+import httpx
+
+# Connection pool (shared by every request in the worker)
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16
+KEEPALIVE_EXPIRY = 60  # seconds an idle connection stays open
+
+# Per-call timeouts (seconds)
+CONNECT_TIMEOUT = 5
+FIRST_BYTE_TIMEOUT = 90   # connect -> first token; covers a cold model load
+TOTAL_TIMEOUT = 120       # whole generation
+
+
+class OllamaError(Exception):
+    """A failed Ollama call, classified so callers can react per failure kind.
+
+    kind is one of: "connect", "first_byte_timeout", "total_timeout",
+    "http", "model", "protocol".
+    """
+
+    def __init__(self, kind: str, message: str, model: Optional[str] = None,
+                 status_code: Optional[int] = None, elapsed: Optional[float] = None):
+        super().__init__(message)
+        self.kind = kind
+        self.message = message
+        self.model = model
+        self.status_code = status_code
+        self.elapsed = elapsed
+
+    @property
+    def is_timeout(self) -> bool:
+        return self.kind in ("first_byte_timeout", "total_timeout")
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "message": self.message,
+            "model": self.model,
+            "status_code": self.status_code,
+            "elapsed": round(self.elapsed, 3) if self.elapsed is not None else None,
+        }
+
+    def __str__(self):
+        status = f" {self.status_code}" if self.status_code else ""
+        return f"{self.kind}{status} ({self.model or 'no model'}): {self.message}"
+
+
+class OllamaClient:
+    """Async Ollama API client over one keep-alive connection pool"""
+
+    def __init__(self, base_url: str, connect_timeout: float = CONNECT_TIMEOUT,
+                 first_byte_timeout: float = FIRST_BYTE_TIMEOUT, total_timeout: float = TOTAL_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.first_byte_timeout = first_byte_timeout
+        self.total_timeout = total_timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created lazily so the client binds to the running event loop.
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(None, connect=self.connect_timeout, pool=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+                headers={"Content-Type": "application/json"},
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_json(self, path: str, timeout: float = 5) -> dict:
+        """GET a small JSON endpoint such as /api/tags or /api/ps"""
+        try:
+            response = await self._http().get(path, timeout=timeout)
+        except httpx.TransportError as e:
+            raise OllamaError("connect", str(e) or type(e).__name__)
+        if response.status_code != 200:
+            raise OllamaError("http", response.text[:200], status_code=response.status_code)
+        return response.json()
+
+    async def stream_chat(self, model: str, messages: List[dict], options: Optional[dict] = None,
+                          keep_alive: Optional[str] = None, first_byte_timeout: Optional[float] = None,
+                          total_timeout: Optional[float] = None) -> AsyncIterator[Dict]:
+        """Yield Ollama's /api/chat chunks as they arrive; the last has done=True"""
+        payload = {"model": model, "messages": messages, "stream": True}
+        if options:
+            payload["options"] = options
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+
+        first_byte_timeout = first_byte_timeout or self.first_byte_timeout
+        total_timeout = total_timeout or self.total_timeout
+        start = time.perf_counter()
+        deadline = start + total_timeout
+        first_byte = True
+
+        def wait_budget():
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise OllamaError("total_timeout", f"no complete answer within {total_timeout}s",
+                                  model=model, elapsed=time.perf_counter() - start)
+            return min(remaining, first_byte_timeout) if first_byte else remaining
+
+        def timed_out():
+            elapsed = time.perf_counter() - start
+            if first_byte and elapsed < total_timeout:
+                return OllamaError("first_byte_timeout", f"no response within {first_byte_timeout}s",
+                                   model=model, elapsed=elapsed)
+            return OllamaError("total_timeout", f"no complete answer within {total_timeout}s",
+                               model=model, elapsed=elapsed)
+
+        client = self._http()
+        request = client.build_request("POST", "/api/chat", json=payload)
+        try:
+            response = await asyncio.wait_for(client.send(request, stream=True), timeout=wait_budget())
+        except asyncio.TimeoutError:
+            raise timed_out()
+        except httpx.TransportError as e:
+            raise OllamaError("connect", str(e) or type(e).__name__, model=model,
+                              elapsed=time.perf_counter() - start)
+
+        try:
+            if response.status_code != 200:
+                body = (await response.aread()).decode("utf-8", errors="replace")
+                raise OllamaError("http", _error_message(body), model=model,
+                                  status_code=response.status_code, elapsed=time.perf_counter() - start)
+
+            lines = response.aiter_lines()
+            while True:
+                try:
+                    line = await asyncio.wait_for(lines.__anext__(), timeout=wait_budget())
+                except StopAsyncIteration:
+                    raise OllamaError("protocol", "stream ended before done", model=model,
+                                      elapsed=time.perf_counter() - start)
+                except asyncio.TimeoutError:
+                    raise timed_out()
+                except httpx.TransportError as e:
+                    raise OllamaError("connect", str(e) or type(e).__name__, model=model,
+                                      elapsed=time.perf_counter() - start)
+                if not line.strip():
+                    continue
+                first_byte = False
+                try:
+                    chunk = json.loads(line)
+                except ValueError:
+                    raise OllamaError("protocol", f"invalid JSON line: {line[:100]}", model=model)
+                if "error" in chunk:
+                    raise OllamaError("model", chunk["error"], model=model, elapsed=time.perf_counter() - start)
+                yield chunk
+                if chunk.get("done"):
+                    return
+        finally:
+            await response.aclose()
+
+    async def chat(self, model: str, messages: List[dict], options: Optional[dict] = None,
+                   keep_alive: Optional[str] = None, first_byte_timeout: Optional[float] = None,
+                   total_timeout: Optional[float] = None) -> dict:
+        """Complete a chat and return it in Ollama's non-streaming response shape.
+
+        Streams under the hood so the first-byte timeout means "first token"
+        rather than "whole answer".
+        """
+        return await collect_chat(self.stream_chat(model, messages, options=options, keep_alive=keep_alive,
+                                                   first_byte_timeout=first_byte_timeout,
+                                                   total_timeout=total_timeout))
+
+    async def load(self, model: str, keep_alive: Optional[int] = None, timeout: Optional[float] = None,
+                   options: Optional[dict] = None) -> Optional[float]:
+        """Load model into memory (an empty chat only loads, it generates nothing).
+
+        Pass the options later chats will use: Ollama reloads a model whose
+        num_ctx differs from the one it was loaded with.
+        Returns Ollama's reported load time in seconds, if it sent one.
+        """
+        data = await self.chat(model, [], options=options, keep_alive=keep_alive,
+                               first_byte_timeout=timeout, total_timeout=timeout)
+        load_ns = data.get("load_duration")
+        return load_ns / 1e9 if load_ns else None
+
+
+async def collect_chat(chunks: AsyncIterator[Dict]) -> dict:
+    """Fold streamed /api/chat chunks into the non-streaming response shape"""
+    parts = []
+    final = {}
+    async for chunk in chunks:
+        parts.append(chunk.get("message", {}).get("content", ""))
+        if chunk.get("done"):
+            final = dict(chunk)
+    final["message"] = {"role": "assistant", "content": "".join(parts)}
+    return final
+
+
+def _error_message(body: str) -> str:
+    try:
+        return json.loads(body).get("error", body)[:300]
+    except (ValueError, AttributeError):
+        return body[:300]
@@ -0,0 +1,313 @@
+import time
+import asyncio
+from typing import AsyncIterator, Callable, Dict, List, Optional
+from ollama_client import OllamaClient, OllamaError, collect_chat
+
+HEALTH_CHECK_INTERVAL = 10   # seconds between /api/ps polls of every backend
+HEALTH_CHECK_TIMEOUT = 3
+COLD_LOAD_PENALTY = 2        # routing treats a cold model like 2 extra queued requests
+
+
+class Backend:
+    """One Ollama server in the pool and what we last learned about it"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.client = OllamaClient(url)
+        self.healthy = True  # optimistic until the first check says otherwise
+        self.outstanding = 0
+        self.installed: Optional[set] = None
+        self.loaded: set = set()
+        self.requests = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_check: Optional[float] = None
+
+    def mark_failed(self, error: str):
+        self.healthy = False
+        self.failures += 1
+        self.last_error = error
+
+    def can_serve(self, model: str) -> bool:
+        return self.installed is None or model in self.installed
+
+    def cost(self, model: str) -> int:
+        return self.outstanding + (0 if model in self.loaded else COLD_LOAD_PENALTY)
+
+
+class OllamaPool:
+    """Routes Ollama calls across several servers.
+
+    Backends are health-checked in the background (/api/tags and /api/ps,
+    which also tell us where each model is installed and loaded). A chat goes
+    to the healthy backend with the fewest outstanding requests, preferring
+    ones that already have the model loaded. Connection failures before the
+    first byte are retried on the next backend. With hedge_after set, a chat
+    whose first byte is later than that is re-issued to a second backend and
+    whichever answers first wins. on_health_change, if set, is called with
+    the number of healthy backends whenever it changes.
+
+    Offers the same calls as OllamaClient, so either can be used.
+    """
+
+    def __init__(self, urls: List[str], hedge_after: Optional[float] = None,
+                 health_interval: float = HEALTH_CHECK_INTERVAL,
+                 on_health_change: Optional[Callable[[int], None]] = None):
+        if not urls:
+            raise ValueError("OllamaPool needs at least one backend URL")
+        self.backends = [Backend(url) for url in dict.fromkeys(u.rstrip("/") for u in urls)]
+        self.hedge_after = hedge_after
+        self.health_interval = health_interval
+        self.hedges_started = 0
+        self.hedges_won = 0
+        self.retries = 0
+        self.on_health_change = on_health_change
+        self._healthy_count = len(self.backends)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            await self.check_all()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def close(self):
+        await self.stop()
+        for backend in self.backends:
+            await backend.client.close()
+
+    # --- Health checks ---
+    async def check(self, backend: Backend):
+        try:
+            tags = await backend.client.get_json("/api/tags", timeout=HEALTH_CHECK_TIMEOUT)
+            ps = await backend.client.get_json("/api/ps", timeout=HEALTH_CHECK_TIMEOUT)
+        except OllamaError as e:
+            if backend.healthy:
+                print(f"[WARNING] Ollama backend {backend.url} is down: {e}")
+            self._mark_failed(backend, str(e))
+        except Exception as e:
+            self._mark_failed(backend, str(e))
+        else:
+            if not backend.healthy:
+                print(f"[INFO] Ollama backend {backend.url} is back")
+            backend.installed = {m.get("name") for m in tags.get("models", [])}
+            backend.loaded = {m.get("name") for m in ps.get("models", [])}
+            backend.healthy = True
+            backend.last_error = None
+            self._health_changed()
+        backend.last_check = time.time()
+
+    def _mark_failed(self, backend: Backend, error: str):
+        backend.mark_failed(error)
+        self._health_changed()
+
+    def healthy_count(self) -> int:
+        return sum(1 for b in self.backends if b.healthy)
+
+    def _health_changed(self):
+        healthy = self.healthy_count()
+        if healthy == self._healthy_count:
+            return
+        self._healthy_count = healthy
+        if self.on_health_change is not None:
+            try:
+                self.on_health_change(healthy)
+            except Exception as e:
+                print(f"[ERROR] Ollama health change handler failed: {e}")
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(b) for b in self.backends))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_all()
+            except Exception as e:
+                print(f"[ERROR] Ollama health check failed: {e}")
+
+    # --- Routing ---
+    def candidates(self, model: str, exclude: List[Backend] = ()) -> List[Backend]:
+        """Backends to try for model, best first"""
+        pool = [b for b in self.backends if b not in exclude]
+        # If everything looks down, try anyway rather than fail without asking.
+        healthy = [b for b in pool if b.healthy] or pool
+        serving = [b for b in healthy if b.can_serve(model)] or healthy
+        return sorted(serving, key=lambda b: b.cost(model))
+
+    async def get_json(self, path: str, timeout: float = 5) -> dict:
+        """GET path from every healthy backend; model lists are merged"""
+        backends = [b for b in self.backends if b.healthy] or self.backends
+        results = await asyncio.gather(*(b.client.get_json(path, timeout=timeout) for b in backends),
+                                       return_exceptions=True)
+        ok = [r for r in results if not isinstance(r, BaseException)]
+        if not ok:
+            raise results[0]
+        if all("models" in r for r in ok):
+            merged = {}
+            for r in ok:
+                for m in r["models"]:
+                    merged.setdefault(m.get("name"), m)
+            return {**ok[0], "models": list(merged.values())}
+        return ok[0]
+
+    async def load(self, model: str, keep_alive: Optional[int] = None, timeout: Optional[float] = None,
+                   options: Optional[dict] = None) -> Optional[float]:
+        """Load model on every healthy backend that has it; returns the slowest load in seconds"""
+        backends = [b for b in self.candidates(model) if b.healthy and b.can_serve(model)]
+        if not backends:
+            raise OllamaError("connect", "no healthy Ollama backend", model=model)
+        results = await asyncio.gather(*(b.client.load(model, keep_alive=keep_alive, timeout=timeout,
+                                                       options=options)
+                                         for b in backends), return_exceptions=True)
+        for backend, result in zip(backends, results):
+            if isinstance(result, OllamaError) and result.kind == "connect":
+                self._mark_failed(backend, str(result))
+            elif not isinstance(result, BaseException):
+                backend.loaded.add(model)
+        loaded = [r for r in results if not isinstance(r, BaseException)]
+        if not loaded:
+            raise results[0]
+        return max((r for r in loaded if r is not None), default=None)
+
+    async def stream_chat(self, model: str, messages: List[dict], options: Optional[dict] = None,
+                          keep_alive: Optional[str] = None, first_byte_timeout: Optional[float] = None,
+                          total_timeout: Optional[float] = None) -> AsyncIterator[Dict]:
+        """OllamaClient.stream_chat, routed (and possibly hedged) across the pool"""
+        tried: List[Backend] = []
+        attempts = []  # [backend, chunk generator, task awaiting its first chunk]
+        winner = None
+        hedged = False
+        fatal = False
+        last_error: Optional[BaseException] = None
+
+        def launch() -> bool:
+            ranked = self.candidates(model, exclude=tried)
+            if not ranked:
+                return False
+            backend = ranked[0]
+            tried.append(backend)
+            backend.outstanding += 1
+            backend.requests += 1
+            chunks = backend.client.stream_chat(model, messages, options=options, keep_alive=keep_alive,
+                                                first_byte_timeout=first_byte_timeout,
+                                                total_timeout=total_timeout)
+            attempts.append([backend, chunks, asyncio.ensure_future(chunks.__anext__())])
+            return True
+
+        try:
+            launch()
+            while winner is None:
+                for attempt in [a for a in attempts if a[2].done()]:
+                    attempts.remove(attempt)
+                    backend, _, first = attempt
+                    error = first.exception() if not first.cancelled() else asyncio.CancelledError()
+                    if error is None:
+                        winner = attempt
+                        break
+                    await self._discard(attempt)
+                    if isinstance(error, OllamaError) and error.kind == "connect":
+                        self._mark_failed(backend, str(error))
+                    # A hedge still in flight may yet succeed; only give up once none are left.
+                    fatal = fatal or not _retryable(error)
+                    last_error = error
+                if winner is not None:
+                    break
+                if not attempts:
+                    if fatal or not launch():
+                        raise last_error
+                    self.retries += 1
+                    continue
+
+                can_hedge = self.hedge_after and not hedged and not fatal and len(tried) < len(self.backends)
+                done, _ = await asyncio.wait([a[2] for a in attempts], return_when=asyncio.FIRST_COMPLETED,
+                                             timeout=self.hedge_after if can_hedge else None)
+                if not done and can_hedge:
+                    hedged = True
+                    if launch():
+                        self.hedges_started += 1
+
+            # First byte is in: drop the slower hedge and follow the winner.
+            for attempt in attempts:
+                await self._discard(attempt)
+            attempts = []
+            backend, chunks, first = winner
+            if hedged and backend is not tried[0]:
+                self.hedges_won += 1
+            backend.loaded.add(model)
+            chunk = first.result()
+            yield chunk
+            if not chunk.get("done"):
+                try:
+                    async for chunk in chunks:
+                        yield chunk
+                except OllamaError as e:
+                    if e.kind == "connect":
+                        self._mark_failed(backend, str(e))
+                    raise
+        finally:
+            for attempt in attempts:
+                await self._discard(attempt)
+            if winner is not None:
+                await self._discard(winner)
+
+    async def chat(self, model: str, messages: List[dict], options: Optional[dict] = None,
+                   keep_alive: Optional[str] = None, first_byte_timeout: Optional[float] = None,
+                   total_timeout: Optional[float] = None) -> dict:
+        return await collect_chat(self.stream_chat(model, messages, options=options, keep_alive=keep_alive,
+                                                   first_byte_timeout=first_byte_timeout,
+                                                   total_timeout=total_timeout))
+
+    async def _discard(self, attempt: list):
+        backend, chunks, first = attempt
+        if attempt[1] is None:
+            return  # already discarded
+        attempt[1] = None
+        if not first.done():
+            first.cancel()
+        try:
+            await first
+        except BaseException:
+            pass
+        try:
+            await chunks.aclose()
+        except Exception:
+            pass
+        backend.outstanding -= 1
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "backends": [
+                {
+                    "url": b.url,
+                    "healthy": b.healthy,
+                    "outstanding": b.outstanding,
+                    "requests": b.requests,
+                    "failures": b.failures,
+                    "loaded": sorted(b.loaded),
+                    "last_check_age": round(now - b.last_check) if b.last_check else None,
+                    "error": b.last_error,
+                }
+                for b in self.backends
+            ],
+            "hedge_after": self.hedge_after,
+            "hedges_started": self.hedges_started,
+            "hedges_won": self.hedges_won,
+            "retries": self.retries,
+        }
+
+
+def _retryable(error: BaseException) -> bool:
+    """Failures that happened before anything was generated, so another backend may do better"""
+    if not isinstance(error, OllamaError):
+        return False
+    return error.kind == "connect" or (error.kind == "http" and (error.status_code or 0) >= 500)
@@ -0,0 +1,178 @@
+"""Minimal stand-in for an Ollama server, for load tests and pool experiments without a GPU.
+
+Implements /api/tags, /api/ps and streaming /api/chat with canned answers.
+Timing follows a simple model of a real server:
+
+- a model that is not loaded first takes --load-time seconds to load
+- the prompt is evaluated at --prompt-eval-rate tokens/sec; like Ollama, the
+  prefix shared with the previous prompt on that model is reused from cache
+- the answer streams at --tokens-per-sec
+- at most --parallel generations run per model; the rest wait their turn
+
+--error-rate and --stall-rate inject failures (HTTP 500 before any output,
+or a request that never sends its first token).
+
+    python ollama_stub.py --port 11501 &
+    python ollama_stub.py --port 11502 --load-time 3 &
+    OLLAMA_BACKENDS=http://localhost:11501,http://localhost:11502 OLLAMA_HEDGE_AFTER=1 uvicorn main:app
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime, timezone
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_MODELS = "gemma2:2b,phi3.5:3.8b"
+CHARS_PER_TOKEN = 4
+DEFAULT_KEEP_ALIVE = 300
+
+config = {
+    "name": "stub",
+    "models": DEFAULT_MODELS.split(","),
+    "load_time": 2.0,            # seconds to load a cold model
+    "prompt_eval_rate": 400.0,   # prompt tokens/sec
+    "tokens_per_sec": 40.0,      # generated tokens/sec
+    "answer_tokens": 60,
+    "first_token_delay": 0.0,    # extra fixed latency before the first token
+    "parallel": 2,               # concurrent generations per model
+    "error_rate": 0.0,
+    "stall_rate": 0.0,
+}
+loaded = {}        # model -> expiry timestamp
+last_prompt = {}   # model -> previous prompt text (the "KV cache")
+slots = {}         # model -> asyncio.Semaphore
+
+app = FastAPI()
+
+
+def iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def keep_alive_seconds(value) -> float:
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str) and value[:-1].isdigit():
+        return int(value[:-1]) * {"s": 1, "m": 60, "h": 3600}.get(value[-1], 1)
+    return DEFAULT_KEEP_ALIVE
+
+
+def render_prompt(messages: list) -> str:
+    return "".join(f"<{m.get('role')}>{m.get('content', '')}\n" for m in messages)
+
+
+def cached_prefix_chars(model: str, prompt: str) -> int:
+    previous = last_prompt.get(model, "")
+    n = 0
+    for a, b in zip(previous, prompt):
+        if a != b:
+            break
+        n += 1
+    return n
+
+
+@app.get("/api/tags")
+async def tags():
+    return {"models": [{"name": m, "model": m} for m in config["models"]]}
+
+
+@app.get("/api/ps")
+async def ps():
+    now = time.time()
+    return {"models": [{"name": m, "model": m, "expires_at": iso(exp)} for m, exp in loaded.items() if exp > now]}
+
+
+@app.post("/api/chat")
+async def chat(request: Request):
+    body = await request.json()
+    model = body.get("model")
+    if model not in config["models"]:
+        return JSONResponse(status_code=404, content={"error": f"model '{model}' not found"})
+    if random.random() < config["error_rate"]:
+        return JSONResponse(status_code=500, content={"error": "injected failure"})
+
+    messages = body.get("messages", [])
+    options = body.get("options") or {}
+    n = min(config["answer_tokens"], options.get("num_predict") or config["answer_tokens"]) if messages else 0
+    stall = random.random() < config["stall_rate"]
+    slot = slots.setdefault(model, asyncio.Semaphore(config["parallel"]))
+
+    async def chunks():
+        start = time.perf_counter()
+        async with slot:
+            load_seconds = 0.0
+            if loaded.get(model, 0) <= time.time():
+                load_seconds = config["load_time"]
+                last_prompt.pop(model, None)
+                await asyncio.sleep(load_seconds)
+            loaded[model] = time.time() + keep_alive_seconds(body.get("keep_alive", DEFAULT_KEEP_ALIVE))
+
+            prompt = render_prompt(messages)
+            new_chars = len(prompt) - cached_prefix_chars(model, prompt)
+            last_prompt[model] = prompt
+            prompt_tokens = max(1, new_chars // CHARS_PER_TOKEN) if messages else 0
+            prompt_seconds = prompt_tokens / config["prompt_eval_rate"]
+            await asyncio.sleep(prompt_seconds + config["first_token_delay"])
+            if stall:
+                await asyncio.sleep(3600)
+
+            token_seconds = 1 / config["tokens_per_sec"]
+            for i in range(n):
+                yield json.dumps({"model": model, "message": {"role": "assistant", "content": f"{config['name']}-{i} "},
+                                  "done": False}) + "\n"
+                await asyncio.sleep(token_seconds)
+            yield json.dumps({
+                "model": model,
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "total_duration": int((time.perf_counter() - start) * 1e9),
+                "load_duration": int(load_seconds * 1e9),
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prompt_seconds * 1e9),
+                "eval_count": n,
+                "eval_duration": int(n * token_seconds * 1e9),
+            }) + "\n"
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server for offline load tests")
+    parser.add_argument("--port", type=int, default=11501)
+    parser.add_argument("--models", default=DEFAULT_MODELS, help="comma-separated model names to serve")
+    parser.add_argument("--load-time", type=float, default=config["load_time"], help="seconds to load a cold model")
+    parser.add_argument("--prompt-eval-rate", type=float, default=config["prompt_eval_rate"], help="prompt tokens/sec")
+    parser.add_argument("--tokens-per-sec", type=float, default=config["tokens_per_sec"], help="generated tokens/sec")
+    parser.add_argument("--answer-tokens", type=int, default=config["answer_tokens"])
+    parser.add_argument("--first-token-delay", type=float, default=config["first_token_delay"],
+                        help="extra seconds before the first token")
+    parser.add_argument("--parallel", type=int, default=config["parallel"], help="concurrent generations per model")
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"], help="fraction answered with HTTP 500")
+    parser.add_argument("--stall-rate", type=float, default=config["stall_rate"],
+                        help="fraction that never send a first token")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    config.update({
+        "name": f"stub{args.port}",
+        "models": [m.strip() for m in args.models.split(",") if m.strip()],
+        "load_time": args.load_time,
+        "prompt_eval_rate": args.prompt_eval_rate,
+        "tokens_per_sec": args.tokens_per_sec,
+        "answer_tokens": args.answer_tokens,
+        "first_token_delay": args.first_token_delay,
+        "parallel": args.parallel,
+        "error_rate": args.error_rate,
+        "stall_rate": args.stall_rate,
+    })
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
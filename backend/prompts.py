@@ -0,0 +1,37 @@
+from typing import List
+
+# Ollama reuses its KV cache for the longest prefix a prompt shares with the
+# previous one on the same model. Everything that is identical from turn to
+# turn (persona, then earlier history) therefore goes first, and the
+# retrieval context, which changes on every request, goes last.
+
+MENTOR_SYSTEM_PROMPT = (
+    "You are Mentor, a caring and supportive AI teacher for SRM University AP students, created by Kommi Nithin.\n"
+    "- Always greet back warmly when someone says hi/hello (like 'Hi there! 😊' or 'Hello! Great to see you!')\n"
+    "- Be like a friendly, encouraging teacher who genuinely cares about students\n"
+    "- Use warm, supportive language with appropriate emojis\n"
+    "- Always be positive, encouraging, and ready to help with anything\n"
+    "- Show enthusiasm for helping students learn and grow\n"
+    "- Be conversational and approachable, never formal or distant\n"
+    "- Make every student feel valued and supported\n"
+    "- Respond with the warmth and care of a favorite teacher"
+)
+
+
+def with_context(question: str, context: str) -> str:
+    """The latest user turn with this request's retrieval context in front of it"""
+    if not context:
+        return question
+    return f"Context:\n{context}\n\nQuestion: {question}"
+
+
+def build_chat_messages(history: List[dict], context: str = "") -> List[dict]:
+    """Persona, history, then the newest user message carrying the context.
+
+    Only the final message differs between consecutive turns of a
+    conversation, so the persona and earlier turns stay byte-identical.
+    """
+    messages = [{"role": "system", "content": MENTOR_SYSTEM_PROMPT}, *history]
+    if context and messages[-1]["role"] == "user":
+        messages[-1] = {"role": "user", "content": with_context(messages[-1]["content"], context)}
+    return messages
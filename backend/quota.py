@@ -0,0 +1,281 @@
+import time
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+FLUSH_INTERVAL = 2.0  # seconds between writes of charged tokens to the users table
+HOLD_EXPIRY = 10 * 60  # seconds before a hold that was never settled or released stops counting
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, used: int, limit: int):
+        super().__init__(f"{used} of {limit} tokens used")
+        self.used = used
+        self.limit = limit
+
+
+class Reservation:
+    """Tokens held for one request between reserve() and settle()/release()"""
+    __slots__ = ("user_id", "tokens", "expires", "done")
+
+    def __init__(self, user_id: int, tokens: int, expires: float):
+        self.user_id = user_id
+        self.tokens = tokens
+        self.expires = expires
+        self.done = False
+
+
+class _Account:
+    __slots__ = ("used", "holds", "unflushed", "reset", "dirty")
+
+    def __init__(self, used: int, reset: bool):
+        self.used = used          # charged this month, flushed or not
+        self.holds = set()        # reservations of requests still generating
+        self.unflushed = 0        # charged since the last flush
+        self.reset = reset        # the stored count is from an earlier month
+        self.dirty = reset
+
+
+def month_key(when: datetime) -> Tuple[int, int]:
+    return when.year, when.month
+
+
+def next_month_start(when: datetime) -> float:
+    if when.month == 12:
+        return datetime(when.year + 1, 1, 1).timestamp()
+    return datetime(when.year, when.month + 1, 1).timestamp()
+
+
+class QuotaAccountant:
+    """Per-user monthly token usage, kept in memory and written back in batches.
+
+    A user's row is read once (load), after which checks and charges are
+    dict lookups under a lock. reserve() checks the limit and holds the
+    request's estimate in one step, so concurrent requests cannot all pass
+    the check before any of them is charged; settle() swaps the hold for
+    what was actually used. A hold nobody settles or releases (a request
+    that died without cleaning up) stops counting after hold_expiry seconds.
+    Charges reach users.tokens_used_this_month via
+    write(), called with [(user_id, tokens, reset)] every flush_interval; it
+    returns a Future, and charges whose write fails are retried.
+
+    Month rollover is one timestamp comparison: when the month ends every
+    cached account starts again from zero, and its next write replaces the
+    stored count and tokens_reset_date instead of adding to them.
+
+    The cache assumes one server process owns the users table's counts,
+    the same assumption as the in-memory rate limits.
+    """
+
+    def __init__(self, write: Callable[[List[Tuple[int, int, bool]]], Future],
+                 flush_interval: float = FLUSH_INTERVAL, hold_expiry: float = HOLD_EXPIRY):
+        self.write = write
+        self.flush_interval = flush_interval
+        self.hold_expiry = hold_expiry
+        self._accounts: Dict[int, _Account] = {}
+        self._lock = threading.Lock()
+        self._month = month_key(datetime.now())
+        self._month_ends = next_month_start(datetime.now())
+        self._task: Optional[asyncio.Task] = None
+        self.loads = 0
+        self.refused = 0
+        self.expired_holds = 0
+        self._inflight: Optional[Future] = None
+        self._flush_lock = threading.Lock()
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.flushed_tokens = 0
+        self.rollovers = 0
+
+    def _check_month(self):
+        if time.time() < self._month_ends:
+            return
+        now = datetime.now()
+        self._month = month_key(now)
+        self._month_ends = next_month_start(now)
+        for account in self._accounts.values():
+            account.used = 0
+            account.unflushed = 0
+            account.reset = True
+            account.dirty = True
+        self.rollovers += 1
+        print(f"[INFO] Monthly token usage reset for {len(self._accounts)} cached users")
+
+    def _held(self, account: _Account) -> int:
+        """Tokens account's live holds add up to, dropping expired ones"""
+        now = time.time()
+        expired = [r for r in account.holds if r.expires <= now]
+        if expired:
+            account.holds.difference_update(expired)
+            self.expired_holds += len(expired)
+        return sum(r.tokens for r in account.holds)
+
+    def is_loaded(self, user_id: int) -> bool:
+        return user_id in self._accounts
+
+    def load(self, user_id: int, used: int, reset_date: Optional[str]):
+        """Cache a user's stored usage; ignored if the user is already cached.
+
+        A count stored in an earlier month than the current one is treated
+        as zero, and the row is reset on the next flush.
+        """
+        try:
+            stale = reset_date is None or month_key(datetime.fromisoformat(reset_date)) != self._month
+        except ValueError:
+            stale = True
+        with self._lock:
+            self._check_month()
+            if user_id not in self._accounts:
+                self._accounts[user_id] = _Account(0 if stale else (used or 0), stale)
+                self.loads += 1
+
+    def used(self, user_id: int) -> int:
+        with self._lock:
+            self._check_month()
+            account = self._accounts.get(user_id)
+            return account.used if account else 0
+
+    def reserve(self, user_id: int, tokens: int, limit: int) -> Reservation:
+        """Hold tokens for a request, or raise QuotaExceeded if the user is at the limit"""
+        with self._lock:
+            self._check_month()
+            account = self._accounts.setdefault(user_id, _Account(0, False))
+            if account.used + self._held(account) >= limit:
+                self.refused += 1
+                raise QuotaExceeded(account.used, limit)
+            reservation = Reservation(user_id, tokens, time.time() + self.hold_expiry)
+            account.holds.add(reservation)
+            return reservation
+
+    def settle(self, reservation: Reservation, tokens: int) -> int:
+        """Charge what the request actually used and return the user's total this month"""
+        with self._lock:
+            self._check_month()
+            account = self._accounts.setdefault(reservation.user_id, _Account(0, False))
+            if not reservation.done:
+                reservation.done = True
+                account.holds.discard(reservation)
+                account.used += tokens
+                account.unflushed += tokens
+                account.dirty = True
+            return account.used
+
+    def release(self, reservation: Reservation):
+        """Drop a hold without charging (generation failed); no-op once settled"""
+        with self._lock:
+            if reservation.done:
+                return
+            reservation.done = True
+            account = self._accounts.get(reservation.user_id)
+            if account:
+                account.holds.discard(reservation)
+
+    def take_pending(self) -> Tuple[int, List[Tuple[int, int, bool]]]:
+        """The rollover count and every unwritten change, marked as written"""
+        with self._lock:
+            self._check_month()
+            pending = []
+            for user_id, account in self._accounts.items():
+                if account.dirty:
+                    pending.append((user_id, account.unflushed, account.reset))
+                    account.unflushed = 0
+                    account.reset = False
+                    account.dirty = False
+            return self.rollovers, pending
+
+    def restore(self, pending: List[Tuple[int, int, bool]]):
+        """Put back charges whose write failed, to be retried on the next flush"""
+        with self._lock:
+            for user_id, tokens, reset in pending:
+                account = self._accounts.get(user_id)
+                if account:
+                    account.unflushed += tokens
+                    account.reset = account.reset or reset
+                    account.dirty = True
+
+    def flush(self) -> Optional[Future]:
+        """Hand everything charged since the last flush to write().
+
+        Returns write()'s Future, or None if there was nothing to write or
+        the previous flush is still in flight (flushes never overlap, so a
+        failed reset cannot be retried after a later charge landed). When
+        the write fails its charges are put back for the next flush.
+        """
+        with self._flush_lock:
+            if self._inflight is not None and not self._inflight.done():
+                return None
+            rollovers, pending = self.take_pending()
+            if not pending:
+                return None
+            try:
+                future = self.write(pending)
+            except Exception as e:
+                print(f"[ERROR] Writing token usage failed: {e}")
+                self.restore(pending)
+                return None
+            self._inflight = future
+        future.add_done_callback(functools.partial(self._written, pending, rollovers))
+        return future
+
+    def _written(self, pending: List[Tuple[int, int, bool]], rollovers: int, future: Future):
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or error is not None:
+            self.failed_flushes += 1
+            if rollovers != self.rollovers:
+                # The month has rolled over: its next write replaces the count anyway
+                print(f"[ERROR] Writing last month's token usage failed: {error or 'cancelled'}")
+                return
+            print(f"[ERROR] Writing token usage failed: {error or 'cancelled'}; will retry")
+            self.restore(pending)
+            return
+        self.flushes += 1
+        self.flushed_tokens += sum(tokens for _, tokens, _ in pending)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop the periodic flush and write out whatever is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # A flush still in flight finishes (or fails and is restored) first
+        await self._wait(self._inflight)
+        await self._wait(self.flush())
+
+    @staticmethod
+    async def _wait(future: Optional[Future]):
+        if future is None:
+            return
+        try:
+            await asyncio.wrap_future(future)
+        except Exception:
+            pass  # logged and restored by _written
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cached_users": len(self._accounts),
+                "reserved_tokens": sum(self._held(a) for a in self._accounts.values()),
+                "unflushed_tokens": sum(a.unflushed for a in self._accounts.values()),
+                "loads": self.loads,
+                "refused": self.refused,
+                "expired_holds": self.expired_holds,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "flushed_tokens": self.flushed_tokens,
+                "rollovers": self.rollovers,
+            }
@@ -0,0 +1,140 @@
+"""Scheduled knowledge-base refresh.
+
+Re-checks every source in links.txt and pdfs/ on an interval and publishes a
+new kb/<version>/ only when something changed. Unchanged sources keep their
+existing vectors (read back from the live index), so a refresh only embeds the
+pages and PDFs that actually moved. The API picks up the new kb/CURRENT on its
+own; no restart needed.
+
+    python refresh.py                 # run forever, every REFRESH_INTERVAL seconds
+    python refresh.py --once          # single pass, e.g. from cron
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import ingest
+
+REFRESH_INTERVAL = 6 * 60 * 60  # seconds
+REFRESH_WORKERS = 1             # stay on one core next to the live API
+REFRESH_TORCH_THREADS = 1
+
+def lower_priority():
+    """Run at the lowest CPU priority so live query embedding always wins"""
+    try:
+        if hasattr(os, "nice"):
+            os.nice(19)
+        else:
+            import psutil  # Windows has no os.nice
+            psutil.Process().nice(psutil.IDLE_PRIORITY_CLASS)
+        print("[INFO] Refresh running at idle CPU priority")
+    except Exception as e:
+        print(f"[WARNING] Could not lower CPU priority: {e}")
+
+    try:
+        import torch
+        torch.set_num_threads(REFRESH_TORCH_THREADS)
+    except Exception:
+        pass
+
+def refresh_once(workers=REFRESH_WORKERS):
+    """Rebuild changed sources; return the new version dir or None if up to date"""
+    ingest.stats.reset()
+    current = ingest.load_current()
+    if current:
+        old_index, old_docs, old_manifest = current
+        old_sources = old_manifest.get("sources", {})
+    else:
+        old_index, old_docs, old_sources = None, [], {}
+
+    plan = []  # (source name, manifest entry, reuse old vectors?, new chunks)
+    changed = []
+    for source in ingest.list_sources():
+        name = source["source"]
+        prev = old_sources.get(name) if old_index is not None else None
+
+        if prev and source["kind"] == "pdf" and prev.get("signature") == ingest.file_signature(source["location"]):
+            plan.append((name, prev, True, None))
+            continue
+
+        text, fingerprint = ingest.read_source(source)
+        if not text and not prev:
+            # Fetch failed and there is nothing to keep: try again next pass
+            # rather than publishing a version with an empty source.
+            print(f"[WARNING] Skipping {name}: no content")
+            continue
+        if prev and (fingerprint == prev["fingerprint"] or not text):
+            # Unchanged, or the fetch failed: keep serving what we had.
+            if source["kind"] == "pdf":
+                prev = dict(prev, signature=ingest.file_signature(source["location"]))
+            plan.append((name, prev, True, None))
+            continue
+
+        entry = {"kind": source["kind"], "fingerprint": fingerprint}
+        if source["kind"] == "pdf":
+            entry["signature"] = ingest.file_signature(source["location"])
+        plan.append((name, entry, False, ingest.chunk_text(text)))
+        changed.append(name)
+
+    removed = set(old_sources) - {name for name, *_ in plan}
+    if current and not changed and not removed:
+        print("[INFO] Knowledge base is up to date")
+        return None
+
+    new_texts = [chunk for _, _, reused, chunks in plan if not reused for chunk in chunks]
+    print(f"[INFO] {len(changed)} changed, {len(removed)} removed source(s); embedding {len(new_texts)} chunks")
+    new_emb = ingest.encode_texts(new_texts, workers=workers)
+
+    docs, parts, manifest = [], [], {"sources": {}}
+    cursor = 0
+    for name, entry, reused, chunks in plan:
+        if reused:
+            count = entry["count"]
+            vectors = old_index.reconstruct_n(entry["start"], count) if count else None
+            texts = [d["text"] for d in old_docs[entry["start"]:entry["start"] + count]]
+        else:
+            count = len(chunks)
+            vectors = new_emb[cursor:cursor + count]
+            cursor += count
+            texts = chunks
+        if count:
+            parts.append(np.asarray(vectors, dtype=np.float32))
+        manifest["sources"][name] = dict(entry, start=len(docs), count=count)
+        docs.extend({"text": text, "source": name} for text in texts)
+
+    if not docs:
+        print("[ERROR] No documents found to ingest.")
+        return None
+
+    version_dir = ingest.publish_index(np.vstack(parts), docs, manifest)
+    print(f"[SUCCESS] Published {version_dir} ({len(docs)} chunks)")
+    return version_dir
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Keep the knowledge base in sync with links.txt and pdfs/")
+    parser.add_argument("--interval", type=int, default=REFRESH_INTERVAL,
+                        help=f"seconds between checks (default: {REFRESH_INTERVAL})")
+    parser.add_argument("--once", action="store_true", help="run a single refresh and exit")
+    parser.add_argument("--workers", type=int, default=REFRESH_WORKERS,
+                        help=f"encoder processes (default: {REFRESH_WORKERS})")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    lower_priority()
+
+    while True:
+        started = time.time()
+        try:
+            refresh_once(workers=args.workers)
+        except Exception as e:
+            print(f"[ERROR] Refresh failed: {e}")
+            if args.once:
+                sys.exit(1)
+        if args.once:
+            return
+        time.sleep(max(0, args.interval - (time.time() - started)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Running totals behind /admin/stats, kept current by SQLite triggers.
+
+stats_counters holds row counts for users, conversations and messages;
+daily_token_usage holds one bucket per UTC day with the tokens and messages
+recorded that day. Triggers (migration 3) update both in the same
+transaction as the insert or delete, so reading them is O(1) however large
+the tables get.
+
+If the totals are ever suspected to have drifted (rows changed with
+triggers dropped, a restored backup, manual edits), rebuild them:
+
+    python rollups.py --reconcile              # chatbot.db in this directory
+    python rollups.py --reconcile --db /path/to/chatbot.db
+
+or, as an admin, POST /admin/stats/reconcile on the running server.
+"""
+import sqlite3
+import argparse
+from typing import Dict, Optional
+
+COUNTED_TABLES = ("users", "conversations", "messages")
+
+
+def read_counters(cursor: sqlite3.Cursor) -> Dict[str, int]:
+    cursor.execute('SELECT name, value FROM stats_counters')
+    counters = dict(cursor.fetchall())
+    return {table: counters.get(table, 0) for table in COUNTED_TABLES}
+
+
+def tokens_for_day(cursor: sqlite3.Cursor, day: Optional[str] = None) -> int:
+    """Tokens recorded on a UTC day (YYYY-MM-DD), today by default"""
+    if day:
+        cursor.execute('SELECT tokens FROM daily_token_usage WHERE day = ?', (day,))
+    else:
+        cursor.execute("SELECT tokens FROM daily_token_usage WHERE day = date('now')")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def rebuild(cursor: sqlite3.Cursor):
+    """Recompute every counter and daily bucket from the base tables (run inside a transaction)"""
+    cursor.execute('DELETE FROM stats_counters')
+    for table in COUNTED_TABLES:
+        cursor.execute(f'INSERT INTO stats_counters (name, value) SELECT ?, COUNT(*) FROM {table}', (table,))
+    cursor.execute('DELETE FROM daily_token_usage')
+    cursor.execute('''
+        INSERT INTO daily_token_usage (day, tokens, messages)
+        SELECT date(created_at), COALESCE(SUM(tokens_used), 0), COUNT(*)
+        FROM messages
+        GROUP BY date(created_at)
+    ''')
+
+
+def reconcile(conn) -> dict:
+    """Rebuild the rollups in one write transaction and report what had drifted"""
+    cursor = conn.cursor()
+    conn.execute('BEGIN IMMEDIATE')  # nobody may write between the recount and the swap
+    try:
+        counters_before = read_counters(cursor)
+        cursor.execute('SELECT day, tokens, messages FROM daily_token_usage')
+        days_before = {row[0]: row[1:] for row in cursor.fetchall()}
+
+        rebuild(cursor)
+
+        counters_after = read_counters(cursor)
+        cursor.execute('SELECT day, tokens, messages FROM daily_token_usage')
+        days_after = {row[0]: row[1:] for row in cursor.fetchall()}
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return {
+        "counters": counters_after,
+        "counter_drift": {t: counters_after[t] - counters_before[t]
+                          for t in COUNTED_TABLES if counters_after[t] != counters_before[t]},
+        "days": len(days_after),
+        "days_corrected": sorted(d for d in set(days_before) | set(days_after)
+                                 if days_before.get(d) != days_after.get(d)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the admin statistics rollups")
+    parser.add_argument("--db", default="chatbot.db")
+    parser.add_argument("--reconcile", action="store_true", help="recount everything from the base tables")
+    args = parser.parse_args()
+
+    from db import ConnectionPool
+    from migrations import migrate
+    pool = ConnectionPool(args.db)
+    conn = pool.connect()
+    try:
+        migrate(conn)
+        if args.reconcile:
+            result = reconcile(conn)
+            print(f"[INFO] Counters: {result['counters']}")
+            print(f"[INFO] Counter drift fixed: {result['counter_drift'] or 'none'}")
+            print(f"[INFO] Daily buckets: {result['days']}, corrected: {len(result['days_corrected'])}")
+        else:
+            cursor = conn.cursor()
+            print(f"[INFO] Counters: {read_counters(cursor)}; tokens today: {tokens_for_day(cursor)}")
+    finally:
+        conn.close()
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import json
+import asyncio
+import hashlib
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+
+class Flight:
+    """One running generation whose chunks are shared by every identical request.
+
+    Chunks are buffered for the life of the flight, so a request that joins
+    late first replays what has already been generated and then follows the
+    live stream.
+    """
+
+    def __init__(self, source: AsyncIterator[dict]):
+        self.chunks: List[dict] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.abandoned = False
+        self._updated = asyncio.Event()
+        self._task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[dict]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = RuntimeError("generation cancelled")
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[dict]:
+        self.subscribers += 1
+        position = 0
+        try:
+            while True:
+                updated = self._updated
+                while position < len(self.chunks):
+                    yield self.chunks[position]
+                    position += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await updated.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # Everyone went away; stop generating for nobody.
+                self.abandoned = True
+                self._task.cancel()
+
+
+class SingleFlight:
+    """Coalesce identical in-flight LLM requests onto one generation"""
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self.started = 0
+        self.joined = 0
+
+    @staticmethod
+    def key(model: str, messages: List[dict], options: Optional[dict] = None) -> str:
+        prompt = json.dumps({"messages": messages, "options": options or {}}, sort_keys=True, ensure_ascii=False)
+        return f"{model}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}"
+
+    def stream(self, key: str, start: Callable[[], AsyncIterator[dict]],
+               on_finish: Optional[Callable[[], None]] = None) -> AsyncIterator[dict]:
+        """Chunks for key, starting a generation with start() if none is running.
+
+        on_finish runs when the generation this call started has ended
+        (finished, failed, or abandoned by every subscriber), however many
+        requests joined it; right away if the call joined one instead.
+        """
+        flight = self._flights.get(key)
+        if flight is None or flight.done or flight.abandoned:
+            flight = Flight(start())
+            self._flights[key] = flight
+            flight._task.add_done_callback(lambda _: self._forget(key, flight))
+            if on_finish is not None:
+                flight._task.add_done_callback(lambda _: on_finish())
+            self.started += 1
+        else:
+            self.joined += 1
+            if on_finish is not None:
+                on_finish()
+        return flight.subscribe()
+
+    def running(self, key: str) -> bool:
+        """True if an identical generation is in flight and can still be joined"""
+        flight = self._flights.get(key)
+        return flight is not None and not flight.done and not flight.abandoned
+
+    def _forget(self, key: str, flight: Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "generations_started": self.started,
+            "requests_coalesced": self.joined,
+        }
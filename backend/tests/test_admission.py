@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def test_held_owner_is_refused_until_released():
+    async def run():
+        admission = AdmissionController({"m": 4})
+        admission.hold_owner("m", "7")
+        with pytest.raises(AdmissionRejected) as rejected:
+            admission.hold_owner("m", "7")
+        assert rejected.value.status_code == 429
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("m", 0, owner="7")
+
+        # The parts of the held work run side by side without an owner
+        tickets = [await admission.acquire("m", 0) for _ in range(2)]
+        assert admission.stats()["m"]["active"] == 2
+        for ticket in tickets:
+            admission.release(ticket)
+
+        admission.release_owner("7")
+        admission.release(await admission.acquire("m", 0, owner="7"))
+
+    asyncio.run(run())
+
+
+def test_resize_admits_waiters_and_retires_slots():
+    async def run():
+        admission = AdmissionController({"m": 1})
+        first = await admission.acquire("m", 0)
+        waiting = asyncio.ensure_future(admission.acquire("m", 0))
+        await asyncio.sleep(0)
+        assert admission.stats()["m"]["waiting"] == 1
+
+        admission.resize({"m": 2}, 1)  # a backend came back
+        second = await asyncio.wait_for(waiting, 1)
+        assert admission.stats()["m"]["active"] == 2
+
+        admission.resize({"m": 1}, 1)  # and went away again
+        third = asyncio.ensure_future(admission.acquire("m", 0))
+        await asyncio.sleep(0)
+        admission.release(first)
+        await asyncio.sleep(0)
+        assert not third.done()  # the freed slot was over the new limit
+        admission.release(second)
+        admission.release(await asyncio.wait_for(third, 1))
+        assert admission.stats()["m"]["active"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,115 @@
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, PROBE_TIMEOUT, CircuitBreaker, CircuitBreakers
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "time", lambda: now[0])
+    return now
+
+
+def tripped(p95_limit: float = 5.0) -> CircuitBreaker:
+    breaker = CircuitBreaker(p95_limit=p95_limit, min_requests=2, open_seconds=30)
+    breaker.record(ok=False)
+    breaker.record(ok=False)
+    return breaker
+
+
+def test_trips_on_error_rate(clock):
+    breaker = CircuitBreaker(min_requests=4, max_error_rate=0.5)
+    for ok in (True, False, False):
+        breaker.record(ok=ok, latency=1.0 if ok else None)
+    assert breaker.state == CLOSED  # too few requests to judge
+    breaker.record(ok=False)
+    assert breaker.state == OPEN
+    assert breaker.reason == "error rate 75%"
+    assert not breaker.allow()
+
+
+def test_trips_on_p95_first_token(clock):
+    breaker = CircuitBreaker(p95_limit=5.0, min_requests=3)
+    for latency in (1.0, 2.0, 9.0):
+        breaker.record(ok=True, latency=latency)
+    assert breaker.state == OPEN
+    assert breaker.reason.startswith("p95 first token")
+
+
+def test_old_outcomes_leave_the_window(clock):
+    breaker = CircuitBreaker(min_requests=2, window=60)
+    breaker.record(ok=False)
+    clock[0] += 61
+    breaker.record(ok=False)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = tripped()
+    clock[0] += 29
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # the probe is out
+
+
+def test_successful_probe_closes(clock):
+    breaker = tripped()
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record(ok=True, latency=1.0)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+@pytest.mark.parametrize("ok, latency, reason", [(False, None, "probe failed"), (True, 9.0, "probe took 9.0s")])
+def test_failed_or_slow_probe_reopens(clock, ok, latency, reason):
+    breaker = tripped()
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record(ok=ok, latency=latency)
+    assert breaker.state == OPEN
+    assert breaker.reason == reason
+    assert breaker.trips == 2
+    assert not breaker.allow()
+
+
+def test_released_probe_can_be_claimed_again(clock):
+    breaker = tripped()
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+
+def test_lost_probe_is_abandoned_after_timeout(clock):
+    breaker = tripped()
+    clock[0] += 30
+    assert breaker.allow()
+    clock[0] += PROBE_TIMEOUT - 1
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()
+
+
+def test_snapshot_reports_half_open_without_a_request(clock):
+    breakers = CircuitBreakers({"gemma2:2b": 5.0})
+    for _ in range(5):
+        breakers.record("gemma2:2b", ok=False)
+    assert breakers.stats()["gemma2:2b"]["state"] == OPEN
+    clock[0] += 30
+    assert breakers.stats()["gemma2:2b"]["state"] == HALF_OPEN
+
+
+def test_probing_names_the_request_holding_the_probe(clock):
+    breakers = CircuitBreakers({})
+    assert breakers.allow("m") and not breakers.probing("m")
+    for _ in range(5):
+        breakers.record("m", ok=False)
+    clock[0] += 30
+    assert breakers.allow("m") and breakers.probing("m")
+    breakers.release_probe("m")
+    assert breakers.allow("m")
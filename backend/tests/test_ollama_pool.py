@@ -0,0 +1,80 @@
+import asyncio
+
+from ollama_client import OllamaError, collect_chat
+from ollama_pool import OllamaPool
+
+
+class FakeClient:
+    """Stands in for one backend's OllamaClient; answers with its own name"""
+
+    def __init__(self, name: str, fail: bool = False, delay: float = 0.0):
+        self.name = name
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+
+    async def stream_chat(self, model, messages, options=None, keep_alive=None,
+                          first_byte_timeout=None, total_timeout=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise OllamaError("connect", "connection refused", model=model)
+        yield {"message": {"content": self.name}, "done": False}
+        yield {"message": {"content": ""}, "done": True}
+
+    async def close(self):
+        pass
+
+
+def make_pool(*clients: FakeClient, **kwargs) -> OllamaPool:
+    pool = OllamaPool([f"http://ollama-{c.name}:11434" for c in clients], **kwargs)
+    for backend, client in zip(pool.backends, clients):
+        backend.client = client
+        backend.loaded = {"m"}
+    return pool
+
+
+def served_by(pool: OllamaPool) -> str:
+    return asyncio.run(collect_chat(pool.stream_chat("m", [])))["message"]["content"]
+
+
+def test_routes_to_the_backend_with_fewest_outstanding():
+    pool = make_pool(FakeClient("a"), FakeClient("b"))
+    pool.backends[0].outstanding = 2
+    assert served_by(pool) == "b"
+    assert pool.backends[1].outstanding == 0
+
+
+def test_prefers_a_backend_with_the_model_loaded():
+    pool = make_pool(FakeClient("a"), FakeClient("b"))
+    pool.backends[0].loaded = set()
+    pool.backends[1].outstanding = 1
+    assert served_by(pool) == "b"
+
+
+def test_skips_unhealthy_backends():
+    pool = make_pool(FakeClient("a"), FakeClient("b"))
+    pool.backends[0].healthy = False
+    pool.backends[1].outstanding = 1
+    assert served_by(pool) == "b"
+    assert pool.backends[0].client.calls == 0
+
+
+def test_connect_error_is_retried_on_the_next_backend():
+    healthy_counts = []
+    pool = make_pool(FakeClient("a", fail=True), FakeClient("b"), on_health_change=healthy_counts.append)
+    pool.backends[1].outstanding = 1
+    assert served_by(pool) == "b"
+    assert not pool.backends[0].healthy
+    assert pool.retries == 1
+    assert healthy_counts == [1]
+    assert [b.outstanding for b in pool.backends] == [0, 1]
+
+
+def test_slow_first_byte_is_hedged_on_a_second_backend():
+    pool = make_pool(FakeClient("a", delay=0.5), FakeClient("b"), hedge_after=0.02)
+    pool.backends[1].outstanding = 1
+    assert served_by(pool) == "b"
+    assert pool.hedges_started == 1
+    assert pool.hedges_won == 1
+    assert [b.outstanding for b in pool.backends] == [0, 1]
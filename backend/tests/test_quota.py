@@ -0,0 +1,200 @@
+import time
+import asyncio
+from concurrent.futures import Future
+
+import pytest
+
+from quota import QuotaAccountant, QuotaExceeded
+
+
+class FakeWriter:
+    """Records each flush and hands back a Future the test completes"""
+
+    def __init__(self):
+        self.calls = []
+        self.futures = []
+
+    def __call__(self, pending):
+        self.calls.append(sorted(pending))
+        future = Future()
+        self.futures.append(future)
+        return future
+
+
+def make_accountant():
+    writer = FakeWriter()
+    return QuotaAccountant(writer), writer
+
+
+def roll_month(accountant):
+    accountant._month_ends = time.time() - 1
+
+
+def test_load_keeps_this_months_count_and_zeroes_an_old_one():
+    accountant, _ = make_accountant()
+    accountant.load(1, 500, time.strftime("%Y-%m-%d %H:%M:%S"))
+    accountant.load(2, 70000, "2020-01-05 00:00:00")
+    assert accountant.used(1) == 500
+    assert accountant.used(2) == 0
+
+
+def test_load_does_not_replace_a_cached_account():
+    accountant, _ = make_accountant()
+    accountant.load(1, 500, time.strftime("%Y-%m-%d %H:%M:%S"))
+    accountant.settle(accountant.reserve(1, 10, 1000), 40)
+    accountant.load(1, 500, time.strftime("%Y-%m-%d %H:%M:%S"))
+    assert accountant.used(1) == 540
+
+
+def test_reserve_holds_tokens_until_the_limit():
+    accountant, _ = make_accountant()
+    accountant.load(1, 540, time.strftime("%Y-%m-%d %H:%M:%S"))
+    held = []
+    for _ in range(10):
+        try:
+            held.append(accountant.reserve(1, 100, 1000))
+        except QuotaExceeded as e:
+            assert e.used == 540 and e.limit == 1000
+    assert len(held) == 5
+    assert accountant.stats()["reserved_tokens"] == 500
+    assert accountant.stats()["refused"] == 5
+
+
+def test_settle_charges_once_and_frees_the_hold():
+    accountant, _ = make_accountant()
+    reservation = accountant.reserve(1, 100, 1000)
+    assert accountant.settle(reservation, 40) == 40
+    assert accountant.settle(reservation, 40) == 40
+    assert accountant.stats()["reserved_tokens"] == 0
+    assert accountant.stats()["unflushed_tokens"] == 40
+
+
+def test_release_frees_the_hold_without_charging():
+    accountant, _ = make_accountant()
+    reservation = accountant.reserve(1, 100, 1000)
+    accountant.release(reservation)
+    accountant.release(reservation)
+    assert accountant.used(1) == 0
+    assert accountant.stats()["reserved_tokens"] == 0
+    # Released after settling is a no-op
+    settled = accountant.reserve(1, 100, 1000)
+    accountant.settle(settled, 30)
+    accountant.release(settled)
+    assert accountant.used(1) == 30
+
+
+def test_abandoned_hold_expires():
+    accountant = QuotaAccountant(FakeWriter(), hold_expiry=0.05)
+    abandoned = accountant.reserve(1, 1000, 1000)
+    with pytest.raises(QuotaExceeded):
+        accountant.reserve(1, 100, 1000)
+    time.sleep(0.06)
+    accountant.reserve(1, 100, 1000)
+    assert accountant.stats()["expired_holds"] == 1
+    assert accountant.stats()["reserved_tokens"] == 100
+    # A late settle still charges what was used
+    assert accountant.settle(abandoned, 40) == 40
+
+
+def test_flush_writes_deltas_and_resets():
+    accountant, writer = make_accountant()
+    accountant.load(1, 500, time.strftime("%Y-%m-%d %H:%M:%S"))
+    accountant.load(2, 70000, "2020-01-05 00:00:00")
+    accountant.settle(accountant.reserve(1, 100, 1000), 40)
+    future = accountant.flush()
+    assert writer.calls == [[(1, 40, False), (2, 0, True)]]
+    future.set_result(None)
+    assert accountant.stats()["flushes"] == 1
+    assert accountant.stats()["flushed_tokens"] == 40
+    assert accountant.flush() is None  # nothing new
+
+
+def test_flushes_never_overlap():
+    accountant, writer = make_accountant()
+    accountant.settle(accountant.reserve(1, 10, 1000), 5)
+    first = accountant.flush()
+    accountant.settle(accountant.reserve(1, 10, 1000), 7)
+    assert accountant.flush() is None
+    first.set_result(None)
+    accountant.flush()
+    assert writer.calls == [[(1, 5, False)], [(1, 7, False)]]
+
+
+def test_failed_flush_is_restored_and_retried():
+    accountant, writer = make_accountant()
+    accountant.load(2, 70000, "2020-01-05 00:00:00")
+    accountant.settle(accountant.reserve(2, 10, 1000), 5)
+    accountant.flush().set_exception(RuntimeError("disk I/O error"))
+    assert accountant.stats()["failed_flushes"] == 1
+    assert accountant.stats()["unflushed_tokens"] == 5
+
+    accountant.settle(accountant.reserve(2, 10, 1000), 3)
+    accountant.flush().set_result(None)
+    # The retry still carries the reset, with everything charged since it
+    assert writer.calls[-1] == [(2, 8, True)]
+    assert accountant.stats()["unflushed_tokens"] == 0
+
+
+def test_write_that_raises_is_restored():
+    def broken(pending):
+        raise RuntimeError("writer closed")
+
+    accountant = QuotaAccountant(broken)
+    accountant.settle(accountant.reserve(1, 10, 1000), 5)
+    assert accountant.flush() is None
+    assert accountant.stats()["unflushed_tokens"] == 5
+
+
+def test_month_rollover_starts_from_zero_and_resets_the_row():
+    accountant, writer = make_accountant()
+    accountant.load(1, 900, time.strftime("%Y-%m-%d %H:%M:%S"))
+    held = accountant.reserve(1, 50, 1000)
+    roll_month(accountant)
+    assert accountant.used(1) == 0
+    assert accountant.stats()["rollovers"] == 1
+    # A request started last month is charged to the new one
+    accountant.settle(held, 20)
+    accountant.flush().set_result(None)
+    assert writer.calls == [[(1, 20, True)]]
+    accountant.settle(accountant.reserve(1, 50, 1000), 2)
+    accountant.flush()
+    assert writer.calls[-1] == [(1, 2, False)]
+
+
+def test_failed_flush_from_last_month_is_not_restored():
+    accountant, _ = make_accountant()
+    accountant.settle(accountant.reserve(1, 10, 1000), 5)
+    future = accountant.flush()
+    roll_month(accountant)
+    accountant.used(1)
+    future.set_exception(RuntimeError("disk I/O error"))
+    assert accountant.stats()["unflushed_tokens"] == 0
+
+
+def test_stop_waits_for_the_write_in_flight_then_flushes():
+    accountant, writer = make_accountant()
+    accountant.settle(accountant.reserve(1, 10, 1000), 5)
+    first = accountant.flush()
+    accountant.settle(accountant.reserve(1, 10, 1000), 7)
+
+    async def run():
+        stopping = asyncio.ensure_future(accountant.stop())
+        await asyncio.sleep(0.01)
+        assert len(writer.calls) == 1
+        first.set_result(None)
+        while len(writer.futures) < 2:
+            await asyncio.sleep(0.01)
+        writer.futures[1].set_result(None)
+        await stopping
+
+    asyncio.run(run())
+    assert writer.calls == [[(1, 5, False)], [(1, 7, False)]]
+    assert accountant.stats()["flushed_tokens"] == 12
+
+
+@pytest.mark.parametrize("limit", [0, 1])
+def test_reserve_refuses_at_the_limit(limit):
+    accountant, _ = make_accountant()
+    accountant.load(1, limit, time.strftime("%Y-%m-%d %H:%M:%S"))
+    with pytest.raises(QuotaExceeded):
+        accountant.reserve(1, 1, limit)
@@ -0,0 +1,60 @@
+import asyncio
+
+from singleflight import SingleFlight
+
+
+async def tokens(count: int, delay: float = 0.01):
+    for i in range(count):
+        await asyncio.sleep(delay)
+        yield {"message": {"content": str(i)}, "done": i == count - 1}
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_on_finish_waits_for_joined_requests():
+    async def run():
+        flights = SingleFlight()
+        finished = []
+        starter = flights.stream("k", lambda: tokens(5), on_finish=lambda: finished.append("starter"))
+        await starter.__anext__()
+        joiner = asyncio.ensure_future(collect(flights.stream("k", lambda: tokens(5))))
+        await asyncio.sleep(0)
+        await starter.aclose()  # the starter leaves; the joiner keeps the generation going
+        await asyncio.sleep(0.02)
+        assert finished == []
+        assert len(await joiner) == 5
+        await asyncio.sleep(0)
+        assert finished == ["starter"]
+
+    asyncio.run(run())
+
+
+def test_on_finish_runs_when_everyone_leaves():
+    async def run():
+        flights = SingleFlight()
+        finished = []
+        stream = flights.stream("k", lambda: tokens(50), on_finish=lambda: finished.append(True))
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0.05)
+        assert finished == [True]
+        assert not flights.running("k")
+
+    asyncio.run(run())
+
+
+def test_on_finish_runs_at_once_when_joining():
+    async def run():
+        flights = SingleFlight()
+        first = asyncio.ensure_future(collect(flights.stream("k", lambda: tokens(3))))
+        await asyncio.sleep(0)
+        finished = []
+        joined = flights.stream("k", lambda: tokens(3), on_finish=lambda: finished.append(True))
+        assert finished == [True]
+        assert flights.stats()["requests_coalesced"] == 1
+        assert len(await collect(joined)) == 3
+        await first
+
+    asyncio.run(run())
@@ -0,0 +1,69 @@
+import sqlite3
+import threading
+
+import pytest
+
+from write_behind import WriteBehindQueue
+
+
+@pytest.fixture
+def writer(tmp_path):
+    path = str(tmp_path / "wb.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE messages (conversation_id INTEGER, content TEXT)")
+    conn.commit()
+    conn.close()
+    queue = WriteBehindQueue(lambda: sqlite3.connect(path, check_same_thread=False), flush_interval=0.01)
+    yield queue, path
+    queue.close()
+
+
+def count(path: str, conversation_id: int) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM messages WHERE conversation_id = ?",
+                            (conversation_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_wait_for_returns_once_the_keys_writes_are_committed(writer):
+    queue, path = writer
+    queue.execute("INSERT INTO messages VALUES (?, ?)", (1, "hi"), keys=[("conversation", 1)])
+    assert queue.wait_for([("conversation", 1)])
+    assert count(path, 1) == 1
+
+
+def test_wait_for_ignores_other_keys_and_reports_timeouts(writer):
+    queue, path = writer
+    release = threading.Event()
+    queue.submit(release.wait)  # holds the writer thread
+    queue.execute("INSERT INTO messages VALUES (?, ?)", (1, "hi"), keys=[("conversation", 1)])
+
+    assert queue.wait_for([("conversation", 2)], timeout=0.05)  # nothing pending for it
+    assert not queue.wait_for([("conversation", 1)], timeout=0.05)
+    assert queue.stats()["wait_timeouts"] == 1
+
+    release.set()
+    assert queue.wait_for([("conversation", 1)])
+    assert count(path, 1) == 1
+
+
+def test_wait_for_does_not_wait_for_writes_queued_later(writer):
+    queue, _ = writer
+    queue.execute("INSERT INTO messages VALUES (?, ?)", (1, "first"), keys=[("conversation", 1)])
+    assert queue.wait_for([("conversation", 1)])
+    release = threading.Event()
+    queue.submit(release.wait)
+    try:
+        # Already written; a later write for another key doesn't matter
+        queue.execute("INSERT INTO messages VALUES (?, ?)", (2, "later"), keys=[("conversation", 2)])
+        assert queue.wait_for([("conversation", 1)], timeout=0.05)
+    finally:
+        release.set()
+
+
+def test_wait_for_inside_a_job_does_not_deadlock(writer):
+    queue, _ = writer
+    queue.execute("INSERT INTO messages VALUES (?, ?)", (1, "hi"), keys=[("conversation", 1)])
+    assert queue.submit(lambda: queue.wait_for([("conversation", 1)])).result(timeout=5)
@@ -0,0 +1,224 @@
+import time
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+BATCH_SIZE = 200        # statements per transaction at most
+FLUSH_INTERVAL = 0.05   # seconds a write may wait for others to share its commit
+FLUSH_TIMEOUT = 5       # how long a reader waits for pending writes
+KEY_PRUNE_AT = 4096     # tracked keys before written-out ones are forgotten
+
+_STOP = object()
+
+
+class _Job:
+    """A callable run on the writer thread, between batches"""
+    __slots__ = ("fn", "future")
+
+    def __init__(self, fn: Callable[[], object]):
+        self.fn = fn
+        self.future: Future = Future()
+
+
+class WriteBehindQueue:
+    """Single background writer that batches SQLite writes into grouped transactions.
+
+    Statements are applied strictly in the order they were queued (so a
+    conversation's messages keep their order), grouped into one transaction
+    per batch. A batch is committed when it reaches batch_size or
+    flush_interval after its first statement. Touched conversations get
+    their updated_at bumped once per batch, inside the same transaction.
+    Statements can be tagged with keys (a conversation, a user); a reader
+    calls wait_for(keys) to wait only for those, rather than flush() for
+    the whole queue. close() drains everything on shutdown.
+
+    submit() runs any other write (a helper with its own connection) on the
+    same thread, in queue order, so the app has a single writer and writes
+    never contend for the database lock.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], touch_sql: Optional[str] = None,
+                 batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.connect = connect
+        self.touch_sql = touch_sql
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue()
+        self._cond = threading.Condition()
+        self._queued = 0
+        self._written = 0
+        self._last_queued: Dict[Hashable, int] = {}  # key -> position of its latest statement
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.batches = 0
+        self.failed = 0
+        self.jobs = 0
+        self.waits = 0
+        self.wait_timeouts = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sqlite-write-behind", daemon=True)
+                self._thread.start()
+
+    def execute(self, sql: str, params: tuple = (), touch: Optional[int] = None, keys: Iterable[Hashable] = ()):
+        """Queue one statement; touch names a conversation whose updated_at to bump,
+        keys what wait_for() callers may be waiting on"""
+        self.start()
+        with self._cond:
+            self._queued += 1
+            for key in keys:
+                self._last_queued[key] = self._queued
+            self._queue.put((sql, params, touch))
+
+    def submit(self, fn: Callable[[], object]) -> Future:
+        """Run fn on the writer thread after everything queued so far; returns its Future"""
+        self.start()
+        job = _Job(fn)
+        with self._cond:
+            self._queued += 1
+            self._queue.put(job)
+        return job.future
+
+    def pending(self) -> int:
+        with self._cond:
+            return self._queued - self._written
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT) -> bool:
+        """Wait until everything queued so far is committed; False on timeout"""
+        if threading.current_thread() is self._thread:
+            # Inside a submitted job: everything queued before it is already written.
+            return True
+        with self._cond:
+            target = self._queued
+            return self._cond.wait_for(lambda: self._written >= target, timeout=timeout)
+
+    def wait_for(self, keys: Iterable[Hashable], timeout: float = FLUSH_TIMEOUT) -> bool:
+        """Wait until the statements queued so far under any of keys are committed.
+
+        Returns at once when none are pending. Writes are applied in queue
+        order, so this is a wait for a position in the queue, not for the
+        queue to drain. False on timeout.
+        """
+        if threading.current_thread() is self._thread:
+            return True
+        with self._cond:
+            target = max((self._last_queued.get(key, 0) for key in keys), default=0)
+            if self._written >= target:
+                return True
+            self.waits += 1
+            if self._cond.wait_for(lambda: self._written >= target, timeout=timeout):
+                return True
+            self.wait_timeouts += 1
+            return False
+
+    def close(self, timeout: float = 30):
+        """Write out everything still queued and stop the writer thread"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self.pending():
+            print(f"[WARNING] Write-behind queue closed with {self.pending()} writes pending")
+
+    def _take_batch(self) -> Tuple[List[tuple], Optional[_Job], bool]:
+        """Next statements to commit together, the job that ended the batch (if any), and whether to stop"""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], None, True
+        if isinstance(first, _Job):
+            return [], first, False
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, None, True
+            if isinstance(item, _Job):
+                return batch, item, False
+            batch.append(item)
+        return batch, None, False
+
+    def _run(self):
+        conn = self.connect()
+        try:
+            stop = False
+            while not stop:
+                batch, job, stop = self._take_batch()
+                if batch:
+                    self._write(conn, batch)
+                    self._mark_written(len(batch))
+                if job is not None:
+                    self._call(job)
+                    self._mark_written(1)
+        finally:
+            conn.close()
+
+    def _mark_written(self, count: int):
+        with self._cond:
+            self._written += count
+            if len(self._last_queued) > KEY_PRUNE_AT:
+                self._last_queued = {k: n for k, n in self._last_queued.items() if n > self._written}
+            self._cond.notify_all()
+
+    def _call(self, job: _Job):
+        if not job.future.set_running_or_notify_cancel():
+            return
+        self.jobs += 1
+        try:
+            result = job.fn()
+        except BaseException as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+
+    def _write(self, conn: sqlite3.Connection, batch: List[tuple]):
+        try:
+            with conn:
+                self._apply(conn, batch)
+            self.batches += 1
+        except sqlite3.Error as e:
+            # One bad statement must not take the rest of the batch with it.
+            print(f"[WARNING] Batched write failed ({e}); retrying one by one")
+            for item in batch:
+                try:
+                    with conn:
+                        self._apply(conn, [item])
+                except sqlite3.Error as item_error:
+                    self.failed += 1
+                    print(f"[ERROR] Dropped queued write: {item_error}")
+
+    def _apply(self, conn: sqlite3.Connection, batch: List[tuple]):
+        # Consecutive runs of the same statement go through executemany; order is kept.
+        touched = []
+        run_sql, run_params = None, []
+        for sql, params, touch in batch:
+            if sql != run_sql and run_params:
+                conn.executemany(run_sql, run_params)
+                run_params = []
+            run_sql = sql
+            run_params.append(params)
+            if touch is not None and touch not in touched:
+                touched.append(touch)
+        if run_params:
+            conn.executemany(run_sql, run_params)
+        if self.touch_sql and touched:
+            conn.executemany(self.touch_sql, [(t,) for t in touched])
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "written": self._written,
+            "batches": self.batches,
+            "jobs": self.jobs,
+            "failed": self.failed,
+            "waits": self.waits,
+            "wait_timeouts": self.wait_timeouts,
+        }